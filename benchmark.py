@@ -0,0 +1,411 @@
+"""
+Throughput and latency benchmark for the middleware.
+
+Starts a number of Devices per Category on this host, lets them send messages of a
+given size at a given rate and measures delivered messages per second, end-to-end
+delivery latency, CPU time per Device and the depth of the hold-back queues. The
+results are written to a JSON file so that runs can be compared.
+
+Example:
+    python benchmark.py --devices 10 --rate 20 --payload 200 --duration 10
+
+With --transport simulated, the Devices are connected by an in-process
+SimulatedNetwork instead of multicast sockets, which allows many more Devices and
+simulating latency, jitter, loss, duplication and reordering.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import threading
+import time
+
+import destinator.const.formats as formats
+import destinator.const.groups as groups
+import destinator.const.modes as modes
+import destinator.const.orderings as orderings
+import destinator.const.overloads as overloads
+from destinator.config import Config
+from destinator.device import Device
+from destinator.util.network import Link, SimulatedNetwork
+from destinator.util.registry import GroupRegistry
+
+logger = logging.getLogger(__name__)
+
+# Interval (in seconds) in which the depth of the hold-back queues is sampled
+SAMPLE_INTERVAL = 0.1
+
+
+class BenchmarkDevice(Device):
+    """
+    A Device which sends its send time with every message and records the delivery
+    latency of every message it receives.
+    """
+
+    def __init__(self, category, config):
+        super().__init__(category, config)
+        self.latencies = []
+        self.delivered = 0
+        self.sent = 0
+
+    def handle_message(self, msg):
+        sent_at, _, _ = msg.text.partition("|")
+        self.latencies.append(time.time() - float(sent_at))
+        self.delivered += 1
+
+    def send_timed(self, payload_size):
+        text = f"{time.time():.6f}|"
+        self.send(text.ljust(payload_size, "x"))
+        self.sent += 1
+
+    def reset(self):
+        self.latencies = []
+        self.delivered = 0
+        self.sent = 0
+
+    def hold_back_depth(self):
+        return self.communicator.message_handler.hold_back_depth()
+
+    def join_time(self):
+        return self.communicator.message_handler.joined
+
+
+def create_config(args):
+    """
+    Returns
+    -------
+    Config
+        A Config subclass holding the settings given on the command line
+    """
+
+    class BenchmarkConfig(Config):
+        MODE = modes.ASYNC if args.mode == "async" else modes.THREADED
+        WIRE_FORMAT = formats.JSON if args.wire_format == "json" else formats.BINARY
+        DELTA_ENCODING = args.delta
+        BATCH_SIZE = args.batch_size
+        RECEIVE_BUFFERS = args.receive_buffers
+        TRANSPORT = create_transport(args)
+        SHARED_SOCKET = args.shared_socket
+        RETRANSMIT_BUFFER = args.retransmit_buffer
+        ORDERING = orderings.TOTAL if args.ordering == "total" else orderings.CAUSAL
+        DISCOVERY_TIMEOUT = args.discovery_timeout
+        FAILURE_TIMEOUT = args.failure_timeout
+        RECEIVE_QUEUE_SIZE = SEND_QUEUE_SIZE = DELIVER_QUEUE_SIZE = args.queue_size
+        OVERLOAD = getattr(overloads, args.overload.upper())
+
+    return BenchmarkConfig
+
+
+def create_transport(args):
+    """
+    Returns
+    -------
+    SimulatedNetwork
+        The SimulatedNetwork given on the command line, or None for multicast sockets
+    """
+    if args.transport != "simulated":
+        return None
+
+    link = Link(args.latency, args.jitter, args.loss, args.duplicate, args.reorder)
+    network = SimulatedNetwork(link, args.seed)
+    args.seed = network.seed
+
+    return network
+
+
+def create_devices(args, config):
+    """
+    Creates the Devices of every Category. The first Device of a Category is its
+    leader.
+
+    Returns
+    -------
+    list
+        The created Devices
+    """
+    devices = []
+    for name in args.categories:
+        category = GroupRegistry.register(name)
+        members = [BenchmarkDevice(category, config) for _ in range(args.devices)]
+        members[0].communicator.message_handler.leader = True
+        devices.extend(members)
+
+    return devices
+
+
+class Sampler:
+    """
+    Samples the depth of the hold-back queues of all Devices while the benchmark runs.
+    """
+
+    def __init__(self, devices):
+        self.devices = devices
+        self.samples = []
+
+    def sample(self):
+        self.samples.append(max(device.hold_back_depth() for device in self.devices))
+
+    def result(self):
+        if not self.samples:
+            return {"max": 0, "mean": 0}
+
+        return {"max": max(self.samples), "mean": sum(self.samples) / len(self.samples)}
+
+
+def joined(devices):
+    return all(device.join_time() is not None for device in devices)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Driver:
+    """
+    Sends messages from randomly chosen Devices at the configured total rate and
+    samples the hold-back queues, until the configured duration is over.
+    """
+
+    def __init__(self, args, devices):
+        self.args = args
+        self.devices = devices
+        self.sampler = Sampler(devices)
+        self.interval = 1 / (args.rate * len(devices))
+
+        self.start = self.next_send = self.next_sample = time.monotonic()
+        self.cpu_start = time.process_time()
+        self.threads = threading.active_count()
+
+    def step(self):
+        """
+        Sends the messages that are due and takes a sample if one is due.
+
+        Returns
+        -------
+        float
+            Seconds until the next step, or None once the duration is over
+        """
+        now = time.monotonic()
+        if now - self.start >= self.args.duration:
+            self.duration = now - self.start
+            return None
+
+        while self.next_send <= now:
+            random.choice(self.devices).send_timed(self.args.payload)
+            self.next_send += self.interval
+        if self.next_sample <= now:
+            self.sampler.sample()
+            self.threads = max(self.threads, threading.active_count())
+            self.next_sample += SAMPLE_INTERVAL
+
+        return max(0, min(self.next_send, self.next_sample) - time.monotonic())
+
+    def result(self):
+        """
+        Returns
+        -------
+        dict
+            The results of the benchmark run. Messages delivered while settling count
+            towards the duration in which they were sent.
+        """
+        elapsed = time.monotonic() - self.start
+        cpu = time.process_time() - self.cpu_start
+        devices = self.devices
+
+        latencies = sorted(latency for device in devices for latency in device.latencies)
+        joins = sorted(device.join_time() for device in devices
+                       if device.join_time() is not None)
+        sent = sum(device.sent for device in devices)
+        delivered = sum(device.delivered for device in devices)
+        expected = sent * (self.args.devices - 1)
+
+        return {
+            "duration": self.duration,
+            "devices": len(devices),
+            "threads": self.threads,
+            "sent": sent,
+            "delivered": delivered,
+            "delivery_ratio": delivered / expected if expected else None,
+            "sent_per_second": sent / self.duration,
+            "delivered_per_second": delivered / self.duration,
+            "latency_ms": {
+                name: None if value is None else value * 1000
+                for name, value in (("p50", percentile(latencies, 0.5)),
+                                    ("p90", percentile(latencies, 0.9)),
+                                    ("p99", percentile(latencies, 0.99)),
+                                    ("max", latencies[-1] if latencies else None))
+            },
+            "join_ms": {
+                name: None if value is None else value * 1000
+                for name, value in (("p50", percentile(joins, 0.5)),
+                                    ("max", joins[-1] if joins else None))
+            },
+            "cpu_seconds": cpu,
+            "cpu_per_device": cpu / elapsed / len(devices),
+            "hold_back_depth": self.sampler.result(),
+            "counters": self.counters(),
+            "network": self.network(),
+        }
+
+    def counters(self):
+        """
+        Returns
+        -------
+        dict
+            The counters of the metrics of all Devices, summed up
+        """
+        counters = {}
+        for device in self.devices:
+            for name, value in device.stats()["counters"].items():
+                counters[name] = counters.get(name, 0) + value
+
+        return counters
+
+    def network(self):
+        transport = self.devices[0].config.TRANSPORT
+        return transport.stats() if transport is not None else None
+
+
+def run_threaded(args, config):
+    devices = create_devices(args, config)
+    [device.start() for device in devices]
+
+    deadline = time.monotonic() + args.warmup
+    while not joined(devices) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    for device in devices:
+        device.send_timed(args.payload)
+    time.sleep(args.settle)
+    [device.reset() for device in devices]
+
+    driver = Driver(args, devices)
+    delay = driver.step()
+    while delay is not None:
+        time.sleep(delay)
+        delay = driver.step()
+
+    time.sleep(args.settle)
+    results = driver.result()
+
+    [device.stop() for device in devices]
+    [device.join() for device in devices]
+
+    return results
+
+
+async def run_async(args, config):
+    devices = create_devices(args, config)
+    tasks = [asyncio.create_task(device.run_async()) for device in devices]
+
+    deadline = time.monotonic() + args.warmup
+    while not joined(devices) and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    for device in devices:
+        device.send_timed(args.payload)
+    await asyncio.sleep(args.settle)
+    [device.reset() for device in devices]
+
+    driver = Driver(args, devices)
+    delay = driver.step()
+    while delay is not None:
+        await asyncio.sleep(delay)
+        delay = driver.step()
+
+    await asyncio.sleep(args.settle)
+    results = driver.result()
+
+    [device.stop() for device in devices]
+    await asyncio.gather(*tasks)
+
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", type=int, default=5,
+                        help="number of Devices per Category")
+    parser.add_argument("--categories", nargs="+", default=[groups.Temperature.NAME],
+                        help="names of the Categories to start Devices for, unknown "
+                             "ones are registered")
+    parser.add_argument("--rate", type=float, default=10,
+                        help="messages per second sent by every Device")
+    parser.add_argument("--payload", type=int, default=100,
+                        help="size of a message text in bytes")
+    parser.add_argument("--duration", type=float, default=10,
+                        help="seconds to send messages for")
+    parser.add_argument("--mode", choices=["threaded", "async"], default="threaded")
+    parser.add_argument("--wire-format", choices=["binary", "json"], default="binary")
+    parser.add_argument("--delta", action="store_true",
+                        help="send delta-encoded Vectors")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="maximum size of a batched datagram, 0 disables batching")
+    parser.add_argument("--receive-buffers", type=int, default=0,
+                        help="number of preallocated receive buffers per Listener")
+    parser.add_argument("--retransmit-buffer", type=int, default=0,
+                        help="number of own messages kept for NACKs, 0 disables NACKs")
+    parser.add_argument("--ordering", choices=["causal", "total"], default="causal",
+                        help="order in which messages are delivered")
+    parser.add_argument("--shared-socket", action="store_true",
+                        help="share one multicast socket per Category")
+    parser.add_argument("--transport", choices=["multicast", "simulated"],
+                        default="multicast")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="seconds every simulated datagram is delayed")
+    parser.add_argument("--jitter", type=float, default=0,
+                        help="maximum random delay added to every simulated datagram")
+    parser.add_argument("--loss", type=float, default=0,
+                        help="probability that a simulated datagram is lost")
+    parser.add_argument("--duplicate", type=float, default=0,
+                        help="probability that a simulated datagram is duplicated")
+    parser.add_argument("--reorder", type=float, default=0,
+                        help="probability that a simulated datagram skips the latency")
+    parser.add_argument("--seed", type=int,
+                        help="seed of the simulated network, random by default")
+    parser.add_argument("--discovery-timeout", type=float, default=1,
+                        help="seconds a Device waits for the leader to answer DISCOVERY")
+    parser.add_argument("--failure-timeout", type=float, default=0,
+                        help="seconds after which silent Devices are evicted, 0 disables")
+    parser.add_argument("--queue-size", type=int, default=0,
+                        help="capacity of the receiving, sending and delivery queues, "
+                             "0 does not limit them")
+    parser.add_argument("--overload", choices=["block", "drop_oldest", "shed"],
+                        default="block", help="what happens when a queue is full")
+    parser.add_argument("--settle", type=float, default=1,
+                        help="seconds to wait for outstanding deliveries")
+    parser.add_argument("--output", default="benchmark.json",
+                        help="file the results are written to as JSON")
+    args = parser.parse_args()
+    args.warmup = args.discovery_timeout + 0.5
+
+    return args
+
+
+def main():
+    args = parse_args()
+    config = create_config(args)
+
+    if args.mode == "async":
+        results = asyncio.run(run_async(args, config))
+    else:
+        results = run_threaded(args, config)
+
+    report = {
+        "timestamp": time.time(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "settings": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
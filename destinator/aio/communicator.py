@@ -0,0 +1,50 @@
+import asyncio
+import logging
+
+from destinator.aio.connector import AsyncConnector
+from destinator.aio.message_handler import AsyncMessageHandler
+from destinator.communicator import Communicator
+from destinator.util.overload import AsyncBoundedQueue
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncCommunicator(Communicator):
+    CONNECTOR = AsyncConnector
+    MESSAGE_HANDLER = AsyncMessageHandler
+    QUEUE = AsyncBoundedQueue
+
+    def __init__(self, device, category=None, queue_deliver=None):
+        super().__init__(device, category, queue_deliver)
+        self.task = None
+
+    async def start(self):
+        """
+        Registers the socket of the AsyncConnector with the running event loop.
+        Schedules the AsyncMessageHandler, which starts the discovery procedure,
+        handles incoming messages and delivers them back to the Communicator.
+        """
+        await self.connector.start()
+        self.task = asyncio.create_task(self.message_handler.run())
+
+    def stop(self):
+        """
+        Cancels the AsyncMessageHandler and closes the socket.
+        """
+        self.cancelled = True
+        self.message_handler.cancelled = True
+        if self.task is not None:
+            self.task.cancel()
+        self.connector.stop()
+
+    def deliver(self, envelope):
+        """
+        Puts a message into the Queue awaited by the Device.
+
+        Parameters
+        ----------
+        envelope:   Envelope
+            The message that should be delivered to the Device
+        """
+        self._count_delivery(envelope)
+        self.queue_deliver.put_nowait(envelope)
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+
+from destinator.aio.multiplexer import AsyncMultiplexer
+from destinator.aio.protocol import ConnectorProtocol
+from destinator.factories.socket_factory import SocketFactory
+from destinator.util.batcher import Batcher
+from destinator.util.fragments import Fragmenter, Reassembler
+from destinator.util.listener import MESSAGE_SIZE
+from destinator.util.overload import AsyncBoundedQueue
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncConnector:
+    """
+    Counterpart of Connector for Devices running on an asyncio event loop. Instead of
+    a sending and a listening Thread, the socket is driven by the event loop through
+    a ConnectorProtocol.
+    """
+
+    def __init__(self, communicator):
+        self.communicator = communicator
+
+        config = communicator.config
+        metrics = communicator.metrics
+        self.queue_receive = AsyncBoundedQueue(config.RECEIVE_QUEUE_SIZE,
+                                               config.OVERLOAD,
+                                               metrics.counter("queue_receive_dropped"))
+        self.transport = None
+        self.protocol = None
+        self.multiplexer = None
+
+        self.reassembler = Reassembler(config.REASSEMBLY_BUFFER,
+                                       config.REASSEMBLY_TIMEOUT)
+        self.fragmenter = Fragmenter(MESSAGE_SIZE)
+
+        self.counter_datagrams = metrics.counter("datagrams_sent")
+        self.counter_bytes = metrics.counter("bytes_sent")
+        metrics.gauge("queue_receive", self.queue_receive.qsize)
+
+        self.batcher = None
+        self.flush_handle = None
+        if config.BATCH_SIZE:
+            self.batcher = Batcher(min(config.BATCH_SIZE, MESSAGE_SIZE))
+
+    async def start(self):
+        """
+        Connects to a Multicast socket on the address and port specified in the Category
+        of the Device and registers it with the running event loop. If the Config sets
+        a TRANSPORT, the group is joined on it instead. With SHARED_SOCKET, the
+        AsyncMultiplexer of the Category receives for the Device and its socket is used.
+        """
+        category = self.communicator.category
+        config = self.communicator.config
+        protocol = ConnectorProtocol(self.queue_receive, self.reassembler,
+                                     self.communicator.metrics)
+        loop = asyncio.get_running_loop()
+
+        if config.TRANSPORT is not None:
+            self.transport = config.TRANSPORT.open(category.MCAST_ADDR,
+                                                   category.MCAST_PORT,
+                                                   self.communicator.device.name,
+                                                   protocol.datagram_received, loop)
+            return
+
+        if config.SHARED_SOCKET:
+            self.protocol = protocol
+            self.multiplexer = await AsyncMultiplexer.subscribe(protocol, category,
+                                                                config)
+            self.transport = self.multiplexer.transport
+            return
+
+        sock = SocketFactory.create_socket(category.MCAST_ADDR, category.MCAST_PORT)
+        sock.setblocking(False)
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: protocol,
+                                                                sock=sock)
+
+    def stop(self):
+        """
+        Closes the socket, leaves the TRANSPORT or unsubscribes from the
+        AsyncMultiplexer.
+        """
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+        if self.multiplexer is not None:
+            self.multiplexer.unsubscribe(self.protocol)
+        elif self.transport is not None:
+            self.transport.close()
+
+    def broadcast(self, msg):
+        """
+        Broadcasts a message on the multicast socket. The event loop buffers the
+        message if the socket is not writable right away. Messages that do not fit
+        into a datagram are sent in fragments. With batching, the message is added to
+        the current batch, which is sent once it is full or BATCH_DELAY seconds after
+        its first message.
+
+        Parameters
+        ----------
+        msg:    bytes
+            The packed message (Vector + text)
+        """
+        fragments = self.fragmenter.split(msg)
+        if self.batcher is None:
+            for fragment in fragments:
+                self._sendto(fragment)
+            return
+
+        for fragment in fragments:
+            for datagram in self.batcher.add(fragment):
+                self._sendto(datagram)
+
+        if len(self.batcher) and self.flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self.flush_handle = loop.call_later(self.communicator.config.BATCH_DELAY,
+                                                self.flush)
+
+    def flush(self):
+        """
+        Sends the current batch.
+        """
+        self.flush_handle = None
+        for datagram in self.batcher.flush():
+            self._sendto(datagram)
+
+    def _sendto(self, datagram):
+        """
+        Sends a datagram to the multicast group.
+
+        Parameters
+        ----------
+        datagram:   bytes
+            A packed message or a batch of messages
+        """
+        self.counter_datagrams.inc()
+        self.counter_bytes.inc(len(datagram))
+        self.transport.sendto(datagram, (self.communicator.category.MCAST_ADDR,
+                                         self.communicator.category.MCAST_PORT))
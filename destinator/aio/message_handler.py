@@ -0,0 +1,44 @@
+import asyncio
+import logging
+
+from destinator.message_handler import BaseMessageHandler
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncMessageHandler(BaseMessageHandler):
+    async def run(self):
+        """
+        Starts the discovery process.
+        Awaits messages from the AsyncConnector and handles them as they arrive. A
+        message whose handling fails is logged and skipped, so that the
+        MessageHandler keeps running.
+        """
+        self.start_discovery()
+
+        try:
+            while not self.cancelled:
+                msg = await self.connector.queue_receive.get()
+                try:
+                    self.receive(msg)
+                except Exception:
+                    logger.exception("Failed to handle a received message.")
+        finally:
+            self.close()
+
+    def _transmit(self, msg):
+        """
+        Broadcasts a message through the AsyncConnector.
+
+        Parameters
+        ----------
+        msg:    bytes
+            The packed message (Vector + text)
+        """
+        self.connector.broadcast(msg)
+
+    def call_later(self, delay, callback):
+        return asyncio.get_running_loop().call_later(delay, callback)
+
+    def call_soon(self, callback):
+        asyncio.get_running_loop().call_soon(callback)
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+
+from destinator.aio.protocol import ConnectorProtocol
+from destinator.factories.message_factory import MessageFactory
+from destinator.factories.socket_factory import SocketFactory
+from destinator.util.fragments import Reassembler
+from destinator.util.metrics import Metrics
+from destinator.util.multiplexer import decode
+
+logger = logging.getLogger(__name__)
+
+
+class MultiplexerProtocol(ConnectorProtocol):
+    """
+    Receives the packages of a multicast socket shared by all asynchronous Devices of
+    an event loop in the same Category. Every message is reassembled and decoded once
+    and the Envelope is handed to the ConnectorProtocols of all subscribed Devices.
+    """
+
+    def __init__(self, reassembler, group):
+        super().__init__(None, reassembler, Metrics())
+        self.group = group
+        self.subscribers = []
+
+    def put(self, msg):
+        for envelope in decode((msg,), self.group):
+            for protocol in self.subscribers:
+                protocol.put(envelope)
+
+    def _count(self, size):
+        for protocol in self.subscribers:
+            protocol._count(size)
+
+
+class AsyncMultiplexer:
+    """
+    Counterpart of Multiplexer for Devices running on an asyncio event loop.
+    """
+
+    _multiplexers = {}
+
+    def __init__(self, key, config):
+        self.key = key
+        _, addr, _ = key
+        self.protocol = MultiplexerProtocol(Reassembler(config.REASSEMBLY_BUFFER,
+                                                        config.REASSEMBLY_TIMEOUT),
+                                            MessageFactory.group_key(addr))
+        self.transport = None
+        self.opening = None
+
+    @classmethod
+    async def subscribe(cls, protocol, category, config):
+        """
+        Subscribes the ConnectorProtocol of a Device to the AsyncMultiplexer of its
+        Category on the running event loop, which is opened by its first subscriber.
+
+        Returns
+        -------
+        AsyncMultiplexer
+            The AsyncMultiplexer of the Category
+        """
+        loop = asyncio.get_running_loop()
+        key = (loop, category.MCAST_ADDR, category.MCAST_PORT)
+
+        multiplexer = cls._multiplexers.get(key)
+        if multiplexer is None:
+            multiplexer = cls._multiplexers[key] = AsyncMultiplexer(key, config)
+            multiplexer.opening = loop.create_task(multiplexer._open())
+        multiplexer.protocol.subscribers.append(protocol)
+
+        await asyncio.shield(multiplexer.opening)
+        return multiplexer
+
+    def unsubscribe(self, protocol):
+        """
+        Removes a ConnectorProtocol. The socket is closed once the AsyncMultiplexer has
+        no subscribers left.
+        """
+        subscribers = self.protocol.subscribers
+        if protocol not in subscribers:
+            return
+
+        subscribers.remove(protocol)
+        if not subscribers:
+            del self._multiplexers[self.key]
+            if self.transport is not None:
+                self.transport.close()
+            else:
+                self.opening.cancel()
+
+    async def _open(self):
+        loop, addr, port = self.key
+        sock = SocketFactory.create_socket(addr, port)
+        sock.setblocking(False)
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: self.protocol,
+                                                                sock=sock)
@@ -0,0 +1,58 @@
+import asyncio
+import logging
+
+from destinator.factories.datagram_factory import DatagramFactory
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectorProtocol(asyncio.DatagramProtocol):
+    def __init__(self, queue, reassembler, metrics):
+        super().__init__()
+        self.queue = queue
+        self.reassembler = reassembler
+
+        self.counter_datagrams = metrics.counter("datagrams_received")
+        self.counter_bytes = metrics.counter("bytes_received")
+        self.counter_invalid = metrics.counter("datagrams_invalid")
+
+    def datagram_received(self, data, addr):
+        """
+        Puts the messages of a package received on the socket into the receiving Queue.
+        Fragments are collected until their message is complete. A malformed package,
+        e.g. an empty or truncated one, is counted and dropped.
+        """
+        self._count(len(data))
+        msgs = []
+        try:
+            for msg in DatagramFactory.unpack(data):
+                if DatagramFactory.is_fragment(msg):
+                    msg = self.reassembler.add(msg)
+                    if msg is None:
+                        continue
+                msgs.append(msg)
+        except ValueError as e:
+            self.counter_invalid.inc()
+            logger.warning("Dropped malformed datagram: %s", e)
+            return
+
+        for msg in msgs:
+            self.put(msg)
+
+    def put(self, msg):
+        """
+        Hands over a received message.
+
+        Parameters
+        ----------
+        msg:    bytes
+            The complete message
+        """
+        self.queue.put_nowait(msg)
+
+    def _count(self, size):
+        self.counter_datagrams.inc()
+        self.counter_bytes.inc(size)
+
+    def error_received(self, exc):
+        logger.warning("Socket error in ConnectorProtocol: %s", exc)
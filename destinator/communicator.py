@@ -1,26 +1,53 @@
 import logging
-from queue import Queue
+import time
 
 from destinator.connector import Connector
 from destinator.message_handler import MessageHandler
+from destinator.util.overload import BoundedQueue
 
 logger = logging.getLogger(__name__)
 
 
 class Communicator:
-    def __init__(self, device):
+    CONNECTOR = Connector
+    MESSAGE_HANDLER = MessageHandler
+    QUEUE = BoundedQueue
+
+    def __init__(self, device, category=None, queue_deliver=None):
+        """
+        Parameters
+        ----------
+        device:         Device
+            The Device the Communicator belongs to
+        category:       Category
+            The Category of the group the Communicator takes part in, by default the
+            first Category of the Device
+        queue_deliver:  Queue
+            The Queue delivered messages are put into, if shared with the
+            Communicators of other groups of the Device
+        """
         super().__init__()
         self.cancelled = False
 
         self.device = device
-        self.queue_deliver = Queue()
+        self.category = category or device.category
+        self.metrics = device.group_metrics[self.category.NAME]
+
+        config = device.config
+        if queue_deliver is None:
+            queue_deliver = self.QUEUE(config.DELIVER_QUEUE_SIZE, config.OVERLOAD,
+                                       self.metrics.counter("queue_deliver_dropped"))
+        self.queue_deliver = queue_deliver
+
+        self.connector = self.CONNECTOR(self)
+        self.message_handler = self.MESSAGE_HANDLER(self, self.connector)
 
-        self.connector = Connector(self)
-        self.message_handler = MessageHandler(self, self.connector)
+        self.counter_delivered = self.metrics.counter("messages_delivered")
+        self.metrics.gauge("queue_deliver", self.queue_deliver.qsize)
 
     @property
-    def category(self):
-        return self.device.category
+    def config(self):
+        return self.device.config
 
     def start(self):
         """
@@ -31,6 +58,15 @@ class Communicator:
         self.connector.start()
         self.message_handler.start()
 
+    def stop(self):
+        """
+        Stops the Connector and the MessageHandler Threads.
+        """
+        self.cancelled = True
+        self.message_handler.cancelled = True
+        self.queue_deliver.close()
+        self.connector.stop()
+
     def send(self, text):
         """
         Forwards a text that should be sent to the MessageHandler, which then handles
@@ -43,13 +79,26 @@ class Communicator:
         """
         self.message_handler.send(text)
 
-    def deliver(self, msg):
+    def deliver(self, envelope):
         """
-        Puts a message into the Queue shared with the Device Thread.
+        Puts a message into the Queue shared with the Device Thread. With
+        overloads.BLOCK this waits for the Device Thread if the Queue is full, so the
+        MessageHandler only calls it once it released the vector_lock.
 
         Parameters
         ----------
-        msg:    str
-            The message in JSON format that should be delivered to the Device Thread
+        envelope:   Envelope
+            The message that should be delivered to the Device Thread
+        """
+        self._count_delivery(envelope)
+        self.queue_deliver.put(envelope)
+
+    def _count_delivery(self, envelope):
+        """
+        Counts a delivered message and, if timing is enabled, measures how long it
+        took from being received until being delivered, including the hold-back queue.
         """
-        self.queue_deliver.put(msg)
+        self.counter_delivered.inc()
+        if self.metrics.timing and envelope.received is not None:
+            self.metrics.histogram("hold_back_seconds").observe(
+                time.perf_counter() - envelope.received)
@@ -0,0 +1,177 @@
+import destinator.const.formats as formats
+import destinator.const.modes as modes
+import destinator.const.orderings as orderings
+import destinator.const.overloads as overloads
+
+
+class Config:
+    """
+    Settings of a Device. Like a Category, a Config is a class of constants: subclass
+    it and override the constants that should differ from the defaults.
+    """
+
+    # Whether the Device runs on its own Threads (modes.THREADED) or as coroutines on
+    # an asyncio event loop (modes.ASYNC)
+    MODE = modes.THREADED
+
+    # The format in which messages are sent. Devices read both formats, so
+    # formats.JSON lets a Device talk to Devices that only understand JSON messages.
+    WIRE_FORMAT = formats.BINARY
+
+    # Whether messages only carry the Vector entries that changed since the previous
+    # message of the Device. Every KEYFRAME_INTERVAL-th message carries the full Vector.
+    # Only used with formats.BINARY.
+    DELTA_ENCODING = False
+    KEYFRAME_INTERVAL = 16
+
+    # Maximum size (in bytes) of a datagram into which the Connector packs several
+    # queued messages, at most MESSAGE_SIZE. 0 sends every message in its own datagram.
+    # A batch is sent once it is full or BATCH_DELAY seconds after its first message.
+    BATCH_SIZE = 0
+    BATCH_DELAY = 0.001
+
+    # Messages larger than MESSAGE_SIZE are sent in fragments. Up to REASSEMBLY_BUFFER
+    # incomplete messages are kept for at most REASSEMBLY_TIMEOUT seconds.
+    REASSEMBLY_BUFFER = 64
+    REASSEMBLY_TIMEOUT = 2
+
+    # Number of preallocated buffers the Listener receives packages into. The Listener
+    # then receives all ready packages per wakeup and hands them over at once.
+    # 0 allocates a new buffer for every package.
+    RECEIVE_BUFFERS = 0
+
+    # Whether the time spent in every stage of the pipeline is measured. Counters and
+    # queue depths are always available through Device.stats().
+    METRICS = False
+    # File to which the metrics of all Devices of the process are written in the
+    # Prometheus text format every METRICS_EXPORT_INTERVAL seconds. None disables the
+    # exporter. Setting a file also enables METRICS.
+    METRICS_EXPORT_PATH = None
+    METRICS_EXPORT_INTERVAL = 10
+    # File to which a binary trace of every message the Devices of the process send,
+    # receive and deliver is written, with its Vector and the time of the event. The
+    # trace is decoded offline with python -m destinator.util.trace <file>. None
+    # disables tracing.
+    TRACE_PATH = None
+
+    # Directory of the durable logs of the messages every Device sends and delivers,
+    # one per Device and group under <LOG_PATH>/<Category name>/<Device name>. Give
+    # Devices a fixed name to reopen their logs after a restart. A reopened log is
+    # only continued if the Device joins under the same leader, since member IDs are
+    # assigned by the leader; otherwise its records are dropped. None disables the
+    # logs. A log is split into memory-mapped segments of LOG_SEGMENT_SIZE bytes, of
+    # which the last LOG_RETENTION are kept (0 keeps all). Records are synced to the
+    # disk once LOG_SYNC_COUNT are pending (0 disables it) and every
+    # LOG_SYNC_INTERVAL seconds.
+    LOG_PATH = None
+    LOG_SEGMENT_SIZE = 16 * 1024 * 1024
+    LOG_RETENTION = 0
+    LOG_SYNC_COUNT = 1024
+    LOG_SYNC_INTERVAL = 0.2
+
+    # Transport replacing the multicast sockets, e.g. a SimulatedNetwork shared by
+    # all Devices of the process. None uses a multicast socket per Device.
+    TRANSPORT = None
+
+    # Whether all Devices of the process in the same Category share one multicast
+    # socket. Every package is then received and decoded once instead of once per
+    # Device. Only used without a TRANSPORT.
+    SHARED_SOCKET = False
+
+    # Seconds a Device waits for the DISCOVERY_RESPONSE of the leader before it sends
+    # DISCOVERY again. The interval doubles with every retry.
+    DISCOVERY_RETRY = 0.05
+    # Seconds after which a Device stops waiting for the leader and joins without a
+    # snapshot of the group
+    DISCOVERY_TIMEOUT = 5
+    # Maximum number of messages a Device buffers while joining the group. They are
+    # handled once it joined.
+    DISCOVERY_BUFFER = 1024
+
+    # Seconds after which the leader evicts a Device it did not hear from, which is
+    # then removed from the Vector index of every Device. Every message is a sign of
+    # life, and Devices send a HEARTBEAT only if they did not send anything for
+    # HEARTBEAT_INTERVAL seconds. 0 disables failure detection and heartbeats.
+    FAILURE_TIMEOUT = 0
+    HEARTBEAT_INTERVAL = 1
+
+    # Number of own messages a Device keeps to retransmit them when other Devices
+    # report them missing with a NACK. 0 disables NACKs, so lost messages stall the
+    # causal delivery of later messages.
+    RETRANSMIT_BUFFER = 0
+    # Maximum total size (in bytes) of the messages kept for retransmission
+    RETRANSMIT_BUFFER_SIZE = 1024 * 1024
+    # Seconds a Device waits before it reports a missing message. The actual delay is
+    # random between NACK_DELAY and twice of it, so that the NACK of another Device
+    # for the same message can suppress it. A message is also retransmitted at most
+    # once per NACK_DELAY.
+    NACK_DELAY = 0.01
+    # Seconds a Device waits for a retransmission before reporting a message again
+    NACK_INTERVAL = 0.1
+    # Number of NACKs sent for a missing message before it is given up
+    NACK_RETRIES = 10
+
+    # Whether a Device that joins a running group fetches the messages delivered
+    # before it joined from the delivery logs of its peers, which therefore need a
+    # LOG_PATH. The missing messages are requested in chunks of CATCHUP_CHUNK from up
+    # to CATCHUP_PEERS peers in parallel and delivered in causal order before any
+    # message sent after the Device joined. At most CATCHUP_LIMIT messages are fetched
+    # per Process (0 fetches all); a Device reopening its log after a restart only
+    # fetches the messages its log is missing. The missing messages of a chunk are
+    # requested again from another peer once none of them arrived for CATCHUP_TIMEOUT
+    # seconds, and given up after CATCHUP_RETRIES requests.
+    CATCHUP = False
+    CATCHUP_LIMIT = 0
+    CATCHUP_CHUNK = 256
+    CATCHUP_PEERS = 2
+    CATCHUP_TIMEOUT = 0.1
+    CATCHUP_RETRIES = 5
+
+    # Maximum number of messages in the receiving Queue of the Connector, the sending
+    # Queue of the Connector and the Queue of delivered messages of the Device. 0 does
+    # not limit a Queue. OVERLOAD decides what happens when a Queue is full:
+    # overloads.BLOCK makes the producer wait for room, overloads.DROP_OLDEST drops
+    # the oldest message and overloads.SHED drops the oldest message of the lowest
+    # priority, so that control messages like NACK or ORDER are kept over DATA
+    # messages. Producers which must not wait drop the new message with
+    # overloads.BLOCK instead: asynchronous Devices, and the Multiplexer of
+    # SHARED_SOCKET and a TRANSPORT, which hand messages to many Devices and must not
+    # stall all of them for one. Dropped messages are counted in the queue_*_dropped
+    # counters. DELIVER_QUEUE_SIZE also limits the messages kept while catching up,
+    # where overloads.BLOCK drops the new message as well. A Device may send from
+    # handle_message() with overloads.BLOCK, since the MessageHandler never waits for
+    # a Queue while it holds the lock the sending Thread needs.
+    RECEIVE_QUEUE_SIZE = 0
+    SEND_QUEUE_SIZE = 0
+    DELIVER_QUEUE_SIZE = 0
+    OVERLOAD = overloads.BLOCK
+    # Maximum number of messages held back for causal delivery. 0 does not limit it.
+    # When it is exceeded, the oldest held back message is dropped with
+    # overloads.DROP_OLDEST and the one which would be delivered last otherwise. The
+    # next message of a sender is never dropped. Dropped messages are requested again
+    # with NACKs, so this needs NACKs and should stay well above the usual number of
+    # held back messages, since every drop costs a retransmission.
+    HOLD_BACK_SIZE = 0
+
+    # Maximum rate (in messages per second) at which a Device sends, allowing bursts of
+    # SEND_BURST messages. 0 disables the limit. Above the rate, Device.send() waits
+    # with overloads.BLOCK and drops the message with any other SEND_OVERLOAD.
+    # Waiting messages are counted in sends_throttled, dropped ones in sends_dropped.
+    SEND_RATE = 0
+    SEND_BURST = 10
+    SEND_OVERLOAD = overloads.BLOCK
+
+    # Minimum number of held back messages which, when woken up at once, are checked
+    # for causal delivery in a single vectorized pass instead of one by one. Pays off
+    # for large groups. Only used if NumPy is installed; 0 disables it.
+    HOLD_BACK_SCAN = 32
+
+    # Order in which messages are delivered. orderings.CAUSAL delivers in causal order
+    # based on the Vectors of the messages. orderings.TOTAL delivers every message in
+    # the same order on every Device, as decided by the leader acting as sequencer;
+    # messages then only carry the counter of their sender instead of a full Vector.
+    ORDERING = orderings.CAUSAL
+    # Maximum number of messages ordered by a single ORDER message of the sequencer
+    ORDER_BATCH = 64
+    # Seconds the sequencer waits for further messages before it sends an ORDER message
+    ORDER_DELAY = 0.001
@@ -1,9 +1,16 @@
 import logging
 import threading
-from queue import Queue
+import time
+from queue import Empty
 
+from destinator.const.timeouts import POLL_TIMEOUT
 from destinator.factories.socket_factory import SocketFactory
-from destinator.util.listener import Listener
+from destinator.util.batcher import Batcher
+from destinator.util.buffer_pool import BufferPool
+from destinator.util.fragments import Fragmenter, Reassembler
+from destinator.util.listener import MESSAGE_SIZE, Listener
+from destinator.util.multiplexer import Multiplexer
+from destinator.util.overload import BoundedQueue
 
 logger = logging.getLogger(__name__)
 
@@ -14,47 +21,159 @@ class Connector(threading.Thread):
         self.cancelled = False
         self.communicator = communicator
 
-        self.queue_receive = Queue()
-        self.queue_send = Queue()
+        config = communicator.config
+        metrics = communicator.metrics
+        self.queue_receive = BoundedQueue(config.RECEIVE_QUEUE_SIZE, config.OVERLOAD,
+                                          metrics.counter("queue_receive_dropped"))
+        self.queue_send = BoundedQueue(config.SEND_QUEUE_SIZE, config.OVERLOAD,
+                                       metrics.counter("queue_send_dropped"))
         self.sock = None
+        self.multiplexer = None
 
+        reassembler = Reassembler(config.REASSEMBLY_BUFFER, config.REASSEMBLY_TIMEOUT)
+        self.fragmenter = Fragmenter(MESSAGE_SIZE)
+        pool = None
+        if config.RECEIVE_BUFFERS:
+            pool = BufferPool(config.RECEIVE_BUFFERS, MESSAGE_SIZE)
+
+        self.counter_datagrams = metrics.counter("datagrams_sent")
+        self.counter_bytes = metrics.counter("bytes_sent")
+        metrics.gauge("queue_receive", self.queue_receive.qsize)
+        metrics.gauge("queue_send", self.queue_send.qsize)
+
+        self.listener = Listener(self.queue_receive, reassembler, metrics, pool)
         self._connect()
-        self.listener = Listener(self.sock, self.queue_receive)
+
+        self.batcher = None
+        if config.BATCH_SIZE:
+            self.batcher = Batcher(min(config.BATCH_SIZE, MESSAGE_SIZE))
 
     def _connect(self):
         """
         Connects to a Multicast socket on the address and port specified in the Category
-        of the Device
+        of the Device. If the Config sets a TRANSPORT, the group is joined on it instead
+        and received datagrams are handed to the Listener directly. With SHARED_SOCKET,
+        the Listener subscribes to the Multiplexer of the Category and its socket is used.
         """
-        self.sock = SocketFactory.create_socket(self.communicator.category.MCAST_ADDR,
-                                                self.communicator.category.MCAST_PORT)
+        category = self.communicator.category
+        config = self.communicator.config
+        transport = config.TRANSPORT
+        if transport is None and config.SHARED_SOCKET:
+            self.multiplexer = Multiplexer.subscribe(self.listener, category, config)
+            self.sock = self.multiplexer.sock
+        elif transport is None:
+            self.sock = SocketFactory.create_socket(category.MCAST_ADDR,
+                                                    category.MCAST_PORT)
+            self.listener.sock = self.sock
+        else:
+            self.sock = transport.open(category.MCAST_ADDR, category.MCAST_PORT,
+                                       self.communicator.device.name,
+                                       self.listener.datagram_received)
 
     def run(self):
         """
-        Starts the Listener in a new Thread.
+        Starts the Listener in a new Thread, unless a TRANSPORT or Multiplexer delivers
+        the datagrams.
         Starts sending out messages in the Sending Queue.
         """
-        self.listener.start()
+        if self.listener.sock is not None:
+            self.listener.start()
 
         while not self.cancelled:
             self.send()
 
+    def stop(self):
+        """
+        Stops the Connector and the Listener Thread.
+        """
+        self.cancelled = True
+        self.listener.cancelled = True
+        self.queue_receive.close()
+        self.queue_send.close()
+        if self.multiplexer is not None:
+            self.multiplexer.unsubscribe(self.listener)
+        elif self.communicator.config.TRANSPORT is not None:
+            self.sock.close()
+
     def send(self):
         """
-        Sends out all messages in the Sending Queue.
+        Blocks until a message is put into the Sending Queue or POLL_TIMEOUT is reached.
+        Sends out the message and all other messages waiting in the Sending Queue.
+        """
+        try:
+            msg = self.queue_send.get(timeout=POLL_TIMEOUT)
+        except Empty:
+            return
+
+        if self.batcher is not None:
+            self._send_batched(msg)
+            return
+
+        self._send_message(msg)
+        while True:
+            try:
+                msg = self.queue_send.get_nowait()
+            except Empty:
+                return
+            self._send_message(msg)
+
+    def _send_message(self, msg):
+        """
+        Broadcasts a message, in fragments if it does not fit into a single datagram.
+
+        Parameters
+        ----------
+        msg:    bytes
+            The packed message (Vector + text)
+        """
+        for datagram in self.fragmenter.split(msg):
+            self._broadcast(datagram)
+
+    def _send_batched(self, msg):
+        """
+        Packs a message and the messages following it within BATCH_DELAY seconds into
+        as few datagrams as possible. Full datagrams are sent right away.
+
+        Parameters
+        ----------
+        msg:    bytes
+            The first message of the batch
         """
-        while not self.queue_send.empty():
-            msg = self.queue_send.get()
-            self._broadcast(msg)
+        deadline = time.monotonic() + self.communicator.config.BATCH_DELAY
+
+        while True:
+            for fragment in self.fragmenter.split(msg):
+                for datagram in self.batcher.add(fragment):
+                    self._broadcast(datagram)
+
+            try:
+                msg = self.queue_send.get_nowait()
+                continue
+            except Empty:
+                pass
+
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                msg = self.queue_send.get(timeout=timeout)
+            except Empty:
+                break
+
+        for datagram in self.batcher.flush():
+            self._broadcast(datagram)
 
     def _broadcast(self, msg):
         """
-        Broadcasts a message on the multicast socket.
+        Broadcasts a message or a batch of messages on the multicast socket or
+        TRANSPORT.
 
         Parameters
         ----------
-        msg:    str
-            The message (Vector + text) in JSON format
+        msg:    bytes
+            The packed message (Vector + text) or batch
         """
-        self.sock.sendto(msg.encode(), (self.communicator.category.MCAST_ADDR,
-                                        self.communicator.category.MCAST_PORT))
+        self.counter_datagrams.inc()
+        self.counter_bytes.inc(len(msg))
+        self.sock.sendto(msg, (self.communicator.category.MCAST_ADDR,
+                               self.communicator.category.MCAST_PORT))
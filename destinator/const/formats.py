@@ -0,0 +1,2 @@
+BINARY = "BINARY"
+JSON = "JSON"
@@ -1,2 +1,8 @@
+DATA = "DATA"
 DISCOVERY = "DISCOVERY"
 DISCOVERY_RESPONSE = "DISCOVERY_RESPONSE"
+NACK = "NACK"
+ORDER = "ORDER"
+HEARTBEAT = "HEARTBEAT"
+EVICT = "EVICT"
+CATCHUP = "CATCHUP"
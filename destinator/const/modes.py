@@ -0,0 +1,2 @@
+THREADED = "THREADED"
+ASYNC = "ASYNC"
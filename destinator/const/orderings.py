@@ -0,0 +1,2 @@
+CAUSAL = "CAUSAL"
+TOTAL = "TOTAL"
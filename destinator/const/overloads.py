@@ -0,0 +1,3 @@
+BLOCK = "BLOCK"
+DROP_OLDEST = "DROP_OLDEST"
+SHED = "SHED"
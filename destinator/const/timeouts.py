@@ -0,0 +1,4 @@
+# Time (in seconds) a blocking Queue or socket call waits before the calling Thread
+# wakes up to check whether it was cancelled. Messages are handled as soon as they
+# arrive; this only bounds how long stopping a Thread may take.
+POLL_TIMEOUT = 0.5
@@ -1,20 +1,72 @@
+import asyncio
 import logging
 import threading
+import time
+from queue import Empty
 
+import destinator.const.modes as modes
+import destinator.const.overloads as overloads
+from destinator.aio.communicator import AsyncCommunicator
 from destinator.communicator import Communicator
+from destinator.config import Config
+from destinator.const.timeouts import POLL_TIMEOUT
+from destinator.util.metrics import Metrics, MetricsExporter
+from destinator.util.overload import TokenBucket
+from destinator.util.registry import resolve
+from destinator.util.trace import TraceWriter
 
 logger = logging.getLogger(__name__)
 
 
 class Device(threading.Thread):
-    """Base class for Nodes/Processes"""
+    """
+    Base class for Nodes/Processes
 
-    def __init__(self, category):
-        super().__init__()
+    With the default Config, a Device runs on its own Thread and is started with
+    start(). If the MODE of the Config is modes.ASYNC, the Device runs as a coroutine
+    on the current event loop instead and is started with run_async(). Many
+    asynchronous Devices can share a single event loop.
+
+    A Device takes part in the group of one or more Categories, given as Category
+    classes or as names registered in the GroupRegistry. Every group has its own
+    Communicator, Vector and Metrics; the messages of all groups are delivered to
+    handle_message() and tell their group by their group_id. The first Category is
+    the default one to send to.
+    """
+
+    def __init__(self, category, config=Config, name=None):
+        super().__init__(name=name)
         self.cancelled = False
 
-        self.category = category
-        self.communicator = Communicator(self)
+        self.categories = resolve(category)
+        self.category = self.categories[0]
+        self.config = config
+
+        timing = config.METRICS or config.METRICS_EXPORT_PATH is not None
+        self.group_metrics = {category.NAME: Metrics(timing, {"device": self.name,
+                                                              "category": category.NAME})
+                              for category in self.categories}
+        self.metrics = self.group_metrics[self.category.NAME]
+        self.counter_handled = self.metrics.counter("messages_handled")
+
+        self.rate_limiter = None
+        if config.SEND_RATE:
+            self.rate_limiter = TokenBucket(config.SEND_RATE, config.SEND_BURST)
+            self.counter_throttled = self.metrics.counter("sends_throttled")
+            self.counter_send_dropped = self.metrics.counter("sends_dropped")
+
+        communicator_class = AsyncCommunicator if self.asynchronous else Communicator
+        self.communicator = communicator_class(self)
+        self.communicators = {self.category.NAME: self.communicator}
+        for category in self.categories[1:]:
+            self.communicators[category.NAME] = communicator_class(
+                self, category, self.communicator.queue_deliver)
+
+        self.task = None
+
+    @property
+    def asynchronous(self):
+        return self.config.MODE == modes.ASYNC
 
     def run(self):
         """
@@ -23,7 +75,12 @@ class Device(threading.Thread):
         object. The Device Thread also starts pulling messages from the Queue shared
         with the VectorTimestamp Thread
         """
-        self.communicator.start()
+        if self.asynchronous:
+            raise RuntimeError("An asynchronous Device is started with run_async()")
+
+        self._register_trace()
+        [communicator.start() for communicator in self.communicators.values()]
+        self._register_metrics()
 
         while not self.cancelled:
             self.pull()
@@ -31,15 +88,191 @@ class Device(threading.Thread):
     def pull(self):
         """
         Pulls messages from the Queue shared with the VectorTimestamp Thread.
+        Blocks until a message is available or POLL_TIMEOUT is reached.
         Forwards a message to the handle_message function if there is any message.
         """
-        if not self.communicator.queue_deliver.empty():
-            msg = self.communicator.queue_deliver.get()
+        try:
+            msg = self.communicator.queue_deliver.get(timeout=POLL_TIMEOUT)
+        except Empty:
+            return
+
+        self._handle(msg)
+        self.communicator.queue_deliver.task_done()
+
+    async def start_async(self):
+        """
+        Starts the AsyncCommunicators of an asynchronous Device on the running event
+        loop without consuming delivered messages. Use receive() to consume them.
+        """
+        self._register_trace()
+        for communicator in self.communicators.values():
+            await communicator.start()
+        self._register_metrics()
+
+    async def run_async(self):
+        """
+        Runs an asynchronous Device on the running event loop. Starts the
+        AsyncCommunicator and forwards every delivered message to the handle_message
+        function until the Device is stopped.
+        """
+        self.task = asyncio.current_task()
+        await self.start_async()
+
+        try:
+            while not self.cancelled:
+                msg = await self.receive()
+                self._handle(msg)
+        except asyncio.CancelledError:
+            if not self.cancelled:
+                raise
+
+    async def receive(self):
+        """
+        Waits until a message is delivered to an asynchronous Device.
+
+        Returns
+        -------
+        Envelope
+            The delivered message
+        """
+        msg = await self.communicator.queue_deliver.get()
+        self.communicator.queue_deliver.task_done()
+        return msg
+
+    def stop(self):
+        """
+        Stops the Device and its Communicators. Every Thread of a threaded Device
+        finishes within POLL_TIMEOUT.
+        """
+        self.cancelled = True
+        [communicator.stop() for communicator in self.communicators.values()]
+
+        if self.config.METRICS_EXPORT_PATH is not None:
+            for metrics in self.group_metrics.values():
+                MetricsExporter.unregister(self.config.METRICS_EXPORT_PATH, metrics)
+        if self.config.TRACE_PATH is not None:
+            TraceWriter.unregister(self.config.TRACE_PATH, self)
+
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    def stats(self, category=None):
+        """
+        Parameters
+        ----------
+        category:   Category
+            The Category of the group, by default the first one of the Device
+
+        Returns
+        -------
+        dict
+            A snapshot of the counters, latency histograms and queue depths of the
+            Device in the group. Histograms are only filled if METRICS is enabled in
+            the Config.
+        """
+        if category is None:
+            return self.metrics.snapshot()
+        return self.group_metrics[resolve(category)[0].NAME].snapshot()
+
+    def _register_metrics(self):
+        if self.config.METRICS_EXPORT_PATH is not None:
+            for metrics in self.group_metrics.values():
+                MetricsExporter.register(self.config.METRICS_EXPORT_PATH,
+                                         self.config.METRICS_EXPORT_INTERVAL, metrics)
+
+    def _register_trace(self):
+        if self.config.TRACE_PATH is not None:
+            tracer = TraceWriter.register(self.config.TRACE_PATH, self)
+            for communicator in self.communicators.values():
+                communicator.message_handler.tracer = tracer
+
+    def _handle(self, msg):
+        self.counter_handled.inc()
+        if not self.metrics.timing:
             self.handle_message(msg)
-            self.communicator.queue_deliver.task_done()
+            return
+
+        start = time.perf_counter()
+        self.handle_message(msg)
+        end = time.perf_counter()
+        self.metrics.histogram("device_seconds").observe(end - start)
+        if msg.received is not None:
+            self.metrics.histogram("delivery_seconds").observe(end - msg.received)
 
     def handle_message(self, msg):
-        logger.info(f"{threading.get_ident()} - Device received a message: {msg}")
+        logger.info("%s - Device received a message: %s", threading.get_ident(), msg)
+
+    def send(self, msg, category=None):
+        """
+        Sends a message to a group. Above the SEND_RATE of the Config, the calling
+        Thread waits for its turn or the message is dropped, see SEND_OVERLOAD.
+        Asynchronous Devices use send_async() instead, which does not block the event
+        loop while waiting.
+
+        Parameters
+        ----------
+        msg:        str
+            The text to send
+        category:   Category
+            The Category of the group, by default the first one of the Device
+        """
+        if self.rate_limiter is not None:
+            delay = self._throttle()
+            if delay is None:
+                return
+            if delay:
+                time.sleep(delay)
+
+        self._communicator(category).send(msg)
+
+    async def send_async(self, msg, category=None):
+        """
+        Sends a message from an asynchronous Device.
+
+        Parameters
+        ----------
+        msg:        str
+            The text to send
+        category:   Category
+            The Category of the group, by default the first one of the Device
+        """
+        if self.rate_limiter is not None:
+            delay = self._throttle()
+            if delay is None:
+                return
+            if delay:
+                await asyncio.sleep(delay)
+
+        self._communicator(category).send(msg)
+
+    def _communicator(self, category):
+        """
+        Returns
+        -------
+        Communicator
+            The Communicator of the group of the given Category, by default the one of
+            the first Category
+        """
+        if category is None:
+            return self.communicator
+        return self.communicators[resolve(category)[0].NAME]
+
+    def _throttle(self):
+        """
+        Takes a token of the rate limiter for a message to send.
+
+        Returns
+        -------
+        float
+            Seconds to wait before sending the message, or None if it is dropped
+        """
+        if self.config.SEND_OVERLOAD != overloads.BLOCK:
+            if self.rate_limiter.take():
+                return 0
+            self.counter_send_dropped.inc()
+            return None
 
-    def send(self, msg):
-        self.communicator.send(msg)
+        delay = self.rate_limiter.reserve()
+        if delay:
+            self.counter_throttled.inc()
+        return delay
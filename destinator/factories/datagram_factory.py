@@ -0,0 +1,165 @@
+import struct
+
+
+class DatagramFactory:
+    # First byte of a datagram that contains a batch of messages
+    MAGIC_BATCH = 0xDB
+    # First byte of a fragment of a message that does not fit into a datagram
+    MAGIC_FRAGMENT = 0xDF
+    VERSION = 1
+
+    # Magic, version, number of messages
+    HEADER_BATCH = struct.Struct("!BBH")
+    # Magic, version, message ID, index of the fragment, number of fragments
+    HEADER_FRAGMENT = struct.Struct("!BBQHH")
+    # Length of a message within a batch
+    LENGTH = struct.Struct("!H")
+
+    @classmethod
+    def pack_batch(cls, msgs):
+        """
+        Packs several messages into a single datagram. A single message is returned
+        unchanged.
+
+        Parameters
+        ----------
+        msgs:   list
+            The packed messages (bytes) to send in one datagram
+
+        Returns
+        -------
+        bytes
+            The datagram
+        """
+        if len(msgs) == 1:
+            return msgs[0]
+
+        parts = [cls.HEADER_BATCH.pack(cls.MAGIC_BATCH, cls.VERSION, len(msgs))]
+        for msg in msgs:
+            parts.append(cls.LENGTH.pack(len(msg)))
+            parts.append(msg)
+
+        return b"".join(parts)
+
+    @classmethod
+    def unpack(cls, datagram):
+        """
+        Splits a received datagram into the messages it contains.
+
+        Parameters
+        ----------
+        datagram:   bytes
+            The received datagram
+
+        Returns
+        -------
+        list
+            The messages (bytes) contained in the datagram
+
+        Raises
+        ------
+        ValueError
+            If the datagram is empty, or a batch is truncated or holds an empty message
+        """
+        if not datagram:
+            raise ValueError("Empty datagram")
+        if datagram[0] != cls.MAGIC_BATCH:
+            return [datagram]
+
+        if len(datagram) < cls.HEADER_BATCH.size:
+            raise ValueError("Truncated batch header")
+        _, version, count = cls.HEADER_BATCH.unpack_from(datagram)
+        if version != cls.VERSION:
+            raise ValueError(f"Unsupported batch version {version}")
+
+        msgs = []
+        offset = cls.HEADER_BATCH.size
+        for _ in range(count):
+            if offset + cls.LENGTH.size > len(datagram):
+                raise ValueError("Truncated batch")
+            length, = cls.LENGTH.unpack_from(datagram, offset)
+            offset += cls.LENGTH.size
+            if not length or offset + length > len(datagram):
+                raise ValueError(f"Invalid message length {length} in batch")
+            msgs.append(datagram[offset:offset + length])
+            offset += length
+
+        return msgs
+
+    @classmethod
+    def batch_size(cls, msgs_size, count):
+        """
+        Returns
+        -------
+        int
+            The size of a datagram holding count messages of msgs_size bytes in total
+        """
+        if count == 1:
+            return msgs_size
+
+        return cls.HEADER_BATCH.size + count * cls.LENGTH.size + msgs_size
+
+    @classmethod
+    def pack_fragments(cls, msg, msg_id, size):
+        """
+        Splits a message into fragments of at most size bytes each.
+
+        Parameters
+        ----------
+        msg:    bytes
+            The packed message
+        msg_id: int
+            An ID identifying the message among all messages of the sender
+        size:   int
+            The maximum size of a fragment
+
+        Returns
+        -------
+        list
+            The fragments (bytes) of the message
+        """
+        chunk = size - cls.HEADER_FRAGMENT.size
+        count = -(-len(msg) // chunk)
+        if count > 0xFFFF:
+            raise ValueError(f"Message of {len(msg)} bytes is too large to fragment")
+
+        return [cls.HEADER_FRAGMENT.pack(cls.MAGIC_FRAGMENT, cls.VERSION, msg_id,
+                                         number, count)
+                + msg[number * chunk:(number + 1) * chunk]
+                for number in range(count)]
+
+    @classmethod
+    def unpack_fragment(cls, fragment):
+        """
+        Parameters
+        ----------
+        fragment:   bytes
+            A received fragment
+
+        Returns
+        -------
+        int
+            The ID of the message the fragment belongs to
+        int
+            The index of the fragment
+        int
+            The number of fragments of the message
+        bytes
+            The part of the message contained in the fragment
+
+        Raises
+        ------
+        ValueError
+            If the fragment is truncated or of another version
+        """
+        if len(fragment) < cls.HEADER_FRAGMENT.size:
+            raise ValueError("Truncated fragment header")
+        _, version, msg_id, number, count = cls.HEADER_FRAGMENT.unpack_from(fragment)
+        if version != cls.VERSION:
+            raise ValueError(f"Unsupported fragment version {version}")
+
+        return msg_id, number, count, fragment[cls.HEADER_FRAGMENT.size:]
+
+    @classmethod
+    def is_fragment(cls, msg):
+        return len(msg) > 0 and msg[0] == cls.MAGIC_FRAGMENT
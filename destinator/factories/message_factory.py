@@ -1,16 +1,53 @@
 import json
+import socket
+import struct
 
+import destinator.const.formats as formats
+import destinator.const.messages as messages
+from destinator.util.clock_matrix import VECTORIZED
+from destinator.util.envelope import Envelope
 from destinator.util.vector import Vector
 
 
 class MessageFactory:
     FIELD_VECTOR = "VECTOR"
     FIELD_TEXT = "MSG"
+    FIELD_TYPE = "TYPE"
+
+    # First byte of every binary message. JSON messages always start with '{'.
+    MAGIC = 0xD5
+    VERSION = 2
+
+    # Magic, version, message type, number of Vector entries, group ID, process ID
+    HEADER = struct.Struct("!BBBH4sI")
+    # Position of the group ID in the header
+    GROUP_OFFSET = 5
+
+    TYPES = {
+        messages.DATA: 0,
+        messages.DISCOVERY: 1,
+        messages.DISCOVERY_RESPONSE: 2,
+        messages.NACK: 3,
+        messages.ORDER: 4,
+        messages.HEARTBEAT: 5,
+        messages.EVICT: 6,
+        messages.CATCHUP: 7,
+    }
+    TYPE_NAMES = {code: msg_type for msg_type, code in TYPES.items()}
+
+    # Message types which carry a text. The text of any other type is its name.
+    TEXT_TYPES = {TYPES[messages.DATA], TYPES[messages.DISCOVERY_RESPONSE],
+                  TYPES[messages.NACK], TYPES[messages.ORDER], TYPES[messages.EVICT],
+                  TYPES[messages.CATCHUP]}
+
+    # Set in the message type of messages that carry a delta Vector
+    FLAG_DELTA = 0x80
 
     @classmethod
-    def pack(cls, vector, text):
+    def pack(cls, vector, text, wire_format=formats.BINARY, msg_type=None):
         """
-        Packs a Vector object and a text into a JSON string.
+        Packs a Vector object and a text into a message. The message type is derived
+        from the text unless it is given.
 
         Parameters
         ----------
@@ -21,43 +58,261 @@ class MessageFactory:
         text:   str
             A String that will be packed together with the Vector data
 
+        wire_format: str
+            formats.BINARY for the compact binary format or formats.JSON for the JSON
+            format understood by older Devices
+
+        msg_type: str
+            The message type, e.g. messages.NACK for a text reporting missing messages
+
         Returns
         -------
-        str
+        bytes
+            The encoded message
+        """
+        if wire_format == formats.JSON:
+            return cls.pack_json(vector, text, msg_type)
+
+        return cls.pack_binary(vector, text, msg_type)
+
+    @classmethod
+    def unpack(cls, msg):
+        """
+        Decodes a message in either wire format.
+        Retrieves the Vector object of the Sender and the text that was sent with the
+        message. The Envelope does not refer to the memory of the message, so its
+        buffer can be reused afterwards.
+
+        Parameters
+        ----------
+        msg:    bytes
+            A binary or JSON message
+
+        Returns
+        -------
+        Envelope
+            The Vector object of the Sender, the message type and the text that was
+            sent together with the Vector data.
+
+        Raises
+        ------
+        ValueError
+            If the message is malformed in any way, e.g. empty, truncated or JSON
+            data without the fields of a message
+        """
+        if not msg:
+            raise ValueError("Empty message")
+
+        try:
+            if msg[0] == cls.MAGIC:
+                return cls.unpack_binary(msg)
+            return cls.unpack_json(msg)
+        except ValueError:
+            raise
+        except Exception as e:
+            # Received data is untrusted, so any failure means a malformed message
+            raise ValueError(f"Malformed message: {e!r}") from e
+
+    @classmethod
+    def is_control(cls, msg):
+        """
+        Tells from the header of a packed message, without decoding it, whether it is
+        a control message like DISCOVERY or NACK. JSON messages count as DATA.
+
+        Parameters
+        ----------
+        msg:    bytes
+            A binary or JSON message
+
+        Returns
+        -------
+        bool
+            Whether the message is a binary message of another type than DATA
+        """
+        return (len(msg) > 2 and msg[0] == cls.MAGIC
+                and msg[2] & ~cls.FLAG_DELTA != cls.TYPES[messages.DATA])
+
+    @classmethod
+    def in_group(cls, msg, group):
+        """
+        Tells from the header of a packed message, without decoding it, whether it was
+        sent to a group. JSON messages are only checked once decoded, so they count
+        as sent to every group.
+
+        Parameters
+        ----------
+        msg:    bytes
+            A binary or JSON message
+        group:  bytes
+            The group ID as packed in the header, see group_key()
+
+        Returns
+        -------
+        bool
+            Whether the message may belong to the group
+        """
+        return (not msg or msg[0] != cls.MAGIC
+                or msg[cls.GROUP_OFFSET:cls.GROUP_OFFSET + 4] == group)
+
+    @staticmethod
+    def group_key(group_id):
+        """
+        Returns
+        -------
+        bytes
+            The group ID as packed in the header of binary messages
+        """
+        return socket.inet_aton(group_id)
+
+    @classmethod
+    def pack_binary(cls, vector, text, msg_type=None):
+        """
+        Packs a Vector object and a text into the binary format:
+        a fixed header, the 32 bit process IDs and message counters of the Vector index
+        as arrays and the UTF-8 encoded text. Control messages like DISCOVERY are
+        identified by the message type in the header and carry no text, except for the
+        TEXT_TYPES. Delta Vectors are flagged with FLAG_DELTA in the message type.
+
+        Parameters
+        ----------
+        vector: Vector
+            A Vector object containing identifying information about a VectorTimestamp
+            object.
+
+        text:   str
+            A String that will be packed together with the Vector data
+
+        msg_type: str
+            The message type, derived from the text if None
+
+        Returns
+        -------
+        bytes
+            The binary message
+        """
+        if msg_type is None:
+            msg_type = cls.TYPES.get(text, cls.TYPES[messages.DATA])
+        else:
+            msg_type = cls.TYPES[msg_type]
+        payload = text.encode() if msg_type in cls.TEXT_TYPES else b""
+        if vector.delta:
+            msg_type |= cls.FLAG_DELTA
+        count = len(vector.index)
+
+        header = cls.HEADER.pack(cls.MAGIC, cls.VERSION, msg_type, count,
+                                 cls.group_key(vector.group_id), vector.process_id)
+        counters = struct.pack(f"!{count}I{count}I", *vector.index.keys(),
+                               *vector.index.values())
+
+        return header + counters + payload
+
+    @classmethod
+    def unpack_binary(cls, msg):
+        """
+        Decodes a message in the binary format. If NumPy is installed, the Vector keeps
+        a copy of its packed index, from which a ClockMatrix is built without decoding
+        it again.
+
+        Parameters
+        ----------
+        msg:    bytes
+            A binary message
+
+        Returns
+        -------
+        Envelope
+            The decoded message
+        """
+        _, version, msg_type, count, group_id, process_id = \
+            cls.HEADER.unpack_from(msg)
+        if version != cls.VERSION:
+            raise ValueError(f"Unsupported message version {version}")
+
+        offset = cls.HEADER.size
+        values = struct.unpack_from(f"!{count}I{count}I", msg, offset)
+        index = dict(zip(values[:count], values[count:]))
+        packed = bytes(msg[offset:offset + count * 8]) if VECTORIZED else None
+        offset += count * 8
+
+        delta = bool(msg_type & cls.FLAG_DELTA)
+        vector = Vector(socket.inet_ntoa(group_id), process_id, index, delta, packed)
+
+        code = msg_type & ~cls.FLAG_DELTA
+        msg_type = cls.TYPE_NAMES.get(code)
+        if msg_type is None:
+            raise ValueError(f"Unknown message type in {bytes(msg[:4])}")
+        if code in cls.TEXT_TYPES:
+            text = str(msg[offset:], "utf-8")
+        else:
+            text = msg_type
+
+        return Envelope(vector, msg_type, text)
+
+    @classmethod
+    def pack_json(cls, vector, text, msg_type=None):
+        """
+        Packs a Vector object and a text into JSON data. A message type which cannot
+        be derived from the text is added in an extra field.
+
+        Parameters
+        ----------
+        vector: Vector
+            A Vector object containing identifying information about a VectorTimestamp
+            object.
+
+        text:   str
+            A String that will be packed together with the Vector data
+
+        msg_type: str
+            The message type, derived from the text if None
+
+        Returns
+        -------
+        bytes
             JSON data of the input
         """
         data = {
-            cls.FIELD_VECTOR: vector.__dict__,
+            cls.FIELD_VECTOR: vector.to_json(),
             cls.FIELD_TEXT: text
         }
-        return json.dumps(data)
+        if msg_type is not None and msg_type != text:
+            data[cls.FIELD_TYPE] = msg_type
+        return json.dumps(data).encode()
 
     @classmethod
-    def unpack(cls, msg):
+    def unpack_json(cls, msg):
         """
-        Creates a dict from the JSON inpud.
+        Creates a dict from the JSON input.
         Retrieves JSON data about the Vector object from the Sender and the text that
         was sent with the message.
         Creates a new Vector object from the retrieved JSON data.
 
         Parameters
         ----------
-        msg:    str
+        msg:    bytes
             JSON data
 
         Returns
         -------
-        Vector
-            A Vector object containing identifying information about the Sender of the
-            JSON data input.
-        str
-            The text that was sent together with the Vector data.
+        Envelope
+            The decoded message
         """
-        data = json.loads(msg)
+        data = json.loads(bytes(msg))
+        if not isinstance(data, dict):
+            raise ValueError("JSON message is not an object")
 
         vector_json = data.get(cls.FIELD_VECTOR)
+        if not isinstance(vector_json, dict):
+            raise ValueError("JSON message has no Vector")
         vector = Vector.from_json(vector_json)
 
         text = data.get(cls.FIELD_TEXT)
+        if not isinstance(text, str):
+            raise ValueError("JSON message has no text")
+        msg_type = data.get(cls.FIELD_TYPE)
+        if msg_type is None:
+            msg_type = text if text in cls.TYPES else messages.DATA
+        elif msg_type not in cls.TYPES:
+            raise ValueError(f"Unknown message type {msg_type!r}")
 
-        return vector, text
+        return Envelope(vector, msg_type, text)
@@ -8,6 +8,12 @@ class SocketFactory:
     def create_socket(addr, port):
         """
         Creates a connection to a Multicast socket with a specified port.
+        The socket is bound to the multicast address, so that the kernel drops the
+        datagrams sent to other groups on the same port instead of handing them to
+        the socket. Where binding to a multicast address is not supported, e.g. on
+        Windows, the socket is bound to all addresses instead; the MessageHandler
+        then drops foreign datagrams by their header.
+
         Parameters
         ----------
         addr:   str
@@ -23,7 +29,10 @@ class SocketFactory:
         """
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
         sock.setsockopt(socket.SOL_SOCKET, SocketFactory.reuse_option(), 1)
-        sock.bind(('', port))
+        try:
+            sock.bind((addr, port))
+        except OSError:
+            sock.bind(('', port))
 
         membership = struct.pack("4sl", socket.inet_aton(addr), socket.INADDR_ANY)
         sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
@@ -1,6 +1,123 @@
+import logging
 from abc import ABC
 
+from destinator.util.failure import parse_ids
+from destinator.util.nack import NackTracker, parse_ranges
+
+logger = logging.getLogger(__name__)
+
 
 class BaseHandler(ABC):
+    # Name of the handler in metrics
+    NAME = None
+
     def __init__(self, message_handler):
         self.parent = message_handler
+        self.nack_tracker = None
+        # Processes evicted from the group, whose messages are dropped
+        self.evicted = set()
+
+    def held(self):
+        """
+        Returns
+        -------
+        int
+            The number of received messages waiting for their delivery
+        """
+        return 0
+
+    def create_nack_tracker(self):
+        """
+        Creates the NackTracker of the handler if NACKs are enabled in the Config. The
+        handler must implement present().
+        """
+        config = self.parent.communicator.config
+        if config.RETRANSMIT_BUFFER:
+            self.nack_tracker = NackTracker(config.NACK_DELAY, config.NACK_INTERVAL,
+                                            config.NACK_RETRIES, self.present,
+                                            self.parent.send_nack,
+                                            self.parent.call_later)
+
+    def present(self, key):
+        """
+        Returns
+        -------
+        bool
+            Whether the message of a Process with a counter was delivered or received
+        """
+        raise NotImplementedError
+
+    def nack(self, envelope):
+        """
+        Retransmits the own messages another Process reports missing. Postpones the
+        reports of this Process for the messages of other Processes it misses as well.
+
+        Parameters
+        ----------
+        envelope:   Envelope
+            The NACK message
+        """
+        if self.nack_tracker is None:
+            return
+
+        ranges = parse_ranges(envelope.text)
+        own = self.parent.vector.process_id
+        for process_id, first, last in ranges:
+            if process_id == own:
+                self.parent.retransmit(first, last)
+
+        self.nack_tracker.suppress(ranges)
+
+    def heartbeat(self, envelope):
+        """
+        Handles a HEARTBEAT message, which only shows that its sender is alive. The
+        MessageHandler records that for every message.
+        """
+
+    def evict(self, process_ids):
+        """
+        Removes Processes the leader evicted from the Vector index and stops waiting
+        for their messages. If this Process was evicted itself, e.g. because its
+        messages did not reach the leader for a while, it joins the group again under
+        a new member ID.
+
+        Parameters
+        ----------
+        process_ids:    list
+            The IDs of the evicted Processes
+        """
+        if self.parent.vector.process_id in process_ids:
+            self.parent.rejoin()
+            return
+
+        for process_id in process_ids:
+            if process_id in self.evicted:
+                continue
+
+            self.evicted.add(process_id)
+            self.parent.vector.index.pop(process_id, None)
+            self.parent.forget(process_id)
+            if self.nack_tracker is not None:
+                self.nack_tracker.forget(process_id)
+            self.remove(process_id)
+            logger.info("Process %s was evicted from the group.", process_id)
+
+    def evict_received(self, envelope):
+        """
+        Evicts the Processes listed by an EVICT message of the leader.
+        """
+        self.evict(parse_ids(envelope.text))
+
+    def remove(self, process_id):
+        """
+        Drops the state the handler keeps for an evicted Process.
+        """
+
+    def mark_missing(self, process_id, first, last):
+        """
+        Marks the messages of a known Process with counters between first and last as
+        missing. Only the latest RETRANSMIT_BUFFER messages are marked, since older
+        ones cannot be retransmitted anyway.
+        """
+        limit = self.parent.communicator.config.RETRANSMIT_BUFFER
+        self.nack_tracker.add(process_id, max(first, last - limit + 1), last)
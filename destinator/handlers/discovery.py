@@ -1,125 +1,215 @@
 import logging
 import threading
 import time
+from collections import deque
 
 import destinator.const.messages as messages
-from destinator.factories.message_factory import MessageFactory
 from destinator.handlers.base_handler import BaseHandler
+from destinator.util.membership import format_assignment, is_node_id, parse_assignment
 
 logger = logging.getLogger(__name__)
 
-# Time (in seconds) a process will wait until stopping to discover new Processes
-DISCOVERY_TIMEOUT = 5
-
 
 class Discovery(BaseHandler):
+    """
+    Joins a Process to the group. The DISCOVERY_RESPONSE of the leader assigns the new
+    Process its member ID and holds the Vector index of the leader, which is a snapshot
+    of the group including the new Process. A Process joins as soon as it receives
+    such a snapshot, and the leader joins right away. DISCOVERY is sent again with
+    doubling intervals until the leader answers, and a Process gives up waiting after
+    DISCOVERY_TIMEOUT seconds.
+
+    Messages received while joining are buffered and handled once the Process joined.
+    """
+
+    NAME = "discovery"
+
     def __init__(self, parent_handler):
         super().__init__(parent_handler)
 
         self.discovery_start = None
+        self.retry_interval = None
+        self.buffer = None
 
         self.handlers = {
             messages.DISCOVERY: self.discovery,
-            messages.DISCOVERY_RESPONSE: self.discovery_response
+            messages.DISCOVERY_RESPONSE: self.discovery_response,
+            messages.HEARTBEAT: self.heartbeat
         }
 
     def start_discovery(self):
         """
-        Creates a new Vector information containing information about the
-        VectorTimestamp object.
-
         Sends out a DISCOVERY message in order to discover other active processes in the
-        multicast group.
+        multicast group and schedules its retries and the timeout. The leader does not
+        need to discover the group and joins right away.
         """
+        self.discovery_start = time.time()
+        if self.parent.leader:
+            self.finish()
+            return
+
+        config = self.parent.communicator.config
+        self.buffer = deque(maxlen=config.DISCOVERY_BUFFER)
+        self.retry_interval = config.DISCOVERY_RETRY
 
         self.parent.send(messages.DISCOVERY, increment=False)
-        self.discovery_start = time.time()
+        self.parent.call_later(self.retry_interval, self.retry)
+        self.parent.call_later(config.DISCOVERY_TIMEOUT, self.expire)
 
-    def handle(self, msg):
+    def handle(self, envelope):
         """
-        Checks whether the DISCOVERY_TIMEOUT is reached. If yes, changes the active
-        handler in MessageHandler and passes the message back to MessageHandler.
+        Checks whether the DISCOVERY_TIMEOUT is reached. If yes, finishes discovery
+        and passes the message back to MessageHandler.
 
-        If not timed out, unpacks the vector and text from a message and passes these
-        parameters on to the preset handler for the message text.
+        If not timed out, passes the message on to the preset handler for the message
+        type.
 
         Parameters
         ----------
-        msg:    str
-            Received JSON data
+        envelope:   Envelope
+            The received message
         """
         if self.timeout():
-            self.parent.end_discover()
-            self.parent.handle(msg)
+            self.finish()
+            self.parent.handle(envelope)
             return
 
-        vector, text = MessageFactory.unpack(msg)
-        handle_function = self.handlers.get(text, self.default)
-        handle_function(vector, text)
+        handle_function = self.handlers.get(envelope.type, self.default)
+        handle_function(envelope)
 
-    def discovery(self, vector, text):
+    def finish(self):
+        """
+        Ends discovery in the MessageHandler, sends the messages sent while
+        discovering and handles the messages buffered while discovering with the new
+        active handler.
         """
-        Adds a Process ID to the Vector index if the index does not yet contain the
-        Process ID.
+        if self.parent.active_handler is not self:
+            return
+
+        vector = self.parent.vector
+        vector.index.setdefault(vector.process_id, 0)
 
-        Sends a response to a DISCOVERY message containing identifying information
-        about the VectorTimestamp object.
+        self.parent.joined = time.time() - self.discovery_start
+        self.parent.end_discover()
+        self.parent.send_pending()
+        logger.debug("Thread %s: Joined the group after %.3f seconds.",
+                     threading.get_ident(), self.parent.joined)
+
+        buffer, self.buffer = self.buffer, None
+        for envelope in buffer or ():
+            self.parent.handle(envelope)
+
+    def retry(self):
+        """
+        Sends DISCOVERY again if the leader did not answer yet and doubles the
+        interval until the next retry.
         """
-        if vector.process_id not in self.parent.vector.index:
-            self.parent.vector.index[vector.process_id] = \
-                vector.index.get(vector.process_id)
+        if self.parent.active_handler is not self:
+            return
 
-            logger.info(f"Thread {threading.get_ident()}: "
-                        f"Leader added Process: {vector.process_id}."
-                        f"New index: {self.parent.vector.index}")
+        self.parent.send(messages.DISCOVERY, increment=False)
+        self.retry_interval *= 2
+        self.parent.call_later(self.retry_interval, self.retry)
 
-        self.parent.send(messages.DISCOVERY_RESPONSE, increment=False)
+    def expire(self):
+        """
+        Finishes discovery without a snapshot of the leader once DISCOVERY_TIMEOUT is
+        reached. The Process keeps its node ID as Process ID then.
+        """
+        if self.parent.active_handler is self:
+            logger.warning("Thread %s: No DISCOVERY_RESPONSE received, joining without "
+                           "a leader.", threading.get_ident())
+            self.finish()
 
-    def discovery_response(self, vector, text):
+    def discovery(self, envelope):
         """
-        Handles a DISCOVERY_RESPONSE message. Adds any Process IDs to the own Vector
-        index and updates the message counts of the existing Process IDs.
+        Assigns a member ID to a new Process and adds it to the Vector index at
+        counter 0. A DISCOVERY message of a Process which has a member ID already asks
+        for a snapshot of the group only.
+
+        Sends a response to a DISCOVERY message containing the member ID of the
+        Process and the Vector index of the leader.
 
         Parameters
         ----------
-        vector: Vector
-            The Vector object received with the message
-        text:   str
-            The message text, should be 'DISCOVERY_RESPONSE'
+        envelope:   Envelope
+            The DISCOVERY message
+
+        Returns
+        -------
+        int
+            The member ID of the Process
         """
-        self.parent.vector.index.update(vector.index)
-        logger.info(f"Thread {threading.get_ident()}: "
-                    f"Process received DISCOVERY_RESPONSE and added Process: "
-                    f"{vector.process_id}. New index: {self.parent.vector.index}")
+        node = envelope.sender
+        member = node
+        if is_node_id(node):
+            member, assigned = self.parent.membership.assign(node)
+            if assigned:
+                self.parent.vector.index[member] = 0
+
+                logger.info("Thread %s: Leader added Process %s (node %s). "
+                            "New index: %s", threading.get_ident(), member, node,
+                            self.parent.vector.index)
+
+        self.parent.send(format_assignment(node, member, self.parent.epoch),
+                         increment=False,
+                         msg_type=messages.DISCOVERY_RESPONSE)
+        return member
+
+    def discovery_response(self, envelope):
+        """
+        Handles a DISCOVERY_RESPONSE message. Adds any Process IDs to the own Vector
+        index and updates the message counts of the existing Process IDs. Joins the
+        group under its member ID if the response answers the DISCOVERY of this
+        Process.
 
-    def default(self, vector, text):
+        Parameters
+        ----------
+        envelope:   Envelope
+            The DISCOVERY_RESPONSE message
+        """
+        node, member, epoch = parse_assignment(envelope.text)
+
+        vector = envelope.vector
+        own = self.parent.vector
+        index = own.index
+        index.update(vector.index)
+        logger.info("Thread %s: Process received DISCOVERY_RESPONSE and added "
+                    "Process: %s. New index: %s", threading.get_ident(),
+                    vector.process_id, index)
+
+        if node == self.parent.node_id and member in vector.index:
+            own.process_id = member
+            self.parent.epoch = epoch
+            self.parent.synced = True
+            self.finish()
+
+    def default(self, envelope):
         """
-        The default function to handle incoming messages. At the moment, only logs the
-        reception of the message.
+        The default function to handle incoming messages. Buffers the message until
+        the Process joined the group. The oldest messages are dropped once
+        DISCOVERY_BUFFER messages are buffered.
 
         Parameters
         ----------
-        vector: Vector
-            The Vector object received with the message
-        text:   str
-            The message text received with the message
+        envelope:   Envelope
+            The received message
         """
-        # TODO: Figure out what the default function in Discovery mode should do.
-        logger.debug(f"MessageHandler in Discovery mode received a message other than "
-                     f"DISCOVERY or DISCOVERY_RESPONSE")
+        if self.buffer is not None:
+            self.buffer.append(envelope)
 
     def timeout(self):
         """
-        Checks whether DISCOVERY_TIMEOUT is reached.
+        Checks whether DISCOVERY_TIMEOUT of the Config is reached.
 
         Returns
         -------
         bool
             Whether Discovery timed out or not
         """
-        if time.time() - self.discovery_start >= DISCOVERY_TIMEOUT:
-            logger.debug(f"Thread {threading.get_ident()}: "
-                         f"Discovery Mode timed out.")
+        timeout = self.parent.communicator.config.DISCOVERY_TIMEOUT
+        if time.time() - self.discovery_start >= timeout:
+            logger.debug("Thread %s: Discovery Mode timed out.", threading.get_ident())
             return True
 
         return False
@@ -0,0 +1,342 @@
+import logging
+
+import destinator.const.messages as messages
+from destinator.handlers.base_handler import BaseHandler
+from destinator.handlers.discovery import Discovery
+from destinator.util.failure import parse_ids
+from destinator.util.sequencer import Sequencer, parse_order
+
+logger = logging.getLogger(__name__)
+
+
+class TotalOrder(BaseHandler):
+    """
+    Delivers messages in the same total order on every Process. The leader acts as
+    sequencer: it assigns consecutive sequence numbers to the messages in the order it
+    receives them and announces them in batches with ORDER messages. Every Process
+    holds back received messages until it delivered all messages with lower sequence
+    numbers.
+
+    ORDER messages count as messages of the leader, so lost ORDER messages are
+    detected and retransmitted like any other message if NACKs are enabled. So do
+    EVICT messages, which are applied in the order the leader sent them among the
+    ORDER messages.
+    """
+
+    NAME = "total_order"
+
+    def __init__(self, parent_handler):
+        super().__init__(parent_handler)
+
+        self.discovery_handler = Discovery(parent_handler)
+
+        # Received messages by (Process ID, counter) until they are delivered
+        self.messages = {}
+        # Sequence number -> (Process ID, counter) of the ordered messages
+        self.order = {}
+        # Received ORDER and EVICT messages by the counter of the leader, which are
+        # applied in the order the leader sent them, with their decoded text
+        self.orders = {}
+        self.leader_id = None
+        # Sequence number of the next message to deliver. A Process which is not the
+        # leader starts with the first ORDER message the leader sent after the
+        # snapshot of the group this Process joined with.
+        self.next_seq = None
+
+        # Per Process, the counter up to which all messages were received and the
+        # counters received above it
+        self.received = dict(self.parent.vector.index)
+        self.received_above = {}
+
+        self.sequencer = None
+        self.flush_timer = None
+        if parent_handler.leader:
+            config = parent_handler.communicator.config
+            self.sequencer = Sequencer(config.ORDER_BATCH, self.parent.vector.index)
+            self.next_seq = self.sequencer.next_seq
+
+        self.handlers = {
+            messages.DISCOVERY: self.discovery,
+            messages.DISCOVERY_RESPONSE: self.discovery_response,
+            messages.NACK: self.nack,
+            messages.ORDER: self.order_received,
+            messages.HEARTBEAT: self.heartbeat,
+            messages.EVICT: self.order_received
+        }
+        self.create_nack_tracker()
+
+    def handle(self, envelope):
+        """
+        Handles an incoming message. DISCOVERY and DISCOVERY_RESPONSE messages update
+        the group, ORDER messages assign sequence numbers and all other messages are
+        delivered in the order of their sequence numbers.
+
+        Parameters
+        ----------
+        envelope:   Envelope
+            The received message
+        """
+        handle_function = self.handlers.get(envelope.type, self.data)
+        handle_function(envelope)
+
+    def data(self, envelope):
+        """
+        Holds back a message until it can be delivered. The leader sequences it.
+
+        Parameters
+        ----------
+        envelope:   Envelope
+            The received message
+        """
+        sender = envelope.sender
+        key = (sender, envelope.vector.index[sender])
+        if not self._receive(key):
+            return
+
+        self.messages[key] = envelope
+        if self.sequencer is not None:
+            self._sequence(key)
+        if sender == self.leader_id and self.orders:
+            self._apply_orders()
+        self._deliver_ready()
+
+    def order_received(self, envelope):
+        """
+        Stores an ORDER or EVICT message of the leader until all previous messages of
+        the leader were received, applies it and delivers the messages whose turn it
+        is. An EVICT message evicting this Process is applied right away, since this
+        Process may be missing messages it cannot recover.
+
+        Parameters
+        ----------
+        envelope:   Envelope
+            The ORDER or EVICT message
+        """
+        sender = envelope.sender
+        counter = envelope.vector.index[sender]
+        # A malformed text raises ValueError before the message counts as received
+        if envelope.type == messages.EVICT:
+            decoded = parse_ids(envelope.text)
+        else:
+            decoded = parse_order(envelope.text,
+                                  self.parent.communicator.config.ORDER_BATCH)
+        if not self._receive((sender, counter)):
+            return
+
+        if (envelope.type == messages.EVICT
+                and self.parent.vector.process_id in decoded):
+            self.parent.rejoin()
+            return
+
+        self.leader_id = sender
+        self.orders[counter] = (envelope.type, decoded)
+        self._apply_orders()
+        self._deliver_ready()
+
+    def sequence_own(self, counter):
+        """
+        Sequences a message the leader sent itself.
+
+        Parameters
+        ----------
+        counter:    int
+            The counter of the leader in the message
+        """
+        self._assign((self.parent.vector.process_id, counter))
+        self._deliver_ready()
+
+    def flush(self):
+        """
+        Announces the sequence numbers assigned since the last ORDER message.
+        """
+        self.flush_timer = None
+        text = self.sequencer.flush()
+        if text is not None:
+            self.parent.send(text, msg_type=messages.ORDER)
+
+    def discovery(self, envelope):
+        """
+        Answers a DISCOVERY message of a new Process like in discovery mode, which
+        also adds the Process to the Vector index.
+        """
+        self.discovery_handler.discovery(envelope)
+
+    def discovery_response(self, envelope):
+        """
+        Adds the Processes the leader knows about but this Process does not to the
+        Vector index. Evicted Processes are not added again, since member IDs are never
+        reused.
+
+        Parameters
+        ----------
+        envelope:   Envelope
+            The DISCOVERY_RESPONSE message
+        """
+        index = self.parent.vector.index
+        for process_id, counter in envelope.vector.index.items():
+            if process_id not in index and process_id not in self.evicted:
+                index[process_id] = counter
+                logger.info("Process %s joined the group at %s.", process_id, counter)
+
+    def evict(self, process_ids):
+        """
+        The leader announces the sequence numbers assigned so far before it evicts
+        Processes, so that every Process applies the same ORDER messages before the
+        eviction.
+        """
+        if self.sequencer is not None:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+            self.flush()
+
+        super().evict(process_ids)
+
+    def remove(self, process_id):
+        """
+        Drops the received messages of an evicted Process unless they were ordered
+        already, since the ORDER messages sent before the eviction are all applied.
+        Ordered messages of the Process which were not received are skipped.
+        """
+        self.received.pop(process_id, None)
+        self.received_above.pop(process_id, None)
+        if self.sequencer is not None:
+            self.sequencer.sequenced.pop(process_id, None)
+
+        ordered = set(self.order.values())
+        for key in [key for key in self.messages
+                    if key[0] == process_id and key not in ordered]:
+            del self.messages[key]
+
+    def held(self):
+        return len(self.messages)
+
+    def present(self, key):
+        process_id, counter = key
+        current = self.received.get(process_id)
+        if current is None or counter <= current:
+            return True
+
+        return counter in self.received_above.get(process_id, ())
+
+    def _receive(self, key):
+        """
+        Records the reception of a message and marks the preceding messages of its
+        sender as missing if they were not received.
+
+        Returns
+        -------
+        bool
+            Whether the message was received for the first time
+        """
+        process_id, counter = key
+        if process_id in self.evicted:
+            return False
+
+        current = self.received.get(process_id)
+        if current is None:
+            default = 0 if self.parent.synced else counter - 1
+            current = self.parent.vector.index.get(process_id, default)
+            self.received[process_id] = current
+        if counter <= current:
+            return False
+
+        above = self.received_above.setdefault(process_id, set())
+        if counter in above:
+            return False
+
+        if counter == current + 1:
+            current = counter
+            while current + 1 in above:
+                current += 1
+                above.remove(current)
+            self.received[process_id] = current
+        else:
+            above.add(counter)
+            if self.nack_tracker is not None:
+                self.mark_missing(process_id, current + 1, counter - 1)
+
+        return True
+
+    def _apply_orders(self):
+        """
+        Stores the sequence numbers announced by the ORDER messages up to which all
+        messages of the leader were received. Ordered messages which were not received
+        are marked missing.
+        """
+        received = self.received[self.leader_id]
+        own = self.parent.vector.process_id
+
+        for counter in sorted(counter for counter in self.orders if counter <= received):
+            msg_type, decoded = self.orders.pop(counter)
+            if msg_type == messages.EVICT:
+                self.evict(decoded)
+                if self.parent.active_handler is not self:
+                    return
+                continue
+
+            first_seq, keys = decoded
+            if self.next_seq is None:
+                self.next_seq = first_seq
+
+            for seq, key in enumerate(keys, first_seq):
+                if seq < self.next_seq:
+                    continue
+
+                self.order[seq] = key
+                process_id, last = key
+                if (self.nack_tracker is not None and process_id != own
+                        and not self.present(key)):
+                    self.mark_missing(process_id, self.received[process_id] + 1, last)
+
+    def _sequence(self, key):
+        """
+        Sequences a received message and the following messages of its Process, as
+        long as all messages before them are sequenced.
+        """
+        process_id, counter = key
+        while key in self.messages and self.sequencer.expects(process_id, counter):
+            self._assign(key)
+            counter += 1
+            key = (process_id, counter)
+
+    def _assign(self, key):
+        """
+        Assigns the next sequence number to a message. The ORDER message is sent once
+        ORDER_BATCH messages are sequenced or ORDER_DELAY seconds after the first one.
+        """
+        self.order[self.sequencer.assign(key)] = key
+
+        if len(self.sequencer) >= self.sequencer.batch_size:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+            self.flush()
+        elif self.flush_timer is None:
+            delay = self.parent.communicator.config.ORDER_DELAY
+            self.flush_timer = self.parent.call_later(delay, self.flush)
+
+    def _deliver_ready(self):
+        """
+        Delivers the messages whose sequence numbers are next, until a message is
+        missing. Own messages, messages from before this Process joined and missing
+        messages of evicted Processes are skipped.
+        """
+        index = self.parent.vector.index
+        own = self.parent.vector.process_id
+        order = self.order
+
+        while self.next_seq in order:
+            key = order[self.next_seq]
+            process_id, counter = key
+
+            if process_id != own:
+                envelope = self.messages.pop(key, None)
+                if envelope is not None:
+                    self.parent.deliver(envelope)
+                elif counter > index.get(process_id, 0) and process_id not in self.evicted:
+                    return
+
+                if counter > index.get(process_id, 0) and process_id not in self.evicted:
+                    index[process_id] = counter
+
+            del order[self.next_seq]
+            self.next_seq += 1
@@ -1,33 +1,98 @@
 import logging
-from queue import Queue
+import time
+from collections import deque
 
-import destinator.util.decorators as deco
-from destinator.factories.message_factory import MessageFactory
+import destinator.const.messages as messages
+import destinator.const.overloads as overloads
 from destinator.handlers.base_handler import BaseHandler
+from destinator.handlers.discovery import Discovery
+from destinator.util.catchup import CatchUp, parse_request
+from destinator.util.delta import DeltaDecoder
+from destinator.util.hold_back import HoldBackQueue
+from destinator.util.overload import drop, victim
 
 logger = logging.getLogger(__name__)
 
 
 class VectorTimestamp(BaseHandler):
+    NAME = "vector_timestamp"
+
     def __init__(self, parent_handler):
         super().__init__(parent_handler)
 
-        self.queue_hold_back = Queue()
+        config = parent_handler.communicator.config
+        self.queue_hold_back = HoldBackQueue(self.parent.vector.index,
+                                             config.HOLD_BACK_SCAN)
+        self.hold_back_size = config.HOLD_BACK_SIZE
+        self.counter_shed = parent_handler.metrics.counter("queue_hold_back_dropped")
+        self.counter_caught_up = parent_handler.metrics.counter("messages_caught_up")
+        self.counter_catch_up_skipped = parent_handler.metrics.counter(
+            "messages_catch_up_skipped")
+        self.counter_catch_up_dropped = parent_handler.metrics.counter(
+            "queue_catch_up_dropped")
+        self.evicted = self.queue_hold_back.evicted
+        self.delta_decoder = DeltaDecoder()
+        self.discovery_handler = Discovery(parent_handler)
+        self.snapshot_requested = None
+
+        self.handlers = {
+            messages.DISCOVERY: self.discovery,
+            messages.DISCOVERY_RESPONSE: self.discovery_response,
+            messages.NACK: self.nack,
+            messages.HEARTBEAT: self.heartbeat,
+            messages.EVICT: self.evict_received,
+            messages.CATCHUP: self.catch_up_requested
+        }
+        self.create_nack_tracker()
+
+        # Fetches the messages delivered before this Process joined, while the
+        # messages delivered after it joined wait in catch_up_buffer, which holds at
+        # most DELIVER_QUEUE_SIZE messages
+        self.catch_up = None
+        self.catch_up_buffer = deque()
+        self.catch_up_size = config.DELIVER_QUEUE_SIZE
+        self.catch_up_start = None
+        if config.CATCHUP and self.parent.synced and not self.parent.leader:
+            self._start_catch_up()
 
-    def handle(self, msg):
+    def handle(self, envelope):
         """
-        Handles an incoming message.
+        Handles an incoming message. Delta Vectors are reconstructed to full Vectors
+        first, which may also complete messages that arrived before their base.
+        DISCOVERY and DISCOVERY_RESPONSE messages update the group, all other messages
+        are delivered in causal order. While catching up, the fetched messages sent
+        before this Process joined are handed to the CatchUp instead. Processes which
+        did not join yet have no entry of their own in the Vector index and only send
+        DISCOVERY and HEARTBEAT messages.
 
         Parameters
         ----------
-        msg:    str
-            Received JSON data
+        envelope:   Envelope
+            The received message
         """
+        if envelope.sender not in envelope.vector.index:
+            handle_function = self.handlers.get(envelope.type)
+            if handle_function is not None:
+                handle_function(envelope)
+            return
 
-        vector, text = MessageFactory.unpack(msg)
-        logger.info(f"VectorTimestamp received message: {text} from {vector}")
+        catch_up = self.catch_up
+        if (catch_up is not None and not envelope.vector.delta
+                and catch_up.wants(envelope)):
+            catch_up.receive(envelope)
+            return
 
-        # TODO: ADD THE ACTUAL ALGORITHM
+        resolved = self.delta_decoder.resolve(envelope.vector, envelope)
+        if not resolved and self.nack_tracker is not None:
+            self._find_missing(envelope.vector, sender_only=True)
+
+        for vector, envelope in resolved:
+            envelope = envelope.with_vector(vector)
+            logger.debug("VectorTimestamp received message: %s from %s", envelope.text,
+                         envelope.sender)
+
+            handle_function = self.handlers.get(envelope.type, self.b_deliver)
+            handle_function(envelope)
 
     def co_multicast(self, text):
         """
@@ -46,18 +111,301 @@ class VectorTimestamp(BaseHandler):
 
         self.parent.send(text)
 
-    @deco.verify_message
-    def b_deliver(self, msg):
-        pass
+    def b_deliver(self, envelope):
+        """
+        Puts a received message into the hold-back queue and delivers every message
+        that can be delivered in causal order afterwards. If more than HOLD_BACK_SIZE
+        messages are held back, one of them is dropped and reported missing again.
+
+        Parameters
+        ----------
+        envelope:   Envelope
+            The received message with its full Vector
+        """
+        vector = envelope.vector
+        for _, delivered in self.queue_hold_back.put(vector, envelope):
+            self.co_deliver(delivered)
+
+        if self.queue_hold_back.holds(vector):
+            index = self.parent.vector.index
+            unknown = [process_id for process_id in vector.index
+                       if process_id not in index and process_id not in self.evicted]
+            if unknown:
+                self._add_unknown(unknown)
+            if self.nack_tracker is not None:
+                self._find_missing(vector)
+            if self.hold_back_size and len(self.queue_hold_back) > self.hold_back_size:
+                self._shed()
+
+    def co_deliver(self, envelope):
+        """
+        Delivers a message to the Connector's Queue shared with a Device object. EVICT
+        messages only pass the hold-back queue and are not delivered. While this
+        Process catches up on the messages delivered before it joined, messages are
+        kept until it caught up, at most DELIVER_QUEUE_SIZE of them.
+
+        Parameters
+        ----------
+        envelope:   Envelope
+            The received message
+
+        """
+        if envelope.type == messages.EVICT:
+            return
+
+        if self.catch_up is not None:
+            self._buffer(envelope)
+            return
+
+        self.parent.deliver(envelope)
+
+    def discovery(self, envelope):
+        """
+        Answers a DISCOVERY message of a new Process like in discovery mode, which
+        also adds the Process to the Vector index. Messages of the new Process that
+        were held back can be delivered afterwards.
+        """
+        self._advance(self.discovery_handler.discovery(envelope))
 
-    def co_deliver(self, msg):
+    def discovery_response(self, envelope):
         """
-        Delivers a message to the Connector's Queue shared with a Device object
+        Adds the Processes the leader knows about but this Process does not to the
+        Vector index. The counters of known Processes are not updated, since the
+        messages they count were not delivered yet. Evicted Processes are not added
+        again, since member IDs are never reused.
 
         Parameters
         ----------
-        msg:    str
-            A String containing the message (Identifier + text) in JSON format
+        envelope:   Envelope
+            The DISCOVERY_RESPONSE message
+        """
+        index = self.parent.vector.index
+        for process_id, counter in envelope.vector.index.items():
+            if process_id not in index and process_id not in self.evicted:
+                index[process_id] = counter
+                logger.info("Process %s joined the group at %s.", process_id, counter)
+                self._advance(process_id)
+
+    def evict_received(self, envelope):
+        """
+        Evicts the Processes listed by an EVICT message right away, since the messages
+        it depends on may never arrive from the evicted Processes. The EVICT message
+        still passes the hold-back queue, since it counts as a message of the leader.
+
+        Parameters
+        ----------
+        envelope:   Envelope
+            The EVICT message
+        """
+        sender = envelope.sender
+        if self.present((sender, envelope.vector.index[sender])):
+            return
+
+        super().evict_received(envelope)
+        if self.parent.active_handler is self:
+            self.b_deliver(envelope)
+
+    def catch_up_requested(self, envelope):
+        """
+        Sends the messages a joining Process asks this Process for with a CATCHUP
+        message, as far as they are in the delivery log of this Process.
+
+        Parameters
+        ----------
+        envelope:   Envelope
+            The CATCHUP message
+        """
+        try:
+            peer, ranges = parse_request(envelope.text)
+        except ValueError as e:
+            self.parent.counter_undecodable.inc()
+            logger.warning("Dropped CATCHUP message of Process %s that could not be "
+                           "decoded: %s", envelope.sender, e)
+            return
+
+        if peer == self.parent.vector.process_id:
+            self.parent.replay(ranges)
+
+    def remove(self, process_id):
+        for _, envelope in self.queue_hold_back.evict(process_id):
+            self.co_deliver(envelope)
+        self.delta_decoder.forget(process_id)
+        if self.catch_up is not None:
+            self.catch_up.evict(process_id)
+
+    def held(self):
+        held = len(self.queue_hold_back)
+        if self.catch_up is not None:
+            held += len(self.catch_up)
+        return held
+
+    def present(self, key):
+        process_id, counter = key
+        current = self.parent.vector.index.get(process_id)
+        if current is None or counter <= current:
+            return True
+
+        return (key in self.queue_hold_back.held
+                or counter in self.delta_decoder.pending.get(process_id, ()))
 
+    def _shed(self):
+        """
+        Drops the held back message which would be delivered last, or the oldest one
+        with overloads.DROP_OLDEST. A dropped message is requested again with a NACK,
+        by when the hold-back queue may have room for it.
+        """
+        oldest = self.parent.communicator.config.OVERLOAD == overloads.DROP_OLDEST
+        key = self.queue_hold_back.shed(oldest)
+        if key is None:
+            return
+
+        process_id, counter = key
+        self.counter_shed.inc()
+        if self.nack_tracker is not None:
+            self.nack_tracker.retry(process_id, counter)
+
+    def _find_missing(self, vector, sender_only=False):
+        """
+        Marks the messages as missing which the Vector of a held back message depends
+        on but which were not received.
+
+        Parameters
+        ----------
+        vector:         Vector
+            The Vector of the held back message
+        sender_only:    bool
+            Whether only the preceding messages of the sender are checked, e.g. for a
+            delta Vector
+        """
+        index = self.parent.vector.index
+        sender = vector.process_id
+
+        if sender_only:
+            dependencies = ((sender, vector.index[sender]),)
+        else:
+            dependencies = vector.index.items()
+
+        for process_id, counter in dependencies:
+            if process_id == sender:
+                counter -= 1
+
+            current = index.get(process_id)
+            if current is None or counter <= current:
+                continue
+
+            self.mark_missing(process_id, current + 1, counter)
+
+    def _add_unknown(self, process_ids):
+        """
+        Handles Processes a held back message depends on which this Process does not
+        know, e.g. because the DISCOVERY_RESPONSE announcing them was lost. If this
+        Process joined with a snapshot of the leader, they joined later and are added
+        at counter 0. Otherwise, the leader is asked for a snapshot of the group.
+        """
+        if not self.parent.synced:
+            self._request_snapshot()
+            return
+
+        index = self.parent.vector.index
+        for process_id in process_ids:
+            index[process_id] = 0
+            logger.info("Process %s joined the group unannounced.", process_id)
+        for process_id in process_ids:
+            self._advance(process_id)
+
+    def _request_snapshot(self):
+        """
+        Asks the leader for a snapshot of the group with a DISCOVERY message. Sent at
+        most once per DISCOVERY_RETRY seconds.
+        """
+        if self.parent.leader:
+            return
+
+        now = time.monotonic()
+        interval = self.parent.communicator.config.DISCOVERY_RETRY
+        if self.snapshot_requested is not None and now - self.snapshot_requested < interval:
+            return
+
+        self.snapshot_requested = now
+        self.parent.send(messages.DISCOVERY, increment=False)
+
+    def _start_catch_up(self):
+        """
+        Starts fetching the messages the snapshot of the leader counts as delivered
+        before this Process joined, at most CATCHUP_LIMIT per Process. With a delivery
+        log, e.g. after a restart, only the messages newer than the logged ones are
+        fetched.
+        """
+        parent = self.parent
+        config = parent.communicator.config
+        snapshot = dict(parent.vector.index)
+
+        start = {process_id: max(counter - config.CATCHUP_LIMIT, 0)
+                 if config.CATCHUP_LIMIT else 0
+                 for process_id, counter in snapshot.items()}
+        if parent.delivery_log is not None:
+            for process_id, counter in parent.delivery_log.latest().items():
+                if process_id in start:
+                    start[process_id] = max(start[process_id],
+                                            min(counter, snapshot[process_id]))
+
+        catch_up = CatchUp(parent.vector.process_id, snapshot, start, self.evicted,
+                           config, self._request_catch_up, self._deliver_caught_up,
+                           self._finish_catch_up, parent.call_later)
+        if catch_up.target:
+            self.catch_up_start = time.monotonic()
+            self.catch_up = catch_up
+            catch_up.start()
+
+    def _buffer(self, envelope):
+        """
+        Keeps a message until the catch-up finished. If DELIVER_QUEUE_SIZE messages
+        are kept already, the OVERLOAD policy chooses the message to drop. Nothing
+        consumes the kept messages while the MessageHandler waits, so
+        overloads.BLOCK drops the new message like on asynchronous Devices.
+        """
+        buffer = self.catch_up_buffer
+        if self.catch_up_size and len(buffer) >= self.catch_up_size:
+            policy = self.parent.communicator.config.OVERLOAD
+            position = victim(buffer, envelope, policy)
+            if position is None:
+                drop(envelope, self.counter_catch_up_dropped)
+                return
+
+            drop(buffer[position], self.counter_catch_up_dropped)
+            del buffer[position]
+
+        buffer.append(envelope)
+
+    def _request_catch_up(self, text):
+        self.parent.send(text, increment=False, msg_type=messages.CATCHUP)
+
+    def _deliver_caught_up(self, envelope):
+        if envelope.type != messages.EVICT:
+            self.counter_caught_up.inc()
+            self.parent.deliver(envelope)
+
+    def _finish_catch_up(self):
+        """
+        Delivers the messages kept while catching up, once all fetched messages were
+        delivered or given up.
+        """
+        catch_up, self.catch_up = self.catch_up, None
+        if catch_up is None:
+            return
+
+        self.counter_catch_up_skipped.inc(catch_up.skipped_count)
+        logger.info("Caught up after %.3f seconds, %d messages were given up.",
+                    time.monotonic() - self.catch_up_start, catch_up.skipped_count)
+
+        buffer, self.catch_up_buffer = self.catch_up_buffer, deque()
+        for envelope in buffer:
+            self.parent.deliver(envelope)
+
+    def _advance(self, process_id):
+        """
+        Delivers the held back messages waiting for the entry of a Process in the
+        Vector index, after it was added.
         """
-        self.parent.deliver(msg)
+        for _, envelope in self.queue_hold_back.advance(process_id):
+            self.co_deliver(envelope)
@@ -1,17 +1,43 @@
 import logging
+import os
 import threading
-from queue import Queue
+import time
+from contextlib import contextmanager
+from queue import Empty, Full
 
+import destinator.const.formats as formats
+import destinator.const.messages as messages
+import destinator.const.orderings as orderings
 import destinator.util.decorators as deco
+import destinator.util.trace as trace
+from destinator.const.timeouts import POLL_TIMEOUT
 from destinator.factories.message_factory import MessageFactory
 from destinator.handlers.discovery import Discovery
+from destinator.handlers.total_order import TotalOrder
 from destinator.handlers.vector_timestamp import VectorTimestamp
+from destinator.util.buffer_pool import ReceiveBatch
+from destinator.util.delivery_log import DELIVERED, SENT, DeliveryLog
+from destinator.util.delta import DeltaEncoder
+from destinator.util.envelope import Envelope
+from destinator.util.failure import FailureDetector, format_ids
+from destinator.util.membership import Membership, node_id
+from destinator.util.nack import RetransmitBuffer
+from destinator.util.timers import Timers
 from destinator.util.vector import Vector
 
 logger = logging.getLogger(__name__)
 
+# Number of times the last message of a Process is repeated if it sends no further
+# messages, see BaseMessageHandler._repeat_tail()
+TAIL_REPEATS = 3
+
+
+class BaseMessageHandler:
+    """
+    Handling of incoming and outgoing messages, independent of whether the
+    MessageHandler runs on its own Thread or as a coroutine.
+    """
 
-class MessageHandler(threading.Thread):
     def __init__(self, communicator, connector):
         super().__init__()
         self.cancelled = False
@@ -19,61 +45,271 @@ class MessageHandler(threading.Thread):
         self.communicator = communicator
         self.connector = connector
 
-        self.queue_send = Queue()
-
         self.leader = False
         self.active_handler = None
         self.vector = None
+        # Identifies this Process until the leader assigns it a member ID, which is
+        # then used as the Process ID in the Vector index
+        self.node_id = node_id()
+        # The member IDs assigned by this Process, if it is the leader
+        self.membership = Membership()
+        # Messages sent before this Process joined the group and got its member ID,
+        # which are sent once it joined
+        self.pending = []
+        self.pending_lock = threading.Lock()
+        # Held while the Vector index changes on the Thread of the MessageHandler, i.e.
+        # while it handles a message or runs a Timer, and while a sending Thread
+        # increments the own counter and takes a snapshot of the Vector to pack
+        self.vector_lock = threading.RLock()
+        # Messages delivered or sent while the Thread of the MessageHandler holds the
+        # vector_lock, which are only put into their Queues once it is released, see
+        # locked(). None outside of it, and only used by the Thread that set it.
+        self.deferred = None
+        self.deferring = None
+        # Seconds it took to join the group, None while discovering
+        self.joined = None
+        # Whether the Process joined with a snapshot of the leader. It then knows every
+        # Process that joined before it, and Processes it does not know joined after
+        # it, starting at counter 0.
+        self.synced = False
+        # Identifies the leader the member IDs were assigned by, which is its node ID.
+        # Member IDs are only unique among the Processes one leader admitted, so
+        # records keyed by member IDs, like those of the delivery log, are only valid
+        # within the same epoch. None until the Process joined.
+        self.epoch = None
 
-    def run(self):
+        metrics = communicator.metrics
+        self.metrics = metrics
+        self.counter_sent = metrics.counter("messages_sent")
+        self.counter_received = metrics.counter("messages_received")
+        self.counter_undecodable = metrics.counter("messages_undecodable")
+        self.counter_ignored = metrics.counter("messages_ignored")
+        metrics.gauge("queue_hold_back", self.hold_back_depth)
+        # The group ID as packed in binary messages, by which messages of other groups
+        # are dropped before they are decoded
+        self.group_key = MessageFactory.group_key(communicator.category.MCAST_ADDR)
+        # The TraceWriter recording the sent, received and delivered messages, set by
+        # the Device when it starts if the Config sets a TRACE_PATH
+        self.tracer = None
+
+        config = communicator.config
+        self.total_order = config.ORDERING == orderings.TOTAL
+        self.delta_encoder = None
+        if (config.DELTA_ENCODING and config.WIRE_FORMAT == formats.BINARY
+                and not self.total_order):
+            self.delta_encoder = DeltaEncoder(config.KEYFRAME_INTERVAL)
+
+        self.retransmit_buffer = None
+        if config.RETRANSMIT_BUFFER:
+            self.retransmit_buffer = RetransmitBuffer(config.RETRANSMIT_BUFFER,
+                                                      config.RETRANSMIT_BUFFER_SIZE,
+                                                      config.NACK_DELAY)
+            self.counter_nacks = metrics.counter("nacks_sent")
+            self.counter_retransmitted = metrics.counter("messages_retransmitted")
+
+        self.delivery_log = None
+        if config.LOG_PATH is not None:
+            path = os.path.join(config.LOG_PATH, communicator.category.NAME,
+                                communicator.device.name)
+            self.delivery_log = DeliveryLog(path, config.LOG_SEGMENT_SIZE,
+                                            config.LOG_SYNC_COUNT, config.LOG_RETENTION)
+            self.counter_replayed = metrics.counter("messages_replayed")
+
+        self.failure_detector = None
+        if config.FAILURE_TIMEOUT:
+            self.failure_detector = FailureDetector(config.HEARTBEAT_INTERVAL,
+                                                    config.FAILURE_TIMEOUT)
+            self.counter_heartbeats = metrics.counter("heartbeats_sent")
+            self.counter_evicted = metrics.counter("processes_evicted")
+
+        # Own counter at the last check for a lost last message and how often that
+        # message was repeated since
+        self.tail_counter = 0
+        self.tail_repeats = 0
+
+    def start_discovery(self):
         """
         Creates a new Vector.
         Sets the new active handler to Discovery and starts the discovery process.
-        Starts pulling messages from the Connector.
-        Starts transmitting messages to the Connector for broadcasting.
         """
         self.vector = self.create_vector()
 
         self.active_handler = Discovery(self)
         self.active_handler.start_discovery()
 
-        while not self.cancelled:
-            self._pull()
-            self._transmit()
+        config = self.communicator.config
+        if self.retransmit_buffer is not None:
+            self.call_later(config.NACK_INTERVAL, self._repeat_tail)
+        if self.failure_detector is not None:
+            self.call_later(config.HEARTBEAT_INTERVAL, self._check_liveness)
+        if self.delivery_log is not None:
+            self.call_later(config.LOG_SYNC_INTERVAL, self._sync_log)
 
-    def _pull(self):
+    def rejoin(self):
         """
-        Pulls a message from the Connector receiving Queue if a message is
-        available and handles the message.
+        Joins the group again after the leader evicted this Process, e.g. because its
+        messages did not reach the leader for FAILURE_TIMEOUT seconds. The Process
+        starts over with a new Vector, like a new Process.
         """
-        if not self.connector.queue_receive.empty():
-            msg = self.connector.queue_receive.get()
-            self.handle(msg)
+        logger.warning("Process %s was evicted from the group and joins it again.",
+                       self.vector.process_id)
+
+        if self.delta_encoder is not None:
+            self.delta_encoder = DeltaEncoder(self.communicator.config.KEYFRAME_INTERVAL)
+        if self.retransmit_buffer is not None:
+            self.retransmit_buffer.clear()
+        self.tail_counter = 0
+        self.joined = None
+        self.synced = False
+        self.epoch = None
+        with self.pending_lock:
+            self.pending = []
 
-    def _transmit(self):
+        self.vector = self.create_vector()
+        self.active_handler = Discovery(self)
+        self.active_handler.start_discovery()
+
+    def receive(self, msg):
         """
-        Pulls a message from the sending Queue of the MessageHandler class if available
-        and puts the message in the sending Queue of Connector for broadcasting.
+        Decodes a received message into an Envelope and handles it. Messages that
+        cannot be decoded are dropped, and so are binary messages of other groups
+        before they are decoded. Messages received through a Multiplexer were
+        decoded by it already.
+
+        Parameters
+        ----------
+        msg:    bytes or Envelope
+            The incoming message
         """
-        if not self.queue_send.empty():
-            msg = self.queue_send.get()
-            self.connector.queue_send.put(msg)
+        if type(msg) is Envelope:
+            self.counter_received.inc()
+            if self.tracer is not None:
+                self.tracer.record(trace.RECEIVE, self.vector.process_id, msg.vector,
+                                   msg.type)
+            self.handle(msg)
+            return
+
+        if not MessageFactory.in_group(msg, self.group_key):
+            self.counter_ignored.inc()
+            return
+
+        timing = self.metrics.timing
+        if timing:
+            start = time.perf_counter()
+
+        try:
+            envelope = MessageFactory.unpack(msg)
+        except ValueError as e:
+            self.counter_undecodable.inc()
+            logger.warning("Dropped message that could not be decoded: %s", e)
+            return
+
+        self.counter_received.inc()
+        if timing:
+            envelope.received = time.perf_counter()
+            self.metrics.histogram("decode_seconds").observe(envelope.received - start)
+        if self.tracer is not None:
+            self.tracer.record(trace.RECEIVE, self.vector.process_id, envelope.vector,
+                               envelope.type)
+
+        self.handle(envelope)
 
     @deco.verify_message
-    def handle(self, msg):
+    def handle(self, envelope):
         """
-        Forwards a message to the handle function of the active handler.
+        Forwards a message to the handle function of the active handler. Messages
+        whose text cannot be decoded, like a NACK listing no valid ranges, are
+        dropped.
+
         Parameters
         ----------
-        msg:    str
-            The incoming message in JSON format
+        envelope:   Envelope
+            The incoming message
         """
-        self.active_handler.handle(msg)
+        if self.failure_detector is not None and self.leader:
+            self.failure_detector.heard(envelope.sender)
+
+        with self.locked():
+            handler = self.active_handler
+            try:
+                if not self.metrics.timing:
+                    handler.handle(envelope)
+                    return
 
-    def send(self, text, increment=True):
+                start = time.perf_counter()
+                handler.handle(envelope)
+            except (ValueError, KeyError) as e:
+                self.counter_undecodable.inc()
+                logger.warning("Dropped %s message of Process %s that could not be "
+                               "decoded: %r", envelope.type, envelope.sender, e)
+                return
+
+            self.metrics.histogram(f"handle_{handler.NAME}_seconds").observe(
+                time.perf_counter() - start)
+
+    @contextmanager
+    def locked(self):
         """
-        Puts a message into the sending Queue. Increments the message counter by 1
-        if not otherwise specified (counter should not be incremented during discovery).
+        Holds the vector_lock while the Thread of the MessageHandler handles a message
+        or runs Timers. The messages delivered and sent meanwhile are put into the
+        deliver Queue and the sending Queue once the lock is released: with
+        overloads.BLOCK, a full Queue waits for its consumer, which may itself wait for
+        the lock, e.g. a Device Thread sending a message. No Queue is put into while
+        the lock is held.
+        """
+        if self.deferred is not None:
+            with self.vector_lock:
+                yield
+            return
+
+        deferred = []
+        try:
+            with self.vector_lock:
+                self.deferred = deferred
+                self.deferring = threading.get_ident()
+                try:
+                    yield
+                finally:
+                    self.deferred = None
+        finally:
+            for put, item in deferred:
+                put(item)
+
+    def _put(self, put, item):
+        """
+        Calls put with the item, or defers it until the vector_lock is released if the
+        Thread of the MessageHandler holds it, see locked().
+        """
+        deferred = self.deferred
+        if deferred is not None and self.deferring == threading.get_ident():
+            deferred.append((put, item))
+            return
+        put(item)
+
+    def hold_back_depth(self):
+        """
+        Returns
+        -------
+        int
+            The number of received messages the active handler holds back, 0 before
+            the MessageHandler started
+        """
+        handler = self.active_handler
+        if handler is None:
+            return 0
+        return handler.held()
+
+    def send(self, text, increment=True, msg_type=None):
+        """
+        Packs a message and hands it to the Connector, which broadcasts it right away.
+        Increments the message counter by 1 if not otherwise specified (counter should
+        not be incremented during discovery). Messages which increment the counter are
+        held back until this Process joined the group, since only then it has a member
+        ID to count them under. With delta encoding, messages which
+        increment the counter only carry the changed entries of the Vector. In total
+        order, they only carry the counter of this Process, and the leader sequences
+        its own messages. Messages which increment the counter are kept in the
+        RetransmitBuffer, if any.
 
         Parameters
         ----------
@@ -81,36 +317,271 @@ class MessageHandler(threading.Thread):
             The text to send in a message
         increment: bool
             Whether to increment the message counter of the Process or not.
+        msg_type: str
+            The message type, derived from the text if None
+        """
+        if increment and self.pending is not None:
+            with self.pending_lock:
+                if self.pending is not None:
+                    self.pending.append((text, msg_type))
+                    return
+
+        self._send(text, increment, msg_type)
+
+    def _send(self, text, increment=True, msg_type=None):
+        # The Thread of the MessageHandler changes the Vector index while a Device
+        # sends, so the message is packed from a snapshot of the Vector
+        with self.vector_lock:
+            snapshot = self.vector
+            if increment:
+                counter = snapshot.increment()
+            snapshot = Vector(snapshot.group_id, snapshot.process_id,
+                              dict(snapshot.index))
+
+            vector = snapshot
+            if increment and self.total_order:
+                vector = Vector(vector.group_id, vector.process_id,
+                                {vector.process_id: counter})
+            elif increment and self.delta_encoder is not None:
+                vector = self.delta_encoder.encode(vector)
+
+        wire_format = self.communicator.config.WIRE_FORMAT
+        msg = MessageFactory.pack(vector, text, wire_format, msg_type)
+        if increment and self.retransmit_buffer is not None:
+            self.retransmit_buffer.add(counter, msg)
+        if increment and self.delivery_log is not None:
+            self.delivery_log.append(SENT, snapshot, text, msg_type)
+
+        self.counter_sent.inc()
+        if self.tracer is not None:
+            self.tracer.record(trace.SEND, snapshot.process_id, vector,
+                               trace.message_type(text, msg_type))
+        self._put(self._transmit, msg)
+        if self.failure_detector is not None:
+            self.failure_detector.sent()
+
+        if (increment and self.total_order and self.leader and msg_type is None
+                and text not in MessageFactory.TYPES):
+            self.call_soon(lambda: self._sequence_own(counter))
+
+    def send_pending(self):
+        """
+        Sends the messages that were sent before this Process joined the group, in the
+        order they were sent. Messages sent meanwhile wait until they are sent.
+        """
+        with self.pending_lock:
+            for text, msg_type in self.pending:
+                self._send(text, msg_type=msg_type)
+            self.pending = None
+
+    def _sequence_own(self, counter):
+        """
+        Sequences a message the leader sent, once the TotalOrder handler is active.
+        """
+        if isinstance(self.active_handler, TotalOrder):
+            self.active_handler.sequence_own(counter)
+
+    def send_nack(self, text):
+        """
+        Reports missing messages to the group.
+
+        Parameters
+        ----------
+        text:   str
+            The ranges of the missing messages, see destinator.util.nack
+        """
+        self.counter_nacks.inc()
+        self.send(text, increment=False, msg_type=messages.NACK)
+
+    def retransmit(self, first, last):
+        """
+        Sends the own messages with counters between first and last again, as far as
+        they are still kept in the RetransmitBuffer.
+        """
+        for msg in self.retransmit_buffer.retransmit(first, last):
+            self.counter_retransmitted.inc()
+            self._put(self._transmit, msg)
+
+    def replay(self, ranges):
         """
-        if increment:
-            self.vector.index[self.vector.process_id] += 1
+        Sends the messages a joining Process asks for to catch up again, as they were
+        logged with their full Vectors in the delivery log. Messages which are not in
+        the log are left out, and without a log the request is ignored. The ranges are
+        cut to the logged counters, and at most CATCHUP_CHUNK messages are sent per
+        request, however many it asks for.
 
-        msg = MessageFactory.pack(self.vector, text)
-        self.queue_send.put(msg)
+        Parameters
+        ----------
+        ranges: list
+            The (Process ID, first counter, last counter) ranges of the messages
+        """
+        if self.delivery_log is None:
+            return
+
+        latest = self.delivery_log.latest()
+        remaining = self.communicator.config.CATCHUP_CHUNK
+        for process_id, first, last in ranges:
+            first = max(first, 1)
+            last = min(last, latest.get(process_id, 0), first + remaining - 1)
+            for counter in range(first, last + 1):
+                msg = self.delivery_log.message(process_id, counter)
+                if msg is not None:
+                    self.counter_replayed.inc()
+                    self._put(self._transmit, msg)
+
+            remaining -= max(last - first + 1, 0)
+            if remaining <= 0:
+                return
+
+    def _repeat_tail(self):
+        """
+        Repeats the last own message up to TAIL_REPEATS times once no message followed
+        it for a NACK_INTERVAL. Other Processes detect a lost message only through a
+        later message, so the loss of the last one would go unnoticed otherwise.
+        Checks again every NACK_INTERVAL until the MessageHandler is stopped.
+        """
+        if self.cancelled:
+            return
+
+        counter = self.vector.index.get(self.vector.process_id, 0)
+        if counter != self.tail_counter:
+            self.tail_counter = counter
+            self.tail_repeats = 0
+        elif counter and self.tail_repeats < TAIL_REPEATS:
+            self.tail_repeats += 1
+            self.retransmit(counter, counter)
+
+        self.call_later(self.communicator.config.NACK_INTERVAL, self._repeat_tail)
+
+    def _check_liveness(self):
+        """
+        Sends a HEARTBEAT if this Process did not send anything for a
+        HEARTBEAT_INTERVAL. The leader evicts the Processes it did not hear from for
+        FAILURE_TIMEOUT seconds and announces it with an EVICT message, which counts as
+        a message of the leader. Checks again every HEARTBEAT_INTERVAL until the
+        MessageHandler is stopped.
+        """
+        if self.cancelled:
+            return
+
+        detector = self.failure_detector
+        if detector.idle():
+            self.counter_heartbeats.inc()
+            self.send(messages.HEARTBEAT, increment=False)
+
+        if self.leader and not isinstance(self.active_handler, Discovery):
+            own = self.vector.process_id
+            suspects = detector.suspects([process_id for process_id in self.vector.index
+                                          if process_id != own])
+            if suspects:
+                logger.warning("Evicting Processes %s, which were not heard from for %s "
+                               "seconds.", suspects, detector.timeout)
+                self.counter_evicted.inc(len(suspects))
+                self.active_handler.evict(suspects)
+                self.send(format_ids(suspects), msg_type=messages.EVICT)
+
+        self.call_later(self.communicator.config.HEARTBEAT_INTERVAL, self._check_liveness)
+
+    def _sync_log(self):
+        """
+        Writes the records appended to the delivery log since the last sync to the
+        disk.
+        """
+        if self.cancelled:
+            return
+
+        self.delivery_log.sync()
+        self.call_later(self.communicator.config.LOG_SYNC_INTERVAL, self._sync_log)
+
+    def close(self):
+        """
+        Releases the resources of the MessageHandler once it stopped.
+        """
+        if self.delivery_log is not None:
+            self.delivery_log.close()
+
+    def forget(self, process_id):
+        """
+        Stops watching an evicted Process. The leader assigns it a new member ID if it
+        joins again.
+        """
+        self.membership.remove(process_id)
+        if self.failure_detector is not None:
+            self.failure_detector.forget(process_id)
+
+    def call_later(self, delay, callback):
+        """
+        Schedules a callback on the Thread or event loop of the MessageHandler.
+
+        Returns
+        -------
+        object
+            A handle with a cancel() method
+        """
+        raise NotImplementedError
+
+    def call_soon(self, callback):
+        """
+        Schedules a callback on the Thread or event loop of the MessageHandler from
+        any Thread, e.g. the Thread of the Device sending a message.
+        """
+        raise NotImplementedError
 
-    def deliver(self, msg):
+    def _transmit(self, msg):
         """
-        Wrapper function for the deliver function of the Communicator class
+        Hands a packed message to the Connector for broadcasting.
 
         Parameters
         ----------
-        msg:    str
-            The message to be delivered in JSON format
+        msg:    bytes
+            The packed message (Vector + text)
         """
-        self.communicator.deliver(msg)
+        raise NotImplementedError
+
+    def deliver(self, envelope):
+        """
+        Wrapper function for the deliver function of the Communicator class. Messages
+        delivered while the vector_lock is held are handed over once it is released,
+        see locked().
+
+        Parameters
+        ----------
+        envelope:   Envelope
+            The message to be delivered
+        """
+        if self.tracer is not None:
+            self.tracer.record(trace.DELIVER, self.vector.process_id, envelope.vector,
+                               envelope.type)
+        if self.delivery_log is not None:
+            self.delivery_log.append(DELIVERED, envelope.vector, envelope.text,
+                                     envelope.type)
+        self._put(self.communicator.deliver, envelope)
 
     def end_discover(self):
         """
-        Ends the discovery procedure by setting the active handler to VectorTimestamp.
-        Thus, from here on, incoming messages will be handled by the VectorTimestamp
-        algorithm.
+        Ends the discovery procedure by setting the active handler to VectorTimestamp,
+        or to TotalOrder if the Config orders messages totally. Thus, from here on,
+        incoming messages will be handled by the algorithm of that handler.
+
+        The delivery log continues in the epoch the Process joined in. A Process that
+        joined without a leader starts an epoch of its own.
         """
-        self.active_handler = VectorTimestamp(self)
+        if self.epoch is None:
+            self.epoch = self.node_id
+        if self.delivery_log is not None:
+            self.delivery_log.start_epoch(self.epoch)
+
+        if self.total_order:
+            self.active_handler = TotalOrder(self)
+        else:
+            self.active_handler = VectorTimestamp(self)
 
     def create_vector(self):
         """
-        Creates a new Vector object with the group id and process id of the Connector
-        object. Sets the counter for own messages to 0.
+        Creates a new Vector object with the group id of the Category. The leader
+        assigns itself the first member ID and sets its counter to 0. Any other
+        Process starts with an empty index under its node ID, until the leader
+        assigns it a member ID.
 
         Returns
         -------
@@ -120,7 +591,10 @@ class MessageHandler(threading.Thread):
 
         """
         id_group_own = self.communicator.category.MCAST_ADDR
-        id_process_own = threading.get_ident()
+        if not self.leader:
+            return Vector(id_group_own, self.node_id, {})
+
+        id_process_own, _ = self.membership.assign(self.node_id)
         id_message_own = 0
 
         index = {
@@ -128,3 +602,70 @@ class MessageHandler(threading.Thread):
         }
 
         return Vector(id_group_own, id_process_own, index)
+
+
+class MessageHandler(BaseMessageHandler, threading.Thread):
+    def __init__(self, communicator, connector):
+        super().__init__(communicator, connector)
+        self.timers = Timers()
+
+    def run(self):
+        """
+        Starts the discovery process.
+        Starts pulling messages from the Connector.
+        """
+        self.start_discovery()
+
+        while not self.cancelled:
+            self._pull()
+        self.close()
+
+    def _pull(self):
+        """
+        Blocks until a batch of messages arrives in the Connector receiving Queue or
+        POLL_TIMEOUT is reached and handles the messages. The buffers of the batch are
+        recycled afterwards. Timers that are due run before waiting, and waiting ends
+        early when the next Timer is due. A message whose handling fails is logged and
+        skipped, so that the MessageHandler keeps running.
+        """
+        with self.locked():
+            timeout = self.timers.run()
+        if timeout is None or timeout > POLL_TIMEOUT:
+            timeout = POLL_TIMEOUT
+
+        try:
+            batch = self.connector.queue_receive.get(timeout=timeout)
+        except Empty:
+            return
+
+        try:
+            for msg in batch:
+                try:
+                    self.receive(msg)
+                except Exception:
+                    logger.exception("Failed to handle a received message.")
+        finally:
+            batch.release()
+
+    def _transmit(self, msg):
+        """
+        Puts a message in the sending Queue of Connector, which wakes up and
+        broadcasts it.
+
+        Parameters
+        ----------
+        msg:    bytes
+            The packed message (Vector + text)
+        """
+        self.connector.queue_send.put(msg)
+
+    def call_later(self, delay, callback):
+        return self.timers.call_later(delay, callback)
+
+    def call_soon(self, callback):
+        self.timers.call_soon_threadsafe(callback)
+        try:
+            self.connector.queue_receive.put(ReceiveBatch(()), block=False)
+        except Full:
+            # The MessageHandler has messages to handle and runs the callback before
+            pass
@@ -0,0 +1,60 @@
+from destinator.factories.datagram_factory import DatagramFactory
+
+
+class Batcher:
+    """
+    Collects outgoing messages and packs them into datagrams of at most size bytes.
+    Messages larger than size are sent in a datagram of their own.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.msgs = []
+        self.msgs_size = 0
+
+    def __len__(self):
+        return len(self.msgs)
+
+    def add(self, msg):
+        """
+        Adds a message to the current batch.
+
+        Parameters
+        ----------
+        msg:    bytes
+            The packed message
+
+        Returns
+        -------
+        list
+            The datagrams that are full and should be sent now
+        """
+        datagrams = []
+
+        size = DatagramFactory.batch_size(self.msgs_size + len(msg), len(self.msgs) + 1)
+        if self.msgs and size > self.size:
+            datagrams.extend(self.flush())
+
+        self.msgs.append(msg)
+        self.msgs_size += len(msg)
+
+        if len(msg) >= self.size:
+            datagrams.extend(self.flush())
+
+        return datagrams
+
+    def flush(self):
+        """
+        Returns
+        -------
+        list
+            The datagram holding the current batch, if there is any
+        """
+        if not self.msgs:
+            return []
+
+        datagram = DatagramFactory.pack_batch(self.msgs)
+        self.msgs = []
+        self.msgs_size = 0
+
+        return [datagram]
@@ -0,0 +1,63 @@
+class BufferPool:
+    """
+    A pool of preallocated receive buffers of size bytes each. Buffers that are
+    acquired while the pool is empty are allocated on demand; at most count buffers
+    are kept when they are released.
+    """
+
+    def __init__(self, count, size):
+        self.count = count
+        self.size = size
+        self.buffers = [bytearray(size) for _ in range(count)]
+
+    def acquire(self):
+        """
+        Returns
+        -------
+        bytearray
+            A buffer to receive into
+        """
+        if self.buffers:
+            return self.buffers.pop()
+
+        return bytearray(self.size)
+
+    def release(self, buffer):
+        """
+        Returns a buffer to the pool once nothing refers to its contents anymore.
+
+        Parameters
+        ----------
+        buffer: bytearray
+            A buffer acquired from the pool
+        """
+        if len(self.buffers) < self.count:
+            self.buffers.append(buffer)
+
+
+class ReceiveBatch:
+    """
+    The messages received by a Listener in one wakeup, together with the buffers of
+    the BufferPool they point into. The messages must not be used after release().
+    """
+
+    __slots__ = ("msgs", "buffers", "pool")
+
+    def __init__(self, msgs, buffers=(), pool=None):
+        self.msgs = msgs
+        self.buffers = buffers
+        self.pool = pool
+
+    def __iter__(self):
+        return iter(self.msgs)
+
+    def __len__(self):
+        return len(self.msgs)
+
+    def release(self):
+        """
+        Returns the buffers of the batch to their BufferPool.
+        """
+        for buffer in self.buffers:
+            self.pool.release(buffer)
+        self.buffers = ()
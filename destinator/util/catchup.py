@@ -0,0 +1,303 @@
+import itertools
+import logging
+from collections import deque
+
+import destinator.const.messages as messages
+from destinator.util.hold_back import HoldBackQueue
+from destinator.util.nack import format_ranges, parse_ranges
+
+logger = logging.getLogger(__name__)
+
+
+def format_request(peer, keys):
+    """
+    Encodes a request for the messages of other Processes as the text of a CATCHUP
+    message: the ID of the peer asked to send them, followed by one
+    "process_id:first-last" range per run of consecutive counters like in a NACK.
+
+    Returns
+    -------
+    str
+        The text of the CATCHUP message
+    """
+    return f"{peer} {format_ranges(keys)}"
+
+
+def parse_request(text):
+    """
+    Decodes the text of a CATCHUP message.
+
+    Returns
+    -------
+    tuple
+        The ID of the peer asked and the (Process ID, first counter, last counter)
+        ranges it is asked for
+    """
+    peer, _, ranges = text.partition(" ")
+    return int(peer), parse_ranges(ranges)
+
+
+class CatchUp:
+    """
+    Fetches the messages a joining Process missed from the delivery logs of its peers.
+
+    The snapshot of the leader tells which messages of every Process were delivered
+    before the Process joined. The missing ones, from start on, are split into chunks
+    of chunk_size messages, ordered by how far they are behind, and requested with a
+    CATCHUP message from up to peer_count peers in parallel, one chunk per peer. A
+    peer that answered a chunk is asked for the next one right away. Once no message
+    of an incomplete chunk arrived for timeout seconds, its missing messages are
+    requested again from the next peer, and given up after retries requests. Peers
+    which did not answer retries requests in a row are not asked again.
+
+    The fetched messages pass a hold-back queue of their own and are delivered in
+    causal order. Every one of them precedes or is concurrent with the messages sent
+    after the Process joined, which are delivered once the catch-up finished.
+    """
+
+    def __init__(self, own, snapshot, start, evicted, config, send, deliver, finish,
+                 call_later):
+        self.chunk_size = config.CATCHUP_CHUNK
+        self.peer_count = config.CATCHUP_PEERS
+        self.timeout = config.CATCHUP_TIMEOUT
+        self.retries = config.CATCHUP_RETRIES
+
+        # Functions sending a CATCHUP text, delivering a fetched message, called once
+        # the catch-up finished and scheduling a callback
+        self.send = send
+        self.deliver = deliver
+        self.finish = finish
+        self.call_later = call_later
+
+        # Process ID -> counter of the last message to fetch
+        self.target = {process_id: counter for process_id, counter in snapshot.items()
+                       if process_id != own and counter > start.get(process_id, 0)}
+        # Process ID -> counter of the last fetched message that was delivered or
+        # given up
+        self.index = {process_id: min(start.get(process_id, 0), counter)
+                      for process_id, counter in snapshot.items()}
+        self.queue = HoldBackQueue(self.index)
+        self.queue.evicted.update(evicted)
+
+        self.peers = deque(sorted(process_id for process_id in snapshot
+                                  if process_id != own))
+        # Deque of [keys, number of requests] of the chunks to request
+        self.chunks = deque()
+        # Peer -> [request number, requested keys, keys not received, number of
+        # requests, whether a message arrived since the last timeout] of the chunk
+        # requested from it
+        self.requests = {}
+        self.numbers = itertools.count()
+        # Peer -> number of requests in a row it did not answer
+        self.unanswered = {}
+        # (Process ID, counter) pairs of the messages that were given up
+        self.skipped = set()
+        self.skipped_count = 0
+        self.finished = False
+
+    def __len__(self):
+        return len(self.queue)
+
+    def start(self):
+        """
+        Splits the missing messages into chunks and requests the first ones.
+        """
+        keys = sorted(((process_id, counter)
+                       for process_id, last in self.target.items()
+                       for counter in range(self.index[process_id] + 1, last + 1)),
+                      key=lambda key: (key[1] - self.index[key[0]], key[0]))
+        for i in range(0, len(keys), self.chunk_size):
+            self.chunks.append([keys[i:i + self.chunk_size], 0])
+
+        logger.info("Catching up on %d messages of %d Processes from %d peers.",
+                    len(keys), len(self.target), len(self.peers))
+        if not self.peers:
+            self._skip(keys)
+            self.chunks.clear()
+        self._dispatch()
+        self._check_done()
+
+    def wants(self, envelope):
+        """
+        Returns
+        -------
+        bool
+            Whether a received message is one of the messages to fetch
+        """
+        if envelope.type not in (messages.DATA, messages.EVICT):
+            return False
+
+        sender = envelope.sender
+        counter = envelope.vector.index[sender]
+        last = self.target.get(sender)
+        return last is not None and self.index[sender] < counter <= last
+
+    def receive(self, envelope):
+        """
+        Puts a fetched message into the hold-back queue and delivers every fetched
+        message that can be delivered in causal order afterwards.
+        """
+        vector = envelope.vector
+        # Processes the snapshot does not know were evicted before this Process joined
+        self.queue.evicted.update(process_id for process_id in vector.index
+                                  if process_id not in self.index)
+        for _, delivered in self.queue.put(vector, envelope):
+            self.deliver(delivered)
+
+        key = (envelope.sender, vector.index[envelope.sender])
+        for peer, request in list(self.requests.items()):
+            if key in request[2]:
+                request[2].discard(key)
+                request[4] = True
+                self.unanswered.pop(peer, None)
+                if not request[2]:
+                    del self.requests[peer]
+
+        self._settle()
+        self._dispatch()
+        self._check_done()
+
+    def evict(self, process_id):
+        """
+        Stops fetching the messages of an evicted Process and asking it for messages.
+        """
+        self.target.pop(process_id, None)
+        if process_id in self.peers:
+            self.peers.remove(process_id)
+        request = self.requests.pop(process_id, None)
+        if request is not None:
+            self.chunks.appendleft([list(request[1]), request[3]])
+
+        for _, envelope in self.queue.evict(process_id):
+            self.deliver(envelope)
+
+        if not self.peers:
+            self._skip([key for keys, _ in self.chunks for key in keys])
+            self.chunks.clear()
+        self._settle()
+        self._dispatch()
+        self._check_done()
+
+    def _present(self, key):
+        process_id, counter = key
+        current = self.index.get(process_id)
+        return (current is None or counter <= current or key in self.queue.held
+                or key in self.skipped)
+
+    def _dispatch(self):
+        """
+        Requests the next chunks from the peers without a pending request, as long
+        as fewer than peer_count requests are pending.
+        """
+        for peer in list(self.peers):
+            if not self.chunks or len(self.requests) >= self.peer_count:
+                return
+            if peer in self.requests:
+                continue
+
+            keys, attempts = self.chunks.popleft()
+            keys = [key for key in keys if not self._present(key)]
+            if keys:
+                self._request(peer, keys, attempts)
+
+        if self.chunks and len(self.requests) < min(self.peer_count, len(self.peers)):
+            self._dispatch()
+
+    def _request(self, peer, keys, attempts):
+        number = next(self.numbers)
+        self.requests[peer] = [number, keys, set(keys), attempts + 1, False]
+        self.send(format_request(peer, keys))
+        self.call_later(self.timeout, lambda: self._expire(peer, number))
+
+    def _expire(self, peer, number):
+        """
+        Checks a pending request once no message of its chunk arrived for the
+        timeout. The missing messages are requested again from the next peer, or
+        given up after retries requests. A peer which did not answer retries requests
+        in a row is not asked again, unless it is the only one.
+        """
+        request = self.requests.get(peer)
+        if self.finished or request is None or request[0] != number:
+            return
+
+        _, keys, missing, attempts, arrived = request
+        if arrived:
+            # The peer is still sending the chunk
+            request[4] = False
+            self.call_later(self.timeout, lambda: self._expire(peer, number))
+            return
+
+        del self.requests[peer]
+        missing = [key for key in keys if key in missing and not self._present(key)]
+
+        if peer in self.peers:
+            self.peers.remove(peer)
+            if len(missing) == len(keys):
+                self.unanswered[peer] = self.unanswered.get(peer, 0) + 1
+            if self.unanswered.get(peer, 0) < self.retries or not self.peers:
+                self.peers.append(peer)
+            else:
+                logger.info("Peer %s did not answer %d catch-up requests and is not "
+                            "asked again.", peer, self.retries)
+
+        if missing and attempts >= self.retries:
+            self._skip(missing)
+        elif missing:
+            self.chunks.appendleft([missing, attempts])
+
+        self._settle()
+        self._dispatch()
+        self._check_done()
+
+    def _skip(self, keys):
+        if not keys:
+            return
+
+        logger.warning("Gave up catching up on %d messages.", len(keys))
+        self.skipped.update(keys)
+        self.skipped_count += len(keys)
+
+    def _settle(self):
+        """
+        Moves the index past the given up messages, and delivers the fetched messages
+        which only waited for them.
+        """
+        while self.skipped:
+            advanced = False
+            for key in list(self.skipped):
+                process_id, counter = key
+                current = self.index.get(process_id)
+                if current is None or counter <= current:
+                    self.skipped.discard(key)
+                elif counter == current + 1:
+                    self.skipped.discard(key)
+                    self.index[process_id] = counter
+                    for _, envelope in self.queue.advance(process_id):
+                        self.deliver(envelope)
+                    advanced = True
+
+            if not advanced:
+                return
+
+    def _check_done(self):
+        if self.finished:
+            return
+
+        index = self.index
+        if any(process_id in index and index[process_id] < last
+               for process_id, last in self.target.items()):
+            if self.requests or self.chunks:
+                return
+            # Messages requested as part of a chunk but never received
+            self._skip([(process_id, counter)
+                        for process_id, last in self.target.items()
+                        if process_id in index
+                        for counter in range(index[process_id] + 1, last + 1)
+                        if not self._present((process_id, counter))])
+            self._settle()
+            if any(process_id in index and index[process_id] < last
+                   for process_id, last in self.target.items()):
+                return
+
+        self.finished = True
+        self.finish()
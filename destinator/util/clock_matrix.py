@@ -0,0 +1,204 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Whether ClockMatrix compares in vectorized passes. Without NumPy it falls back to
+# plain Python loops with the same results.
+VECTORIZED = np is not None
+
+
+class ClockMatrix:
+    """
+    The Vectors of many messages, compared against the local Vector index at once.
+    With NumPy, the Vectors are stacked into a matrix with a column per Process, so
+    that the deliverability of all messages is decided in one vectorized pass instead
+    of a loop over the group per message.
+    """
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.matrix = None
+        self.columns = None
+        self.sender_columns = None
+
+        if VECTORIZED and vectors:
+            self._stack()
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def dependencies(self, index, evicted=()):
+        """
+        Decides for every Vector whether its message can be delivered in causal order:
+        the local index must hold the preceding message of the sender and at least
+        every other entry of the Vector. Entries of evicted Processes are ignored.
+
+        Parameters
+        ----------
+        index:      dict
+            The local Vector index
+        evicted:    set
+            The IDs of evicted Processes
+
+        Returns
+        -------
+        list
+            Per Vector, None if the message can be delivered, otherwise a
+            (Process ID, counter) pair the local index must reach first
+        """
+        if self.matrix is None:
+            return [dependency(vector, index, evicted) for vector in self.vectors]
+
+        rows = np.arange(len(self.vectors))
+        senders = self.sender_columns
+        local = self._local(index, evicted)
+
+        matrix = self.matrix.copy()
+        counters = matrix[rows, senders]
+        matrix[rows, senders] = -1
+
+        sender_ready = (local[senders] >= 0) & (local[senders] == counters - 1)
+        unmet = matrix > local
+        ready = sender_ready & ~unmet.any(axis=1)
+        first_unmet = unmet.argmax(axis=1)
+
+        columns = self.columns
+        dependencies = []
+        for row in range(len(self.vectors)):
+            if ready[row]:
+                dependencies.append(None)
+            elif not sender_ready[row]:
+                dependencies.append((int(columns[senders[row]]), int(counters[row]) - 1))
+            else:
+                column = first_unmet[row]
+                dependencies.append((int(columns[column]), int(self.matrix[row, column])))
+
+        return dependencies
+
+    def merge(self, rows, index, evicted=()):
+        """
+        Raises the entries of the local index to the highest entries of the given
+        Vectors in bulk, e.g. after their messages were delivered. Evicted Processes
+        are not added to the index again.
+
+        Parameters
+        ----------
+        rows:       list
+            The positions of the Vectors to merge
+        index:      dict
+            The local Vector index, which is updated in place
+        evicted:    set
+            The IDs of evicted Processes
+        """
+        if self.matrix is None:
+            for row in rows:
+                for process_id, counter in self.vectors[row].index.items():
+                    if process_id in evicted:
+                        continue
+                    current = index.get(process_id)
+                    if current is None or current < counter:
+                        index[process_id] = counter
+            return
+
+        if not rows:
+            return
+
+        merged = self.matrix[rows].max(axis=0)
+        local = self._local(index, evicted)
+        for column in np.nonzero(merged > local)[0].tolist():
+            index[int(self.columns[column])] = int(merged[column])
+
+    def _stack(self):
+        """
+        Stacks the Vectors into a matrix with a column per Process that occurs in any
+        of them. Entries missing from a Vector are -1, which every local entry meets.
+        The columns are the sorted IDs of these Processes, so the width of the matrix
+        does not depend on how high the IDs are, e.g. after many evictions.
+        """
+        vectors = self.vectors
+        lengths = np.fromiter((len(vector.index) for vector in vectors), np.int64,
+                              len(vectors))
+
+        if all(vector.packed is not None for vector in vectors):
+            process_ids, counters = _unpack(vectors, lengths)
+        else:
+            total = int(lengths.sum())
+            process_ids = np.fromiter((process_id for vector in vectors
+                                       for process_id in vector.index), np.int64, total)
+            counters = np.fromiter((counter for vector in vectors
+                                    for counter in vector.index.values()),
+                                   np.int64, total)
+        senders = np.fromiter((vector.process_id for vector in vectors), np.int64,
+                              len(vectors))
+
+        # Every sender has an entry in its own Vector, so it has a column
+        self.columns, positions = np.unique(process_ids, return_inverse=True)
+        self.sender_columns = np.searchsorted(self.columns, senders)
+
+        self.matrix = np.full((len(vectors), len(self.columns)), -1, np.int64)
+        self.matrix[np.repeat(np.arange(len(vectors)), lengths), positions] = counters
+
+    def _local(self, index, evicted=()):
+        """
+        Returns
+        -------
+        numpy.ndarray
+            The entries of the local index for the columns of the matrix: -1 for
+            unknown Processes, the maximum for evicted ones so that they never block
+        """
+        maximum = np.iinfo(np.int64).max
+        return np.fromiter((maximum if process_id in evicted
+                            else index.get(process_id, -1)
+                            for process_id in self.columns.tolist()),
+                           np.int64, len(self.columns))
+
+
+def _unpack(vectors, lengths):
+    """
+    Returns
+    -------
+    tuple
+        The process IDs and the counters of all Vectors, decoded from their packed
+        indexes in one go
+    """
+    values = np.frombuffer(b"".join(vector.packed for vector in vectors), ">u4")
+    values = values.astype(np.int64)
+
+    length = int(lengths[0])
+    if (lengths == length).all():
+        # The Vectors of a group mostly have the same number of entries
+        values = values.reshape(len(vectors), 2 * length)
+        return values[:, :length].ravel(), values[:, length:].ravel()
+
+    # Vector i occupies 2 * lengths[i] values, its process IDs followed by its counters
+    starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    positions = np.arange(len(values) // 2) + starts
+
+    return values[positions], values[positions + np.repeat(lengths, lengths)]
+
+
+def dependency(vector, index, evicted=()):
+    """
+    Returns
+    -------
+    tuple
+        A (Process ID, counter) pair the local index has not reached yet but must
+        reach before the message with the Vector can be delivered, or None if it can
+        be delivered
+    """
+    sender = vector.process_id
+    counter = vector.index[sender]
+
+    current = index.get(sender)
+    if current is None or current != counter - 1:
+        return sender, counter - 1
+
+    for process_id, counter_needed in vector.index.items():
+        if process_id == sender:
+            continue
+        current = index.get(process_id)
+        if (current is None or current < counter_needed) and process_id not in evicted:
+            return process_id, counter_needed
+
+    return None
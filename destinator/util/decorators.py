@@ -2,31 +2,33 @@ import logging
 from functools import wraps
 
 import destinator.const.messages as messages
-from destinator.factories.message_factory import MessageFactory
 
 logger = logging.getLogger(__name__)
 
 
 def verify_message(func):
     @wraps(func)
-    def wrapper(obj, msg):
-        vector, text = MessageFactory.unpack(msg)
+    def wrapper(obj, envelope):
+        vector = envelope.vector
 
         # Ignore own messages
         if (vector.group_id == obj.vector.group_id
             and vector.process_id == obj.vector.process_id):
+            obj.counter_ignored.inc()
             return
 
-        # Ignore messages coming from different groups. Log their reception.
+        # Ignore messages coming from different groups. Binary messages of different
+        # groups are dropped before they are decoded, so these are JSON messages.
         if vector.group_id != obj.vector.group_id:
-            logger.warning(
-                f"Received message from different group {vector.group_id}, text: {text}")
+            obj.counter_ignored.inc()
+            logger.debug("Received message from different group %s", vector.group_id)
             return
 
         # Ignore DISCOVERY messages if not the leader
-        if text == messages.DISCOVERY and not obj.leader:
+        if envelope.type == messages.DISCOVERY and not obj.leader:
+            obj.counter_ignored.inc()
             return
 
-        return func(obj, msg)
+        return func(obj, envelope)
 
     return wrapper
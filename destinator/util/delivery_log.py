@@ -0,0 +1,568 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+from destinator.factories.message_factory import MessageFactory
+
+logger = logging.getLogger(__name__)
+
+# Kinds of records
+SENT = 0
+DELIVERED = 1
+
+# Length and CRC-32 of the record body that follows
+RECORD = struct.Struct("!II")
+# Start of the record body: kind and wall clock time, followed by the message in the
+# binary wire format
+BODY = struct.Struct("!Bd")
+# Entry of a segment index: Process ID, counter and offset of the record. The entries
+# are sorted by Process ID and counter.
+INDEX_ENTRY = struct.Struct("!III")
+
+SEGMENT_SUFFIX = ".log"
+INDEX_SUFFIX = ".idx"
+# File holding the epoch the records were written in
+EPOCH_FILE = "epoch"
+
+LogRecord = namedtuple("LogRecord", ["kind", "timestamp", "envelope"])
+
+
+class Segment:
+    """
+    A file of the DeliveryLog, memory-mapped. The active segment is preallocated to
+    the segment size and records are appended to the mapping; the end of its records
+    is marked by a zero length. Sealed segments are truncated to their records and
+    only read.
+
+    Only the active segment indexes its records in memory. A sealed segment keeps the
+    range of counters of every Process in it, and finds a record by a binary search in
+    its memory-mapped index file.
+    """
+
+    def __init__(self, path, number, size=0):
+        self.path = path
+        self.number = number
+        self.end = 0
+        self.synced = 0
+        # Process ID -> [first counter, last counter] of its records in the segment
+        self.ranges = {}
+        # (Process ID, counter) -> offset of the latest record, while the segment is
+        # active
+        self.offsets = {}
+        # The mapped index file, once the segment is sealed
+        self.index_map = None
+
+        self.file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        self.size = os.fstat(self.file.fileno()).st_size
+        if self.size < size:
+            self.file.truncate(size)
+            self.size = size
+        self.map = None
+        self._map()
+
+    def __len__(self):
+        if self.index_map is None:
+            return len(self.offsets)
+        return len(self.index_map) // INDEX_ENTRY.size
+
+    def _map(self):
+        if self.size:
+            self.map = mmap.mmap(self.file.fileno(), self.size)
+
+    def add(self, process_id, counter, offset):
+        """
+        Indexes an appended record.
+        """
+        self.offsets[(process_id, counter)] = offset
+        counters = self.ranges.get(process_id)
+        if counters is None:
+            self.ranges[process_id] = [counter, counter]
+        elif counter < counters[0]:
+            counters[0] = counter
+        elif counter > counters[1]:
+            counters[1] = counter
+
+    def find(self, process_id, counter):
+        """
+        Returns
+        -------
+        int
+            The offset of the latest record of the message of a Process with the given
+            counter, None if the segment holds none
+        """
+        counters = self.ranges.get(process_id)
+        if counters is None or not counters[0] <= counter <= counters[1]:
+            return None
+        if self.index_map is None:
+            return self.offsets.get((process_id, counter))
+
+        key = (process_id, counter)
+        entries = self.index_map
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if INDEX_ENTRY.unpack_from(entries, middle * INDEX_ENTRY.size)[:2] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == len(self):
+            return None
+
+        found_id, found_counter, offset = INDEX_ENTRY.unpack_from(
+            entries, low * INDEX_ENTRY.size)
+        return offset if (found_id, found_counter) == key else None
+
+    def fits(self, length):
+        # Room for the record and the zero length marking the end
+        return self.end + length + RECORD.size <= self.size
+
+    def append(self, record):
+        offset = self.end
+        self.map[offset:offset + len(record)] = record
+        self.end += len(record)
+        return offset
+
+    def read(self, offset):
+        """
+        Returns
+        -------
+        tuple
+            The body of the record at the offset and the offset of the next record,
+            or None if there is no intact record at the offset
+        """
+        if offset + RECORD.size > self.size:
+            return None
+
+        length, crc = RECORD.unpack_from(self.map, offset)
+        start = offset + RECORD.size
+        if not length or start + length > self.size:
+            return None
+
+        body = self.map[start:start + length]
+        if zlib.crc32(body) != crc:
+            return None
+
+        return body, start + length
+
+    def scan(self):
+        """
+        Indexes the intact records from the end of the indexed ones on, e.g. after the
+        process was stopped before the segment was sealed. A torn record at the end is
+        overwritten by the next one.
+        """
+        offset = self.end
+        while True:
+            result = self.read(offset)
+            if result is None:
+                break
+            body, next_offset = result
+            self.add(*key_of(body), offset)
+            offset = next_offset
+
+        self.end = self.synced = offset
+        if self.end + RECORD.size <= self.size:
+            self.map[self.end:self.end + RECORD.size] = bytes(RECORD.size)
+
+    def sync(self):
+        """
+        Writes the appended records to the disk.
+        """
+        if self.synced == self.end:
+            return
+
+        start = self.synced - self.synced % mmap.ALLOCATIONGRANULARITY
+        self.map.flush(start, self.end - start)
+        self.synced = self.end
+
+    def seal(self, index_path):
+        """
+        Syncs the segment, truncates it to its records and writes its index, which
+        replaces the index in memory.
+        """
+        self.sync()
+        if self.map is not None:
+            self.map.close()
+        self.file.truncate(self.end)
+        self.size = self.end
+        self._map()
+
+        with open(index_path, "wb") as file:
+            file.write(b"".join(INDEX_ENTRY.pack(*key, offset)
+                                for key, offset in sorted(self.offsets.items())))
+            file.flush()
+            os.fsync(file.fileno())
+
+        self._map_index(index_path)
+        self.offsets = {}
+
+    def load(self, index_path):
+        """
+        Maps the index of a sealed segment and reads the ranges of counters from it.
+        """
+        self._map_index(index_path)
+        for process_id, counter, _ in INDEX_ENTRY.iter_unpack(self.index_map):
+            counters = self.ranges.setdefault(process_id, [counter, counter])
+            counters[1] = counter
+        self.end = self.synced = self.size
+
+    def _map_index(self, index_path):
+        with open(index_path, "rb") as file:
+            if os.fstat(file.fileno()).st_size:
+                self.index_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.index_map = b""
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        if isinstance(self.index_map, mmap.mmap):
+            self.index_map.close()
+        self.file.close()
+
+
+def key_of(body):
+    """
+    Returns
+    -------
+    tuple
+        The ID of the sender and its counter in the message of a record body, read
+        from the binary header without decoding the message
+    """
+    header = MessageFactory.HEADER
+    _, _, _, count, _, sender = header.unpack_from(body, BODY.size)
+    offset = BODY.size + header.size
+    process_ids = struct.unpack_from(f"!{count}I", body, offset)
+    counters = struct.unpack_from(f"!{count}I", body, offset + 4 * count)
+
+    return sender, dict(zip(process_ids, counters)).get(sender, 0)
+
+
+class DeliveryLog:
+    """
+    A durable, append-only log of the messages a Process sent and delivered, e.g. for
+    replay, auditing or bringing other Processes up to date. Records hold the kind,
+    the time and the message in the binary wire format with its Vector, and are
+    found by the ID of the sender and its counter.
+
+    The log is a directory of memory-mapped segments of segment_size bytes. When a
+    record does not fit into the active segment, it is sealed: truncated to its
+    records, with its index written next to it, and a new segment is started. Only
+    the last retention segments are kept, 0 keeps all.
+
+    Only the active segment indexes its records in memory; the sealed ones are
+    searched through their index files, so the memory of the log is bounded by the
+    segment size rather than by the number of records.
+
+    Records are found by member IDs, which are only unique within the epoch of the
+    leader that assigned them. The log therefore records its epoch, and its records
+    are dropped when it continues in another epoch, see start_epoch().
+
+    Appended records are synced to the disk in batches, once sync_count records are
+    pending or when sync() is called, so that a crash loses at most the records since
+    the last sync. Reopening the log continues after the last intact record.
+    """
+
+    def __init__(self, path, segment_size, sync_count=0, retention=0):
+        self.path = path
+        self.segment_size = segment_size
+        self.sync_count = sync_count
+        self.retention = retention
+
+        self.segments = []
+        self.pending = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+        os.makedirs(path, exist_ok=True)
+        self.epoch = self._read_epoch()
+        self._open()
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(segment) for segment in self.segments)
+
+    def append(self, kind, vector, text, msg_type=None):
+        """
+        Appends a message.
+
+        Parameters
+        ----------
+        kind:       int
+            SENT or DELIVERED
+        vector:     Vector
+            The full Vector of the message
+        text:       str
+            The text of the message
+        msg_type:   str
+            The message type, derived from the text if None
+        """
+        msg = MessageFactory.pack_binary(vector, text, msg_type)
+        body = BODY.pack(kind, time.time()) + msg
+        record = RECORD.pack(len(body), zlib.crc32(body)) + body
+        key = (vector.process_id, vector.index.get(vector.process_id, 0))
+
+        with self.lock:
+            if self.closed:
+                return
+
+            segment = self.segments[-1]
+            if not segment.fits(len(record)):
+                segment = self._rotate(len(record))
+
+            offset = segment.append(record)
+            segment.add(*key, offset)
+
+            self.pending += 1
+            if self.sync_count and self.pending >= self.sync_count:
+                self._sync()
+
+    def start_epoch(self, epoch):
+        """
+        Continues the log in the epoch the Process joined in. The records of another
+        epoch, or of an unknown one, are dropped, since their member IDs may belong to
+        other Processes now.
+
+        Parameters
+        ----------
+        epoch:  int
+            The node ID of the leader that assigned the member IDs
+        """
+        with self.lock:
+            if self.closed or epoch == self.epoch:
+                return
+
+            if any(len(segment) for segment in self.segments):
+                logger.info("Dropping the delivery log %s of epoch %s, continuing in "
+                            "epoch %s.", self.path, self.epoch, epoch)
+            for segment in self.segments:
+                self._drop(segment)
+            self.segments = [Segment(self._segment_path(0), 0, self.segment_size)]
+            self.pending = 0
+
+            path = os.path.join(self.path, EPOCH_FILE)
+            with open(path + ".tmp", "w") as file:
+                file.write(str(epoch))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(path + ".tmp", path)
+            self.epoch = epoch
+
+    def sync(self):
+        """
+        Writes the pending records to the disk.
+        """
+        with self.lock:
+            if not self.closed:
+                self._sync()
+
+    def get(self, process_id, counter):
+        """
+        Returns
+        -------
+        LogRecord
+            The latest record of the message of a Process with the given counter, None
+            if there is none or it was damaged on the disk
+        """
+        with self.lock:
+            location = self._find(process_id, counter)
+            if location is None:
+                return None
+            return self._record(*location)
+
+    def message(self, process_id, counter):
+        """
+        Returns
+        -------
+        bytes
+            The message of a Process with the given counter in the binary wire format,
+            as it was logged with its full Vector, None if there is none or it was
+            damaged on the disk
+        """
+        with self.lock:
+            location = self._find(process_id, counter)
+            if location is None:
+                return None
+            body = self._read(*location)
+            if body is None:
+                return None
+            return body[BODY.size:]
+
+    def latest(self):
+        """
+        Returns
+        -------
+        dict
+            The highest counter of the logged messages of every Process, by Process ID
+        """
+        latest = {}
+        with self.lock:
+            for segment in self.segments:
+                for process_id, (_, counter) in segment.ranges.items():
+                    if counter > latest.get(process_id, 0):
+                        latest[process_id] = counter
+
+        return latest
+
+    def records(self):
+        """
+        Returns
+        -------
+        generator
+            Every LogRecord in the order they were appended. A segment is read up to
+            the first record damaged on the disk, since the records after it cannot
+            be found without its length.
+        """
+        with self.lock:
+            segments = list(self.segments)
+
+        for segment in segments:
+            offset = 0
+            while True:
+                with self.lock:
+                    if (self.closed or segment not in self.segments
+                            or offset >= segment.end):
+                        break
+                    result = segment.read(offset)
+                    if result is None:
+                        logger.warning("Skipping the rest of the delivery log segment "
+                                       "%s after a damaged record at %d.",
+                                       segment.number, offset)
+                        break
+                    body, next_offset = result
+                    record = self._decode(body)
+                yield record
+                offset = next_offset
+
+    def close(self):
+        """
+        Syncs the log and closes its segments. Records appended afterwards are
+        dropped.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self._sync()
+            for segment in self.segments:
+                segment.close()
+
+    def _find(self, process_id, counter):
+        """
+        Returns
+        -------
+        tuple
+            The segment and offset of the latest record of the message of a Process
+            with the given counter, None if there is none
+        """
+        if self.closed:
+            return None
+
+        for segment in reversed(self.segments):
+            offset = segment.find(process_id, counter)
+            if offset is not None:
+                return segment, offset
+
+        return None
+
+    def _record(self, segment, offset):
+        body = self._read(segment, offset)
+        if body is None:
+            return None
+        return self._decode(body)
+
+    @staticmethod
+    def _read(segment, offset):
+        """
+        Returns
+        -------
+        bytes
+            The body of an indexed record, None if it was damaged on the disk since
+        """
+        result = segment.read(offset)
+        if result is None:
+            logger.warning("Damaged record at %d in the delivery log segment %s.",
+                           offset, segment.number)
+            return None
+        return result[0]
+
+    @staticmethod
+    def _decode(body):
+        kind, timestamp = BODY.unpack_from(body)
+        envelope = MessageFactory.unpack_binary(body[BODY.size:])
+        return LogRecord(kind, timestamp, envelope)
+
+    def _sync(self):
+        self.segments[-1].sync()
+        self.pending = 0
+
+    def _segment_path(self, number, suffix=SEGMENT_SUFFIX):
+        return os.path.join(self.path, f"{number:08d}{suffix}")
+
+    def _read_epoch(self):
+        try:
+            with open(os.path.join(self.path, EPOCH_FILE)) as file:
+                return int(file.read())
+        except (OSError, ValueError):
+            return None
+
+    def _open(self):
+        """
+        Opens the segments of an existing log. Sealed segments are indexed by their
+        index files, the last segment by its records, and appending continues in it. A
+        sealed segment without an index file, e.g. after a crash while it was sealed,
+        is indexed by its records and sealed again.
+        """
+        numbers = sorted(int(name[:-len(SEGMENT_SUFFIX)])
+                         for name in os.listdir(self.path)
+                         if name.endswith(SEGMENT_SUFFIX))
+        if not numbers:
+            self.segments.append(Segment(self._segment_path(0), 0, self.segment_size))
+            return
+
+        for number in numbers:
+            index_path = self._segment_path(number, INDEX_SUFFIX)
+            if number != numbers[-1] and os.path.exists(index_path):
+                segment = Segment(self._segment_path(number), number)
+                segment.load(index_path)
+            elif number != numbers[-1]:
+                segment = Segment(self._segment_path(number), number)
+                segment.scan()
+                segment.seal(index_path)
+            else:
+                # The last segment grows to the segment size again to append to it
+                segment = Segment(self._segment_path(number), number, self.segment_size)
+                segment.scan()
+                if os.path.exists(index_path):
+                    os.remove(index_path)
+            self.segments.append(segment)
+
+    def _rotate(self, length):
+        """
+        Seals the active segment and starts a new one, large enough for a record of
+        the given length. Drops the oldest segments beyond the retention.
+        """
+        sealed = self.segments[-1]
+        sealed.seal(self._segment_path(sealed.number, INDEX_SUFFIX))
+        self.pending = 0
+
+        number = sealed.number + 1
+        size = max(self.segment_size, length + RECORD.size)
+        segment = Segment(self._segment_path(number), number, size)
+        self.segments.append(segment)
+
+        while self.retention and len(self.segments) > self.retention:
+            self._drop(self.segments.pop(0))
+
+        return segment
+
+    def _drop(self, segment):
+        segment.close()
+        for suffix in (SEGMENT_SUFFIX, INDEX_SUFFIX):
+            path = self._segment_path(segment.number, suffix)
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,141 @@
+import logging
+
+from destinator.util.vector import Vector
+
+logger = logging.getLogger(__name__)
+
+
+class DeltaEncoder:
+    """
+    Turns the Vectors of outgoing messages into delta Vectors, which only hold the
+    entries that changed since the previous message of the Process. Every
+    keyframe_interval messages a full Vector (a keyframe) is sent instead, so that
+    receivers which missed a message can resynchronize.
+    """
+
+    def __init__(self, keyframe_interval):
+        self.keyframe_interval = keyframe_interval
+        self.last_index = {}
+        self.count = keyframe_interval
+
+    def encode(self, vector):
+        """
+        Parameters
+        ----------
+        vector: Vector
+            The full Vector of the outgoing message
+
+        Returns
+        -------
+        Vector
+            A delta Vector or, if a keyframe is due, a copy of the full Vector
+        """
+        index = vector.index
+
+        if self.count >= self.keyframe_interval:
+            self.count = 1
+            self.last_index = dict(index)
+            return Vector(vector.group_id, vector.process_id, self.last_index)
+
+        self.count += 1
+        last_index = self.last_index
+        changed = {process_id: counter for process_id, counter in index.items()
+                   if last_index.get(process_id) != counter}
+        self.last_index = dict(index)
+
+        return Vector(vector.group_id, vector.process_id, changed, delta=True)
+
+
+class DeltaDecoder:
+    """
+    Reconstructs the full Vectors of incoming messages. For every Process the full
+    Vectors of its latest history_size messages are kept, so that a delta Vector can
+    be applied to the Vector of the message preceding it even if messages are
+    reordered. Delta Vectors that arrive before their predecessor are held back until
+    the predecessor arrives or they become too old to ever be reconstructed.
+    """
+
+    def __init__(self, history_size=64):
+        self.history_size = history_size
+        self.history = {}
+        self.pending = {}
+
+    def resolve(self, vector, item):
+        """
+        Parameters
+        ----------
+        vector: Vector
+            The Vector received with a message, either full or delta
+        item:
+            The message the Vector was received with
+
+        Returns
+        -------
+        list
+            The (Vector, item) pairs with full Vectors which can be reconstructed now,
+            in the order in which the Process sent them
+        """
+        process_id = vector.process_id
+        counter = vector.index[process_id]
+        history = self.history.setdefault(process_id, {})
+        pending = self.pending.setdefault(process_id, {})
+
+        if vector.delta:
+            base = history.get(counter - 1)
+            if base is None:
+                pending[counter] = (vector, item)
+                return []
+            vector = self._apply(base, vector)
+
+        resolved = [(vector, item)]
+        self._remember(process_id, counter, vector.index)
+
+        while counter + 1 in pending:
+            delta, item = pending.pop(counter + 1)
+            vector = self._apply(vector.index, delta)
+            counter += 1
+
+            resolved.append((vector, item))
+            self._remember(process_id, counter, vector.index)
+
+        return resolved
+
+    def forget(self, process_id):
+        """
+        Drops the Vectors kept for a Process, e.g. after it was evicted. A Process
+        joining again starts over with its counter.
+        """
+        self.history.pop(process_id, None)
+        self.pending.pop(process_id, None)
+
+    @staticmethod
+    def _apply(base, delta):
+        """
+        Returns
+        -------
+        Vector
+            A full Vector made of a base index updated with the entries of a delta
+            Vector
+        """
+        index = dict(base)
+        index.update(delta.index)
+
+        return Vector(delta.group_id, delta.process_id, index)
+
+    def _remember(self, process_id, counter, index):
+        """
+        Stores the full index of a message and forgets the indexes and held back delta
+        Vectors which are older than history_size messages.
+        """
+        history = self.history[process_id]
+        history[counter] = index
+
+        oldest = counter - self.history_size
+        for old in [c for c in history if c <= oldest]:
+            del history[old]
+
+        pending = self.pending[process_id]
+        for old in [c for c in pending if c <= oldest]:
+            logger.warning("Dropped delta Vector %s of Process %s, whose predecessor was "
+                           "lost", old, process_id)
+            del pending[old]
@@ -0,0 +1,41 @@
+class Envelope:
+    """
+    A decoded message. Every received message is decoded into an Envelope exactly
+    once, which is then passed on to the handlers and delivered to the Device.
+    Envelopes are not modified after decoding.
+    """
+
+    __slots__ = ("vector", "type", "text", "received")
+
+    def __init__(self, vector, msg_type, text, received=None):
+        self.vector = vector
+        self.type = msg_type
+        self.text = text
+
+        # time.perf_counter() when the message was decoded, if metrics are timed
+        self.received = received
+
+    @property
+    def sender(self):
+        return self.vector.process_id
+
+    @property
+    def group_id(self):
+        return self.vector.group_id
+
+    def with_vector(self, vector):
+        """
+        Returns
+        -------
+        Envelope
+            The Envelope itself if it holds the given Vector, a copy holding the given
+            Vector otherwise
+        """
+        if vector is self.vector:
+            return self
+
+        return Envelope(vector, self.type, self.text, self.received)
+
+    def __repr__(self):
+        return (f"Envelope(group={self.group_id}, sender={self.sender}, "
+                f"type={self.type}, index={self.vector.index}, text={self.text!r})")
@@ -0,0 +1,71 @@
+import time
+
+
+def format_ids(process_ids):
+    """
+    Returns
+    -------
+    str
+        The text of an EVICT message listing Process IDs
+    """
+    return " ".join(str(process_id) for process_id in sorted(process_ids))
+
+
+def parse_ids(text):
+    """
+    Returns
+    -------
+    list
+        The Process IDs listed by an EVICT message
+    """
+    return [int(process_id) for process_id in text.split()]
+
+
+class FailureDetector:
+    """
+    Detects failed Processes by the time since their last message. Every message is a
+    sign of life, so a Process only sends a HEARTBEAT message when it did not send
+    anything for interval seconds. A Process is suspected once nothing was heard from
+    it for timeout seconds.
+    """
+
+    def __init__(self, interval, timeout):
+        self.interval = interval
+        self.timeout = timeout
+
+        # Process ID -> time the last message of the Process was received
+        self.last_heard = {}
+        self.last_sent = time.monotonic()
+
+    def heard(self, process_id):
+        self.last_heard[process_id] = time.monotonic()
+
+    def sent(self):
+        self.last_sent = time.monotonic()
+
+    def idle(self):
+        """
+        Returns
+        -------
+        bool
+            Whether a HEARTBEAT is due, since nothing was sent for interval seconds
+        """
+        return time.monotonic() - self.last_sent >= self.interval
+
+    def suspects(self, process_ids):
+        """
+        Returns
+        -------
+        list
+            The given Processes which were not heard from for timeout seconds. A
+            Process which was never heard from is given timeout seconds from its first
+            check.
+        """
+        now = time.monotonic()
+        last_heard = self.last_heard
+
+        return [process_id for process_id in process_ids
+                if now - last_heard.setdefault(process_id, now) >= self.timeout]
+
+    def forget(self, process_id):
+        self.last_heard.pop(process_id, None)
@@ -0,0 +1,115 @@
+import logging
+import random
+import time
+from collections import OrderedDict
+
+from destinator.factories.datagram_factory import DatagramFactory
+
+logger = logging.getLogger(__name__)
+
+
+class Fragmenter:
+    """
+    Splits outgoing messages that do not fit into a datagram of size bytes into
+    fragments.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.next_id = random.getrandbits(64)
+
+    def split(self, msg):
+        """
+        Parameters
+        ----------
+        msg:    bytes
+            The packed message
+
+        Returns
+        -------
+        list
+            The message itself if it fits into a datagram, its fragments otherwise
+        """
+        if len(msg) <= self.size:
+            return [msg]
+
+        msg_id = self.next_id
+        self.next_id = (self.next_id + 1) & 0xFFFFFFFFFFFFFFFF
+
+        return DatagramFactory.pack_fragments(msg, msg_id, self.size)
+
+
+class Reassembler:
+    """
+    Reassembles messages from their fragments. At most max_messages incomplete
+    messages are kept; the oldest one is evicted to make room for a new one.
+    Incomplete messages are evicted as well once their first fragment is older than
+    timeout seconds.
+    """
+
+    def __init__(self, max_messages, timeout):
+        self.max_messages = max_messages
+        self.timeout = timeout
+
+        self.incomplete = OrderedDict()
+
+    def __len__(self):
+        return len(self.incomplete)
+
+    def add(self, fragment):
+        """
+        Parameters
+        ----------
+        fragment:   bytes
+            A received fragment
+
+        Returns
+        -------
+        bytes
+            The reassembled message if the fragment completed it, None otherwise
+
+        Raises
+        ------
+        ValueError
+            If the fragment is malformed: its index is not below the number of
+            fragments, or the number differs from the earlier fragments of its
+            message, in which case the incomplete message is dropped as well
+        """
+        msg_id, number, count, part = DatagramFactory.unpack_fragment(fragment)
+        if not 0 <= number < count:
+            raise ValueError(f"Fragment {number} of {count} of message {msg_id}")
+
+        now = time.monotonic()
+        self._evict(now)
+
+        entry = self.incomplete.get(msg_id)
+        if entry is None:
+            if len(self.incomplete) >= self.max_messages:
+                old_id, _ = self.incomplete.popitem(last=False)
+                logger.warning("Evicted incomplete message %s to make room", old_id)
+            entry = (now, count, {})
+            self.incomplete[msg_id] = entry
+        elif entry[1] != count:
+            del self.incomplete[msg_id]
+            raise ValueError(f"Fragment of message {msg_id} with {count} fragments "
+                             f"instead of {entry[1]}")
+
+        _, _, parts = entry
+        parts[number] = bytes(part)
+        if len(parts) < count:
+            return None
+
+        del self.incomplete[msg_id]
+        return b"".join(parts[number] for number in range(count))
+
+    def _evict(self, now):
+        """
+        Evicts the incomplete messages whose first fragment arrived more than timeout
+        seconds ago.
+        """
+        while self.incomplete:
+            msg_id, (created, _, _) = next(iter(self.incomplete.items()))
+            if now - created < self.timeout:
+                return
+            del self.incomplete[msg_id]
+            logger.warning("Evicted incomplete message %s after timeout", msg_id)
@@ -0,0 +1,239 @@
+import heapq
+import itertools
+
+from destinator.util.clock_matrix import VECTORIZED, ClockMatrix, dependency
+
+
+class HoldBackQueue:
+    """
+    Hold-back queue for causal-order delivery.
+
+    A message from Process j with Vector V can be delivered once the local index L
+    satisfies L[j] == V[j] - 1 and L[k] >= V[k] for every other Process k. Every held
+    back message is indexed under a single entry of L it still waits for, in a heap
+    per Process ordered by the counter it needs. When an entry of L increases, only
+    the messages waiting for that entry are woken up and checked again, so a delivery
+    costs O(log n) in the number of held back messages instead of a rescan.
+
+    When at least scan_size messages are woken up at once, e.g. after a lost message
+    was retransmitted or a Process was evicted, they are checked together in a single
+    pass of a ClockMatrix instead of one by one. Without NumPy, checking them one by
+    one is faster, so scan_size is ignored then.
+    """
+
+    def __init__(self, index, scan_size=0):
+        self.index = index
+        self.scan_size = scan_size if VECTORIZED else 0
+
+        self.held = {}
+        self.waiting = {}
+        self._order = itertools.count()
+
+        # Processes evicted from the group, whose messages are dropped and which no
+        # message waits for
+        self.evicted = set()
+
+    def __len__(self):
+        return len(self.held)
+
+    def put(self, vector, item):
+        """
+        Adds a message to the hold-back queue.
+
+        Parameters
+        ----------
+        vector: Vector
+            The full Vector received with the message
+        item:
+            The message to hand back once it can be delivered
+
+        Returns
+        -------
+        list
+            The (Vector, item) pairs that can be delivered now in causal order. The
+            local index is already updated for each of them.
+        """
+        sender = vector.process_id
+        key = (sender, vector.index[sender])
+        if key in self.held or sender in self.evicted:
+            return []
+
+        self.held[key] = (vector, item)
+        return self._check([key])
+
+    def holds(self, vector):
+        """
+        Returns
+        -------
+        bool
+            Whether the message with the given Vector is held back
+        """
+        sender = vector.process_id
+        return (sender, vector.index[sender]) in self.held
+
+    def shed(self, oldest=False):
+        """
+        Drops a held back message, e.g. because the hold-back queue is full: the
+        oldest one or the one furthest ahead of the delivered messages of its sender,
+        which would be delivered last. The next message of every sender is kept, since
+        dropping it would block all later messages of the sender until it is received
+        again.
+
+        Returns
+        -------
+        tuple
+            The (Process ID, counter) pair of the dropped message, or None if every
+            held back message is the next one of its sender
+        """
+        index = self.index
+        keys = [key for key in self.held if key[1] > index.get(key[0], 0) + 1]
+        if not keys:
+            return None
+
+        if oldest:
+            key = keys[0]
+        else:
+            key = max(reversed(keys), key=lambda key: key[1] - index.get(key[0], 0))
+        del self.held[key]
+
+        return key
+
+    def advance(self, process_id):
+        """
+        Wakes up the messages waiting for the entry of a Process after the entry was
+        changed outside of the hold-back queue, e.g. when a Process joined.
+
+        Returns
+        -------
+        list
+            The (Vector, item) pairs that can be delivered now in causal order
+        """
+        return self._check(self._ready(process_id))
+
+    def evict(self, process_id):
+        """
+        Removes a Process from the local index and drops its held back messages.
+
+        Returns
+        -------
+        list
+            The (Vector, item) pairs that can be delivered now in causal order, since
+            they no longer wait for the Process
+        """
+        self.evicted.add(process_id)
+        self.index.pop(process_id, None)
+
+        for key in [key for key in self.held if key[0] == process_id]:
+            del self.held[key]
+
+        return self._check([entry[2] for entry in self.waiting.pop(process_id, ())])
+
+    def _check(self, keys):
+        """
+        Delivers the given messages if possible, and then every message that becomes
+        deliverable through them. Messages that are not deliverable are indexed under
+        the entry they wait for.
+        """
+        delivered = []
+
+        while keys:
+            if self.scan_size and len(keys) >= self.scan_size:
+                keys = self._scan(keys, delivered)
+                continue
+
+            key = keys.pop()
+            entry = self.held.get(key)
+            if entry is None:
+                continue
+
+            sender, counter = key
+            current = self.index.get(sender)
+            if current is not None and counter <= current:
+                # Duplicate of a message that was delivered already
+                del self.held[key]
+                continue
+
+            vector, item = entry
+            needed = dependency(vector, self.index, self.evicted)
+            if needed is not None:
+                self._wait(key, needed)
+                continue
+
+            del self.held[key]
+            self.index[sender] = counter
+            delivered.append(entry)
+            keys.extend(self._ready(sender))
+
+        return delivered
+
+    def _scan(self, keys, delivered):
+        """
+        Checks many messages in one pass. The deliverable ones are delivered, all
+        others are indexed under the entry they wait for. Messages from different
+        Processes which are deliverable at the same time are concurrent, so they can
+        be delivered in any order.
+
+        Returns
+        -------
+        list
+            The keys of the messages woken up by the delivered ones
+        """
+        held = self.held
+        index = self.index
+
+        candidates = []
+        for key in set(keys):
+            if key not in held:
+                continue
+            current = index.get(key[0])
+            if current is not None and key[1] <= current:
+                del held[key]
+                continue
+            candidates.append(key)
+
+        matrix = ClockMatrix([held[key][0] for key in candidates])
+        ready = []
+        for row, needed in enumerate(matrix.dependencies(index, self.evicted)):
+            if needed is None:
+                ready.append(row)
+            else:
+                self._wait(candidates[row], needed)
+
+        matrix.merge(ready, index, self.evicted)
+
+        woken = []
+        for row in ready:
+            key = candidates[row]
+            delivered.append(held.pop(key))
+            woken.extend(self._ready(key[0]))
+
+        return woken
+
+    def _wait(self, key, needed):
+        """
+        Indexes a held back message under the (Process ID, counter) pair it waits for.
+        """
+        process_id, counter_needed = needed
+        heap = self.waiting.setdefault(process_id, [])
+        heapq.heappush(heap, (counter_needed, next(self._order), key))
+
+    def _ready(self, process_id):
+        """
+        Removes the messages from the index whose awaited counter of a Process is
+        reached.
+
+        Returns
+        -------
+        list
+            The keys of the removed messages
+        """
+        heap = self.waiting.get(process_id)
+        current = self.index.get(process_id)
+        if not heap or current is None:
+            return []
+
+        keys = []
+        while heap and heap[0][0] <= current:
+            keys.append(heapq.heappop(heap)[2])
+
+        return keys
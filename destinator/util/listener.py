@@ -1,19 +1,31 @@
 import logging
+import select
+import socket
 import threading
 
+from destinator.const.timeouts import POLL_TIMEOUT
+from destinator.factories.datagram_factory import DatagramFactory
+from destinator.util.buffer_pool import ReceiveBatch
+
 MESSAGE_SIZE = 1024
 
 logger = logging.getLogger(__name__)
 
 
 class Listener(threading.Thread):
-    def __init__(self, sock, queue):
+    def __init__(self, queue, reassembler, metrics, pool=None):
         super().__init__()
         self.daemon = True
         self.cancelled = False
 
-        self.sock = sock
+        self.sock = None
         self.queue = queue
+        self.reassembler = reassembler
+        self.pool = pool
+
+        self.counter_datagrams = metrics.counter("datagrams_received")
+        self.counter_bytes = metrics.counter("bytes_received")
+        self.counter_invalid = metrics.counter("datagrams_invalid")
 
     def run(self):
         """
@@ -22,8 +34,126 @@ class Listener(threading.Thread):
         self.receive()
 
     def receive(self):
-        logger.debug(f"Thread {threading.get_ident()}: "
-                     f"Socket {self.sock}: Listener is now receiving.")
+        """
+        Waits until a package arrives on the socket and puts the messages it contains
+        into the Queue as a ReceiveBatch. Fragments are collected until their message
+        is complete. Waiting times out after POLL_TIMEOUT so that a cancelled Listener
+        stops. The socket itself stays blocking, since the Connector sends on it as well.
+
+        With a BufferPool, all packages that are ready are received into preallocated
+        buffers and handed over in a single ReceiveBatch per wakeup.
+        """
+        logger.debug("Thread %s: Socket %s: Listener is now receiving.",
+                     threading.get_ident(), self.sock)
         while not self.cancelled:
-            message = self.sock.recv(MESSAGE_SIZE)
-            self.queue.put(message)
+            readable, _, _ = select.select([self.sock], [], [], POLL_TIMEOUT)
+            if not readable:
+                continue
+
+            if self.pool is None:
+                batch = self._receive_one()
+            else:
+                batch = self._receive_ready()
+
+            if batch:
+                self.put(batch)
+
+    def _receive_one(self):
+        """
+        Receives a single package into a newly allocated buffer.
+
+        Returns
+        -------
+        ReceiveBatch
+            The messages contained in the package
+        """
+        datagram = self.sock.recv(MESSAGE_SIZE)
+        self._count(len(datagram))
+        return ReceiveBatch(self._split(datagram))
+
+    def datagram_received(self, datagram, addr):
+        """
+        Puts the messages of a package delivered by a TRANSPORT into the Queue. Used
+        instead of receive() if the Connector does not use a socket. The TRANSPORT
+        delivers to all Devices from one Thread, which never waits for room.
+        """
+        self._count(len(datagram))
+        batch = ReceiveBatch(self._split(datagram))
+        if batch:
+            self.put(batch, block=False)
+
+    def put(self, batch, block=True):
+        """
+        Hands over the messages received in one wakeup.
+
+        Parameters
+        ----------
+        batch:  ReceiveBatch
+            The received messages
+        block:  bool
+            Whether to wait for room in a full Queue with overloads.BLOCK. Threads
+            handing messages to several Devices pass False and drop the messages
+            instead, so that one slow Device does not stall the others.
+        """
+        if block:
+            self.queue.put(batch)
+        else:
+            self.queue.offer(batch)
+
+    def _receive_ready(self):
+        """
+        Receives all packages that are ready on the socket into buffers of the
+        BufferPool, without copying them. Stops when the socket has no more packages
+        or the pool has no free buffer left, in which case the remaining packages are
+        received in the next wakeup.
+
+        Returns
+        -------
+        ReceiveBatch
+            The messages contained in the packages, pointing into the buffers
+        """
+        msgs = []
+        buffers = []
+
+        while True:
+            buffer = self.pool.acquire()
+            try:
+                size = self.sock.recv_into(buffer, MESSAGE_SIZE, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                self.pool.release(buffer)
+                break
+
+            self._count(size)
+            buffers.append(buffer)
+            msgs.extend(self._split(memoryview(buffer)[:size]))
+            if not self.pool.buffers:
+                break
+
+        return ReceiveBatch(msgs, buffers, self.pool)
+
+    def _split(self, datagram):
+        """
+        Returns
+        -------
+        list
+            The complete messages contained in a package. A malformed package, e.g. an
+            empty or truncated one, is counted and dropped.
+        """
+        msgs = []
+        try:
+            for msg in DatagramFactory.unpack(datagram):
+                if DatagramFactory.is_fragment(msg):
+                    msg = self.reassembler.add(msg)
+                    if msg is None:
+                        continue
+                msgs.append(msg)
+        except ValueError as e:
+            self.counter_invalid.inc()
+            logger.warning("Dropped malformed datagram: %s", e)
+            return []
+
+        return msgs
+
+    def _count(self, size):
+        self.counter_datagrams.inc()
+        self.counter_bytes.inc(size)
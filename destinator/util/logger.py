@@ -1,14 +1,64 @@
+import atexit
 import logging
+import queue
 import sys
 import uuid
+from logging.handlers import QueueHandler, QueueListener
 
 
-def setup_logger(filename):
+# Types of log arguments which cannot change before the record is formatted
+IMMUTABLE = (str, int, float, bool, bytes, type(None))
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    A QueueHandler which hands the log records to the QueueListener with their
+    arguments. The standard QueueHandler formats every record on the logging Thread
+    so that it can be pickled; within one process, the record is formatted by the
+    Thread of the QueueListener instead. Only records whose arguments cannot change
+    in the meantime are passed on like this. The message of any other record, e.g.
+    one logging a Vector index, is formatted right away, so that it shows the state
+    at the time it was logged.
+    """
+
+    def prepare(self, record):
+        args = record.args
+        # A single mapping argument is kept as the arguments themselves
+        if args and (type(args) is not tuple
+                     or not all(type(arg) in IMMUTABLE for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def setup_logger(filename, background=False, level=logging.DEBUG, levels=None):
     """
-    Sets up a simple logger which logs to a 'output.log' file.
+    Sets up a simple logger which logs to a file and stdout.
+
+    Parameters
+    ----------
+    filename:   str
+        The file to log to, e.g. 'output.log'
+    background: bool
+        Whether the records are formatted and written by a background Thread, so that
+        logging Threads only put them into a Queue
+    level:      int
+        The level of the root logger
+    levels:     dict
+        Levels of single loggers by their name, e.g. {"destinator.handlers":
+        logging.WARNING}. Records below the level of their logger are discarded
+        before their message is formatted.
+
+    Returns
+    -------
+    QueueListener
+        The started QueueListener writing the records in the background, None if
+        they are written by the logging Threads. It is stopped at exit.
     """
     logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(level)
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
 
     fh = logging.FileHandler(filename)
     fh.setLevel(logging.DEBUG)
@@ -23,7 +73,17 @@ def setup_logger(filename):
     fh.setFormatter(formatter)
     ch.setFormatter(formatter)
 
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    listener = None
+    if background:
+        records = queue.SimpleQueue()
+        listener = QueueListener(records, fh, ch, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        logger.addHandler(LazyQueueHandler(records))
+    else:
+        logger.addHandler(fh)
+        logger.addHandler(ch)
 
     logger.info('Logger is created.')
+
+    return listener
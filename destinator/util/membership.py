@@ -0,0 +1,91 @@
+import random
+
+# Node IDs are drawn from the upper half of the 32 bit range, member IDs from the lower
+# half, so that both fit the same field on the wire and are never confused
+NODE_ID_MIN = 1 << 31
+
+
+def node_id():
+    """
+    Returns
+    -------
+    int
+        A random ID identifying a Process until the leader assigns it a member ID
+    """
+    return NODE_ID_MIN | random.getrandbits(31)
+
+
+def is_node_id(process_id):
+    return process_id >= NODE_ID_MIN
+
+
+def format_assignment(node, member, epoch):
+    """
+    Returns
+    -------
+    str
+        The text of a DISCOVERY_RESPONSE message assigning a member ID to a node ID,
+        followed by the epoch of the leader, see BaseMessageHandler.epoch
+    """
+    return f"{node} {member} {epoch}"
+
+
+def parse_assignment(text):
+    """
+    Returns
+    -------
+    tuple
+        The node ID, the member ID assigned to it and the epoch of the leader from a
+        DISCOVERY_RESPONSE message
+    """
+    node, member, epoch = text.split()
+    return int(node), int(member), int(epoch)
+
+
+class Membership:
+    """
+    Assigns dense member IDs to the Processes joining the group. The leader keeps it
+    and assigns the IDs in the order the Processes join, starting with itself at 1.
+    IDs are never reused, so an evicted Process joins again under a new ID and the
+    messages sent under its old ID stay dropped on every Process.
+    """
+
+    def __init__(self):
+        self.next_id = 1
+        # Node ID -> member ID, so that repeated DISCOVERY messages of a Process are
+        # answered with the same member ID
+        self.members = {}
+
+    def __len__(self):
+        return len(self.members)
+
+    def assign(self, node):
+        """
+        Parameters
+        ----------
+        node:   int
+            The node ID of the Process
+
+        Returns
+        -------
+        tuple
+            The member ID of the Process and whether it was assigned just now
+        """
+        member = self.members.get(node)
+        if member is not None:
+            return member, False
+
+        member = self.next_id
+        self.next_id += 1
+        self.members[node] = member
+
+        return member, True
+
+    def remove(self, member):
+        """
+        Forgets the node ID of an evicted Process, so that it is assigned a new member
+        ID when it joins again.
+        """
+        for node in [node for node, assigned in self.members.items()
+                     if assigned == member]:
+            del self.members[node]
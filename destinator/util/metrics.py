@@ -0,0 +1,259 @@
+import bisect
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (in seconds) of the Histogram buckets, from 1 microsecond to ~17 seconds
+BUCKETS = [1e-6 * 2 ** exponent for exponent in range(25)]
+
+
+class Counter:
+    """
+    A monotonically increasing count. Increments are not locked; a concurrent
+    increment may rarely be lost, which is acceptable for statistics.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    """
+    Counts observed durations in exponentially growing buckets.
+    """
+
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction):
+        """
+        Returns
+        -------
+        float
+            The upper bound of the bucket holding the given quantile, None if nothing
+            was observed
+        """
+        if not self.count:
+            return None
+
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+
+        return float("inf")
+
+    def merge(self, other):
+        """
+        Adds the observations of another Histogram, e.g. one of another process.
+        """
+        self.counts = [count + other_count
+                       for count, other_count in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Metrics:
+    """
+    The counters, histograms and gauges of a Device. Counters are always kept, since
+    they are cheap. Durations are only measured and observed in histograms if timing
+    is enabled; callers check the timing attribute before reading the clock. Gauges
+    are functions which are only called when a snapshot is taken.
+    """
+
+    def __init__(self, timing=False, labels=None):
+        self.timing = timing
+        self.labels = labels or {}
+
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def counter(self, name):
+        """
+        Returns
+        -------
+        Counter
+            The Counter with the given name, which is created if it does not exist
+        """
+        counter = self.counters.get(name)
+        if counter is None:
+            counter = self.counters[name] = Counter()
+
+        return counter
+
+    def histogram(self, name):
+        """
+        Returns
+        -------
+        Histogram
+            The Histogram with the given name, which is created if it does not exist
+        """
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+
+        return histogram
+
+    def gauge(self, name, function):
+        """
+        Registers a function returning the current value of a gauge.
+        """
+        self.gauges[name] = function
+
+    def snapshot(self):
+        """
+        Returns
+        -------
+        dict
+            The current values of all counters, histograms and gauges
+        """
+        return {
+            "counters": {name: counter.value for name, counter in self.counters.items()},
+            "histograms": {name: histogram.snapshot()
+                           for name, histogram in self.histograms.items()},
+            "gauges": {name: function() for name, function in self.gauges.items()},
+        }
+
+
+class MetricsExporter(threading.Thread):
+    """
+    Periodically writes the Metrics of all registered Devices into a file in the
+    Prometheus text format, e.g. for the textfile collector of the node exporter.
+    The file is replaced atomically, so readers never see a partial file.
+    """
+
+    PREFIX = "destinator_"
+
+    _exporters = {}
+    _lock = threading.Lock()
+
+    def __init__(self, path, interval):
+        super().__init__()
+        self.daemon = True
+        self.cancelled = False
+
+        self.path = path
+        self.interval = interval
+        self.metrics = []
+        self.wakeup = threading.Event()
+
+    @classmethod
+    def register(cls, path, interval, metrics):
+        """
+        Adds Metrics to the exporter writing to the given path. Exporters are shared
+        by all Devices of the process; an exporter is started for every new path.
+        """
+        with cls._lock:
+            exporter = cls._exporters.get(path)
+            if exporter is None:
+                exporter = cls._exporters[path] = MetricsExporter(path, interval)
+                exporter.start()
+            exporter.metrics.append(metrics)
+
+    @classmethod
+    def unregister(cls, path, metrics):
+        """
+        Removes Metrics from the exporter writing to the given path. The exporter
+        writes the file a last time and stops once it has no Metrics left.
+        """
+        with cls._lock:
+            exporter = cls._exporters.get(path)
+            if exporter is None or metrics not in exporter.metrics:
+                return
+            exporter.export()
+            exporter.metrics.remove(metrics)
+            if not exporter.metrics:
+                del cls._exporters[path]
+                exporter.cancelled = True
+                exporter.wakeup.set()
+
+    def run(self):
+        while not self.cancelled:
+            self.wakeup.wait(self.interval)
+            if not self.cancelled:
+                self.export()
+
+    def export(self):
+        """
+        Writes the current Metrics into the file.
+        """
+        try:
+            text = self.render(list(self.metrics))
+            temporary = f"{self.path}.tmp"
+            with open(temporary, "w") as file:
+                file.write(text)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            logger.warning("Could not export metrics to %s: %s", self.path, e)
+
+    @classmethod
+    def render(cls, all_metrics):
+        """
+        Returns
+        -------
+        str
+            The given Metrics in the Prometheus text format
+        """
+        families = {}
+
+        def add(family, kind, name, labels, value):
+            _, samples = families.setdefault(cls.PREFIX + family, (kind, []))
+            samples.append((cls.PREFIX + name, labels, value))
+
+        for metrics in all_metrics:
+            labels = metrics.labels
+            for name, counter in list(metrics.counters.items()):
+                add(name, "counter", f"{name}_total", labels, counter.value)
+            for name, function in list(metrics.gauges.items()):
+                # A failing gauge must not keep the other metrics from being exported
+                try:
+                    value = function()
+                except Exception as e:
+                    logger.debug("Could not read the gauge %s: %r", name, e)
+                    continue
+                add(name, "gauge", name, labels, value)
+            for name, histogram in list(metrics.histograms.items()):
+                seen = 0
+                for bound, count in zip(BUCKETS + [None], list(histogram.counts)):
+                    seen += count
+                    le = "+Inf" if bound is None else f"{bound:.6g}"
+                    add(name, "histogram", f"{name}_bucket", {**labels, "le": le}, seen)
+                add(name, "histogram", f"{name}_sum", labels, histogram.sum)
+                add(name, "histogram", f"{name}_count", labels, histogram.count)
+
+        lines = []
+        for family, (kind, samples) in families.items():
+            lines.append(f"# TYPE {family} {kind}")
+            for name, labels, value in samples:
+                text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f"{name}{{{text}}} {value}")
+
+        return "\n".join(lines) + "\n"
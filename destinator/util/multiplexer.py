@@ -0,0 +1,130 @@
+import logging
+import threading
+import time
+
+from destinator.factories.message_factory import MessageFactory
+from destinator.factories.socket_factory import SocketFactory
+from destinator.util.buffer_pool import BufferPool, ReceiveBatch
+from destinator.util.fragments import Reassembler
+from destinator.util.listener import MESSAGE_SIZE, Listener
+from destinator.util.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+def decode(msgs, group=None):
+    """
+    Decodes received messages into Envelopes, which are shared by all Devices
+    receiving them. Messages that cannot be decoded are dropped, and so are binary
+    messages of other groups before they are decoded.
+
+    Parameters
+    ----------
+    msgs:   iterable
+        The received messages
+    group:  bytes
+        The packed ID of the group the messages were received for, see
+        MessageFactory.group_key()
+
+    Returns
+    -------
+    list
+        The Envelopes of the messages
+    """
+    envelopes = []
+    received = time.perf_counter()
+
+    for msg in msgs:
+        if group is not None and not MessageFactory.in_group(msg, group):
+            continue
+        try:
+            envelope = MessageFactory.unpack(msg)
+        except ValueError as e:
+            logger.warning("Dropped message that could not be decoded: %s", e)
+            continue
+
+        envelope.received = received
+        envelopes.append(envelope)
+
+    return envelopes
+
+
+class Multiplexer(Listener):
+    """
+    A Listener on a multicast socket shared by all threaded Devices of the process
+    which are in the same Category. Every package is received, reassembled and
+    decoded once and the resulting Envelopes are handed to the Listeners of all
+    subscribed Devices. The Devices send on the shared socket as well.
+    """
+
+    _multiplexers = {}
+    _lock = threading.Lock()
+
+    def __init__(self, category, config):
+        reassembler = Reassembler(config.REASSEMBLY_BUFFER, config.REASSEMBLY_TIMEOUT)
+        pool = None
+        if config.RECEIVE_BUFFERS:
+            pool = BufferPool(config.RECEIVE_BUFFERS, MESSAGE_SIZE)
+
+        super().__init__(None, reassembler, Metrics(), pool)
+        self.key = (category.MCAST_ADDR, category.MCAST_PORT)
+        self.group = MessageFactory.group_key(category.MCAST_ADDR)
+        self.sock = SocketFactory.create_socket(*self.key)
+        self.subscribers = []
+
+    @classmethod
+    def subscribe(cls, listener, category, config):
+        """
+        Subscribes the Listener of a Device to the Multiplexer of its Category, which
+        is started by its first subscriber.
+
+        Returns
+        -------
+        Multiplexer
+            The Multiplexer of the Category
+        """
+        key = (category.MCAST_ADDR, category.MCAST_PORT)
+        with cls._lock:
+            multiplexer = cls._multiplexers.get(key)
+            if multiplexer is None:
+                multiplexer = cls._multiplexers[key] = Multiplexer(category, config)
+                multiplexer.start()
+            multiplexer.subscribers = multiplexer.subscribers + [listener]
+
+        return multiplexer
+
+    def unsubscribe(self, listener):
+        """
+        Removes a Listener. The Multiplexer stops and closes its socket once it has no
+        subscribers left.
+        """
+        with self._lock:
+            if listener not in self.subscribers:
+                return
+            self.subscribers = [other for other in self.subscribers if other is not listener]
+            if not self.subscribers:
+                del self._multiplexers[self.key]
+                self.cancelled = True
+
+    def run(self):
+        super().run()
+        self.sock.close()
+
+    def put(self, batch):
+        """
+        Decodes the messages received in one wakeup and hands the Envelopes to all
+        subscribed Listeners. A Listener whose Queue is full drops them rather than
+        stalling the other Listeners.
+        """
+        envelopes = decode(batch, self.group)
+        batch.release()
+        if not envelopes:
+            return
+
+        batch = ReceiveBatch(envelopes)
+        for listener in self.subscribers:
+            listener.put(batch, block=False)
+
+    def _count(self, size):
+        for listener in self.subscribers:
+            listener._count(size)
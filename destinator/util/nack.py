@@ -0,0 +1,271 @@
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def format_ranges(keys):
+    """
+    Encodes (Process ID, counter) pairs as the text of a NACK message, which holds one
+    "process_id:first-last" range per run of consecutive counters.
+
+    Returns
+    -------
+    str
+        The text of the NACK message
+    """
+    ranges = []
+    for process_id, counter in sorted(keys):
+        if ranges and ranges[-1][0] == process_id and ranges[-1][2] == counter - 1:
+            ranges[-1][2] = counter
+        else:
+            ranges.append([process_id, counter, counter])
+
+    return " ".join(f"{process_id}:{first}-{last}" for process_id, first, last in ranges)
+
+
+def parse_ranges(text):
+    """
+    Decodes the text of a NACK message.
+
+    Returns
+    -------
+    list
+        The (Process ID, first counter, last counter) ranges the NACK reports missing
+    """
+    ranges = []
+    for item in text.split():
+        process_id, _, counters = item.partition(":")
+        first, _, last = counters.partition("-")
+        ranges.append((int(process_id), int(first), int(last)))
+
+    return ranges
+
+
+class RetransmitBuffer:
+    """
+    Keeps the latest messages a Process sent, by their counter, so that they can be
+    retransmitted when another Process reports them missing. Holds at most count
+    messages of size bytes in total; the oldest messages are dropped first.
+
+    A message is retransmitted at most once per holdoff seconds, so that the NACKs
+    of many Processes missing the same message cause a single retransmission.
+    """
+
+    def __init__(self, count, size, holdoff):
+        self.count = count
+        self.size = size
+        self.holdoff = holdoff
+
+        self.msgs = OrderedDict()
+        self.msgs_size = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.msgs)
+
+    def clear(self):
+        with self.lock:
+            self.msgs.clear()
+            self.msgs_size = 0
+
+    def add(self, counter, msg):
+        """
+        Stores a sent message.
+
+        Parameters
+        ----------
+        counter:    int
+            The counter of the sending Process in the Vector of the message
+        msg:        bytes
+            The packed message
+        """
+        with self.lock:
+            self.msgs[counter] = [msg, None]
+            self.msgs_size += len(msg)
+
+            while self.msgs and (len(self.msgs) > self.count
+                                 or self.msgs_size > self.size):
+                _, (old, _) = self.msgs.popitem(last=False)
+                self.msgs_size -= len(old)
+
+    def retransmit(self, first, last):
+        """
+        Returns
+        -------
+        list
+            The stored messages with counters between first and last which were not
+            retransmitted within the last holdoff seconds
+        """
+        now = time.monotonic()
+        msgs = []
+
+        with self.lock:
+            if not self.msgs:
+                return msgs
+
+            # Messages are stored in the order of their counters, so the range is cut
+            # to the stored ones, however large a NACK reports it
+            first = max(first, next(iter(self.msgs)))
+            last = min(last, next(reversed(self.msgs)))
+            for counter in range(first, last + 1):
+                entry = self.msgs.get(counter)
+                if entry is None:
+                    continue
+
+                msg, retransmitted = entry
+                if retransmitted is not None and now - retransmitted < self.holdoff:
+                    continue
+
+                entry[1] = now
+                msgs.append(msg)
+
+        return msgs
+
+
+class NackTracker:
+    """
+    Tracks the messages a Process found missing and reports them with NACKs.
+
+    A missing message is reported after a random delay between delay and twice of it.
+    If another Process reports the same message in the meantime, the own report is
+    postponed by interval, since the retransmission will reach this Process as well.
+    All messages due are reported in a single NACK. Messages are reported again every
+    interval seconds and given up after retries reports.
+    """
+
+    def __init__(self, delay, interval, retries, present, send, call_later):
+        self.delay = delay
+        self.interval = interval
+        self.retries = retries
+
+        # Functions checking whether a message arrived, sending a NACK text and
+        # scheduling a callback
+        self.present = present
+        self.send = send
+        self.call_later = call_later
+
+        # (Process ID, counter) -> [due time, number of reports]
+        self.missing = {}
+        # Process ID -> highest counter that was checked, so that the messages of a
+        # long gap are only checked once
+        self.checked = {}
+        self.timer = None
+        self.timer_due = None
+
+    def __len__(self):
+        return len(self.missing)
+
+    def add(self, process_id, first, last):
+        """
+        Marks the messages of a Process with counters between first and last as
+        missing, unless they are present or were checked before.
+        """
+        checked = self.checked.get(process_id, 0)
+        if last <= checked:
+            return
+        first = max(first, checked + 1)
+        self.checked[process_id] = last
+
+        now = time.monotonic()
+        earliest = None
+
+        for counter in range(first, last + 1):
+            key = (process_id, counter)
+            if key in self.missing or self.present(key):
+                continue
+
+            due = now + self.delay * (1 + random.random())
+            self.missing[key] = [due, 0]
+            if earliest is None or due < earliest:
+                earliest = due
+
+        if earliest is not None:
+            self._schedule(earliest)
+
+    def retry(self, process_id, counter):
+        """
+        Marks a message as missing again which was received but dropped afterwards,
+        e.g. from a full hold-back queue, even though it was checked before. Its
+        reports start over, since the message did arrive.
+        """
+        key = (process_id, counter)
+        due = time.monotonic() + self.delay * (1 + random.random())
+        self.missing[key] = [due, 0]
+        self._schedule(due)
+
+    def suppress(self, ranges):
+        """
+        Postpones the reports of missing messages another Process reported.
+
+        Parameters
+        ----------
+        ranges: list
+            The (Process ID, first counter, last counter) ranges of the other NACK
+        """
+        due = time.monotonic() + self.interval
+        missing = self.missing
+
+        for process_id, first, last in ranges:
+            if last - first >= len(missing):
+                keys = [key for key in missing if key[0] == process_id
+                        and first <= key[1] <= last]
+            else:
+                keys = [(process_id, counter) for counter in range(first, last + 1)]
+
+            for key in keys:
+                entry = missing.get(key)
+                if entry is not None and entry[0] < due:
+                    entry[0] = due
+
+    def report(self):
+        """
+        Sends a NACK for all missing messages that are due, forgets the messages that
+        arrived or were given up and schedules the next report.
+        """
+        self.timer = None
+        self.timer_due = None
+        now = time.monotonic()
+        due_keys = []
+
+        for key, entry in list(self.missing.items()):
+            if self.present(key):
+                del self.missing[key]
+                continue
+            if entry[0] > now:
+                continue
+            if entry[1] >= self.retries:
+                logger.warning("Gave up message %s of Process %s after %s NACKs", key[1],
+                               key[0], entry[1])
+                del self.missing[key]
+                continue
+
+            entry[0] = now + self.interval
+            entry[1] += 1
+            due_keys.append(key)
+
+        if due_keys:
+            self.send(format_ranges(due_keys))
+
+        if self.missing:
+            self._schedule(min(entry[0] for entry in self.missing.values()))
+
+    def forget(self, process_id):
+        """
+        Stops tracking the messages of a Process, e.g. after it was evicted.
+        """
+        self.checked.pop(process_id, None)
+        for key in [key for key in self.missing if key[0] == process_id]:
+            del self.missing[key]
+
+    def _schedule(self, due):
+        if self.timer is not None:
+            if self.timer_due <= due:
+                return
+            self.timer.cancel()
+
+        self.timer_due = due
+        self.timer = self.call_later(max(0, due - time.monotonic()), self.report)
@@ -0,0 +1,281 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from destinator.util.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class Transport(ABC):
+    """
+    Interface of a transport which replaces the multicast sockets of the Connectors.
+    A transport is set as TRANSPORT in the Config and shared by all Devices using it.
+    """
+
+    @abstractmethod
+    def open(self, addr, port, name, receive, loop=None):
+        """
+        Joins the multicast group on the given address and port.
+
+        Parameters
+        ----------
+        addr:       str
+            The multicast address of the Category
+        port:       int
+            The multicast port of the Category
+        name:       str
+            The name of the joining Device, which identifies its links
+        receive:    function
+            Called with (datagram, addr) for every datagram sent to the group by
+            another endpoint
+        loop:       AbstractEventLoop
+            The event loop on which receive is called. Without a loop, receive is
+            called on a Thread of the transport.
+
+        Returns
+        -------
+        Endpoint
+            An object with sendto(datagram, addr) and close(), like a socket
+        """
+
+
+class Link:
+    """
+    The conditions on the way from one endpoint to another. Every datagram is
+    delayed by latency plus a uniformly distributed jitter (in seconds), lost with
+    probability loss and delivered a second time with probability duplicate. With
+    probability reorder, a datagram skips the latency and overtakes the datagrams
+    sent before it.
+    """
+
+    __slots__ = ("latency", "jitter", "loss", "duplicate", "reorder")
+
+    def __init__(self, latency=0.0, jitter=0.0, loss=0.0, duplicate=0.0, reorder=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.duplicate = duplicate
+        self.reorder = reorder
+
+    def delays(self, rng):
+        """
+        Decides the fate of a single datagram.
+
+        Parameters
+        ----------
+        rng:    Random
+            The random number generator of the sending endpoint
+
+        Returns
+        -------
+        list
+            The delays after which a copy of the datagram is delivered, empty if the
+            datagram is lost
+        """
+        if self.loss and rng.random() < self.loss:
+            return []
+
+        delays = [self._delay(rng)]
+        if self.duplicate and rng.random() < self.duplicate:
+            delays.append(self._delay(rng))
+
+        return delays
+
+    def _delay(self, rng):
+        if self.reorder and rng.random() < self.reorder:
+            return 0.0
+
+        delay = self.latency
+        if self.jitter:
+            delay += rng.random() * self.jitter
+
+        return delay
+
+
+class SimulatedEndpoint:
+    """
+    The membership of a Device in a multicast group of a SimulatedNetwork.
+    """
+
+    def __init__(self, network, group, name, receive, loop):
+        self.network = network
+        self.group = group
+        self.name = name
+        self.receive = receive
+        self.loop = loop
+        self.thread = threading.get_ident()
+        self.rng = random.Random(f"{network.seed}:{name}")
+        self.closed = False
+
+    def sendto(self, datagram, addr):
+        self.network.send(self, bytes(datagram), addr)
+
+    def close(self):
+        self.network.close(self)
+
+
+class SimulatedNetwork(Transport):
+    """
+    An in-process network connecting Devices without sockets, e.g. to run thousands
+    of Devices in a single process or to test them under bad network conditions.
+
+    The conditions of every link are given by the default Link, unless a Link is set
+    for the pair of endpoints with set_link(). The fate of the n-th datagram sent by
+    an endpoint only depends on the seed and the name of the endpoint, so a run with
+    the same seed, names and sending order reproduces the same losses and delays.
+
+    Datagrams are not delivered back to their sender. Datagrams for asynchronous
+    Devices are delivered on their event loop, all others on a single delivery Thread.
+    """
+
+    def __init__(self, link=None, seed=None):
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+            logger.info("SimulatedNetwork uses the seed %s", seed)
+
+        self.seed = seed
+        self.link = link or Link()
+        self.links = {}
+        self.groups = {}
+
+        self.counter_sent = Counter()
+        self.counter_lost = Counter()
+        self.counter_duplicated = Counter()
+
+        self.lock = threading.Condition()
+        self.scheduled = []
+        self.sequence = itertools.count()
+        self.thread = None
+        self.threaded_endpoints = 0
+
+    def set_link(self, src, dst, link):
+        """
+        Sets the conditions of the link from the endpoint named src to the endpoint
+        named dst. Either name may be None to set the link from or to all endpoints.
+        """
+        self.links[(src, dst)] = link
+
+    def get_link(self, src, dst):
+        """
+        Returns
+        -------
+        Link
+            The conditions of the link from the endpoint named src to dst
+        """
+        links = self.links
+        if not links:
+            return self.link
+
+        return (links.get((src, dst)) or links.get((src, None))
+                or links.get((None, dst)) or self.link)
+
+    def open(self, addr, port, name, receive, loop=None):
+        endpoint = SimulatedEndpoint(self, (addr, port), name, receive, loop)
+
+        with self.lock:
+            self.groups.setdefault(endpoint.group, []).append(endpoint)
+            if loop is None:
+                self.threaded_endpoints += 1
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, daemon=True)
+                    self.thread.start()
+
+        return endpoint
+
+    def close(self, endpoint):
+        """
+        Removes an endpoint from its group. The delivery Thread stops with the last
+        threaded endpoint.
+        """
+        with self.lock:
+            if endpoint.closed:
+                return
+            endpoint.closed = True
+
+            self.groups[endpoint.group].remove(endpoint)
+            if endpoint.loop is None:
+                self.threaded_endpoints -= 1
+                if not self.threaded_endpoints:
+                    self.thread = None
+                    self.lock.notify()
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+            The number of sent, lost and duplicated datagram copies
+        """
+        return {"sent": self.counter_sent.value,
+                "lost": self.counter_lost.value,
+                "duplicated": self.counter_duplicated.value}
+
+    def send(self, src, datagram, addr):
+        """
+        Schedules the delivery of a datagram to all other endpoints of the group.
+        """
+        receivers = self.groups.get(addr)
+        if not receivers:
+            return
+
+        for dst in list(receivers):
+            if dst is src:
+                continue
+
+            self.counter_sent.inc()
+            delays = self.get_link(src.name, dst.name).delays(src.rng)
+            if not delays:
+                self.counter_lost.inc()
+                continue
+            if len(delays) > 1:
+                self.counter_duplicated.inc()
+
+            for delay in delays:
+                if dst.loop is None:
+                    self._schedule(delay, dst, datagram, addr)
+                elif dst.thread == threading.get_ident():
+                    dst.loop.call_later(delay, self._deliver, dst, datagram, addr)
+                else:
+                    dst.loop.call_soon_threadsafe(dst.loop.call_later, delay,
+                                                  self._deliver, dst, datagram, addr)
+
+    def _schedule(self, delay, dst, datagram, addr):
+        with self.lock:
+            entry = (time.monotonic() + delay, next(self.sequence), dst, datagram, addr)
+            heapq.heappush(self.scheduled, entry)
+            if self.scheduled[0] is entry:
+                self.lock.notify()
+
+    def _run(self):
+        """
+        Delivers the scheduled datagrams of threaded endpoints when they are due.
+        """
+        thread = threading.current_thread()
+
+        while True:
+            with self.lock:
+                while self.thread is thread:
+                    if not self.scheduled:
+                        self.lock.wait()
+                        continue
+
+                    timeout = self.scheduled[0][0] - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self.lock.wait(timeout)
+                else:
+                    return
+
+                _, _, dst, datagram, addr = heapq.heappop(self.scheduled)
+
+            self._deliver(dst, datagram, addr)
+
+    @staticmethod
+    def _deliver(dst, datagram, addr):
+        if not dst.closed:
+            dst.receive(datagram, addr)
@@ -0,0 +1,236 @@
+import asyncio
+import queue
+import threading
+import time
+
+import destinator.const.messages as messages
+import destinator.const.overloads as overloads
+from destinator.const.timeouts import POLL_TIMEOUT
+from destinator.factories.message_factory import MessageFactory
+from destinator.util.buffer_pool import ReceiveBatch
+from destinator.util.envelope import Envelope
+
+
+def priority(item):
+    """
+    Returns
+    -------
+    int
+        1 for control messages, which are kept over DATA messages when a queue sheds
+        by priority, 0 otherwise. A ReceiveBatch has the highest priority of its
+        messages; an empty one only wakes up the MessageHandler and is kept.
+    """
+    if type(item) is Envelope:
+        return int(item.type != messages.DATA)
+    if type(item) is ReceiveBatch:
+        return max((priority(msg) for msg in item.msgs), default=1)
+
+    return int(MessageFactory.is_control(item))
+
+
+def victim(items, item, policy):
+    """
+    Chooses the item to drop when a new item is put into a full queue.
+
+    Parameters
+    ----------
+    items:  deque
+        The queued items, oldest first
+    item:
+        The new item
+    policy: str
+        overloads.DROP_OLDEST drops the oldest item, overloads.SHED the oldest item
+        with the lowest priority. Any other policy drops the new item.
+
+    Returns
+    -------
+    int
+        The position of the queued item to drop, or None if the new item is dropped
+    """
+    if policy == overloads.DROP_OLDEST:
+        return 0
+    if policy != overloads.SHED:
+        return None
+
+    new = priority(item)
+    position = None
+    lowest = new
+    for index, queued in enumerate(items):
+        queued_priority = priority(queued)
+        if queued_priority < lowest or (position is None and queued_priority == new):
+            position, lowest = index, queued_priority
+            if lowest == 0:
+                break
+
+    return position
+
+
+def drop(item, counter):
+    """
+    Counts a dropped item and recycles the buffers of a dropped ReceiveBatch.
+    """
+    if counter is not None:
+        counter.inc()
+    if type(item) is ReceiveBatch:
+        item.release()
+
+
+class BoundedQueue(queue.Queue):
+    """
+    A Queue holding at most size items, 0 for no limit. When it is full, the overload
+    policy decides what happens to a new item: with overloads.BLOCK the producer waits
+    for room, the other policies drop an item right away. Dropped items are counted
+    with the given Counter.
+
+    A closed queue stops blocking producers, so that stopped Threads do not wait for
+    a consumer which is gone; their items are dropped instead. Producers shared by
+    several queues use offer(), which never waits. Since put() may wait for the
+    consumer, it must not be called while holding a lock, which the consumer might
+    wait for in turn.
+    """
+
+    def __init__(self, size=0, policy=overloads.BLOCK, counter=None):
+        super().__init__(size)
+        self.policy = policy
+        self.counter = counter
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def offer(self, item):
+        """
+        Puts an item into the queue without ever waiting for room, for producers
+        shared by several consumers, which must not stall all of them for one full
+        queue. With overloads.BLOCK the new item is dropped if the queue is full, the
+        other policies apply as usual.
+        """
+        if self.policy != overloads.BLOCK:
+            self.put(item)
+            return
+
+        try:
+            super().put(item, block=False)
+        except queue.Full:
+            drop(item, self.counter)
+
+    def put(self, item, block=True, timeout=None):
+        """
+        Puts an item into the queue, applying the overload policy if it is full.
+        With block=False or a timeout, it behaves like Queue.put() instead.
+        """
+        if self.maxsize <= 0 or not block or timeout is not None:
+            super().put(item, block, timeout)
+            return
+
+        if self.policy == overloads.BLOCK:
+            while True:
+                try:
+                    super().put(item, timeout=POLL_TIMEOUT)
+                    return
+                except queue.Full:
+                    if self.closed:
+                        drop(item, self.counter)
+                        return
+
+        with self.mutex:
+            if self._qsize() >= self.maxsize:
+                position = victim(self.queue, item, self.policy)
+                if position is None:
+                    drop(item, self.counter)
+                    return
+
+                # The new item takes the place of the dropped one in the task count
+                dropped = self.queue[position]
+                del self.queue[position]
+                drop(dropped, self.counter)
+                self._put(item)
+                self.not_empty.notify()
+                return
+
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+
+class AsyncBoundedQueue(asyncio.Queue):
+    """
+    Counterpart of BoundedQueue for asynchronous Devices. Producers on the event loop
+    cannot wait for room, so with overloads.BLOCK the new item is dropped.
+    """
+
+    def __init__(self, size=0, policy=overloads.BLOCK, counter=None):
+        super().__init__(size)
+        self.policy = policy
+        self.counter = counter
+
+    def close(self):
+        pass
+
+    def put_nowait(self, item):
+        """
+        Puts an item into the queue, applying the overload policy if it is full.
+        """
+        if self.maxsize <= 0 or not self.full():
+            super().put_nowait(item)
+            return
+
+        position = victim(self._queue, item, self.policy)
+        if position is None:
+            drop(item, self.counter)
+            return
+
+        dropped = self._queue[position]
+        del self._queue[position]
+        drop(dropped, self.counter)
+        self.task_done()
+        super().put_nowait(item)
+
+
+class TokenBucket:
+    """
+    Limits a rate of events to rate per second, allowing bursts of up to burst events.
+    Tokens are refilled continuously and every event takes one.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token, possibly one which is only refilled in the future.
+
+        Returns
+        -------
+        float
+            Seconds until the taken token is refilled, 0 if one was available
+        """
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def take(self):
+        """
+        Returns
+        -------
+        bool
+            Whether a token was available and taken
+        """
+        with self.lock:
+            self._refill()
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
@@ -0,0 +1,119 @@
+import ipaddress
+import threading
+
+from destinator.const.groups import Category
+
+# Multicast addresses are assigned to new Categories upwards from the address of the
+# first predefined Category, on its port
+FIRST_ADDR = "224.1.1.1"
+DEFAULT_PORT = 6001
+
+
+class GroupRegistry:
+    """
+    The Categories Devices can take part in, by name. Categories defined as
+    subclasses of Category are known from the start; further Categories are
+    registered at runtime. Every Category has its own multicast address, so that a
+    Device only receives the traffic of the groups it subscribed to.
+    """
+
+    _categories = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def register(cls, name, addr=None, port=DEFAULT_PORT):
+        """
+        Registers a Category. Registering a name again returns the known Category if
+        the address and port match.
+
+        Parameters
+        ----------
+        name:   str
+            The name of the Category
+        addr:   str
+            The multicast address of the Category, the next free one if None
+        port:   int
+            The multicast port of the Category
+
+        Returns
+        -------
+        Category
+            The registered Category
+        """
+        with cls._lock:
+            categories = cls._known()
+            category = categories.get(name)
+            if category is not None:
+                if addr not in (None, category.MCAST_ADDR) or port != category.MCAST_PORT:
+                    raise ValueError(f"Category {name} is registered with "
+                                     f"{category.MCAST_ADDR}:{category.MCAST_PORT}")
+                return category
+
+            used = {category.MCAST_ADDR for category in categories.values()}
+            if addr is None:
+                addr = ipaddress.IPv4Address(FIRST_ADDR)
+                while str(addr) in used:
+                    addr += 1
+                addr = str(addr)
+            elif addr in used:
+                raise ValueError(f"Multicast address {addr} is used by another Category")
+            if not ipaddress.IPv4Address(addr).is_multicast:
+                raise ValueError(f"{addr} is not a multicast address")
+
+            category = type(name, (Category,), {"NAME": name, "MCAST_ADDR": addr,
+                                                "MCAST_PORT": port})
+            categories[name] = category
+
+        return category
+
+    @classmethod
+    def get(cls, name):
+        """
+        Returns
+        -------
+        Category
+            The Category with the given name
+
+        Raises
+        ------
+        KeyError
+            If no Category with the name is known
+        """
+        with cls._lock:
+            return cls._known()[name]
+
+    @classmethod
+    def categories(cls):
+        """
+        Returns
+        -------
+        dict
+            All known Categories by name
+        """
+        with cls._lock:
+            return dict(cls._known())
+
+    @classmethod
+    def _known(cls):
+        """
+        Adds the Categories defined as subclasses of Category since the last call.
+        """
+        for category in Category.__subclasses__():
+            if category.NAME is not None:
+                cls._categories.setdefault(category.NAME, category)
+
+        return cls._categories
+
+
+def resolve(categories):
+    """
+    Returns
+    -------
+    list
+        The Categories given as Category, name or a list of them
+    """
+    if isinstance(categories, (str, type)):
+        categories = [categories]
+
+    return [GroupRegistry.get(category) if isinstance(category, str) else category
+            for category in categories]
@@ -0,0 +1,146 @@
+def format_order(first_seq, keys):
+    """
+    Encodes the sequence numbers assigned to messages as the text of an ORDER message:
+    the first sequence number followed by one "process_id:first-last" range per run of
+    consecutive messages of a Process, in the order of their sequence numbers.
+
+    Parameters
+    ----------
+    first_seq:  int
+        The sequence number of the first message
+    keys:       list
+        The (Process ID, counter) pairs of the messages in sequence order
+
+    Returns
+    -------
+    str
+        The text of the ORDER message
+    """
+    ranges = []
+    for process_id, counter in keys:
+        if ranges and ranges[-1][0] == process_id and ranges[-1][2] == counter - 1:
+            ranges[-1][2] = counter
+        else:
+            ranges.append([process_id, counter, counter])
+
+    return " ".join([str(first_seq)] + [f"{process_id}:{first}-{last}"
+                                        for process_id, first, last in ranges])
+
+
+def parse_order(text, limit=None):
+    """
+    Decodes the text of an ORDER message.
+
+    Parameters
+    ----------
+    text:   str
+        The text of the ORDER message
+    limit:  int
+        The maximum number of messages an ORDER message orders, the ORDER_BATCH of the
+        sequencer. None does not limit it.
+
+    Returns
+    -------
+    tuple
+        The first sequence number and the (Process ID, counter) pairs of the messages
+        in sequence order
+
+    Raises
+    ------
+    ValueError
+        If the text is not a valid ORDER message or orders more than limit messages
+    """
+    items = text.split()
+    if not items:
+        raise ValueError("ORDER message without a sequence number")
+
+    keys = []
+    for item in items[1:]:
+        process_id, _, counters = item.partition(":")
+        first, _, last = counters.partition("-")
+        process_id, first, last = int(process_id), int(first), int(last)
+        if last < first:
+            raise ValueError(f"Invalid range {item} in ORDER message")
+        # Checked before the range is expanded, however large it is
+        if limit is not None and len(keys) + last - first >= limit:
+            raise ValueError(f"ORDER message orders more than {limit} messages")
+        keys.extend((process_id, counter) for counter in range(first, last + 1))
+
+    return int(items[0]), keys
+
+
+class Sequencer:
+    """
+    Assigns global sequence numbers to messages in the order the leader receives them,
+    keeping the order in which every Process sent its messages. The assignments are
+    collected into batches, which are announced in a single ORDER message each.
+    """
+
+    def __init__(self, batch_size, index):
+        self.batch_size = batch_size
+        self.next_seq = 0
+
+        # Process ID -> counter of the last sequenced message. Processes which joined
+        # later start at their entry in the Vector index of the leader.
+        self.index = index
+        self.sequenced = dict(index)
+
+        self.batch = []
+        self.batch_seq = 0
+
+    def __len__(self):
+        return len(self.batch)
+
+    def expects(self, process_id, counter):
+        """
+        Returns
+        -------
+        bool
+            Whether the message is the next one of its Process to be sequenced. The first
+            message received from an unknown Process is accepted.
+        """
+        last = self.sequenced.get(process_id)
+        if last is None:
+            last = self.index.get(process_id)
+
+        return last is None or counter == last + 1
+
+    def assign(self, key):
+        """
+        Assigns the next sequence number to a message.
+
+        Parameters
+        ----------
+        key:    tuple
+            The (Process ID, counter) pair of the message
+
+        Returns
+        -------
+        int
+            The sequence number
+        """
+        if not self.batch:
+            self.batch_seq = self.next_seq
+
+        seq = self.next_seq
+        self.next_seq += 1
+        self.sequenced[key[0]] = key[1]
+        self.batch.append(key)
+
+        return seq
+
+    def flush(self):
+        """
+        Returns
+        -------
+        str
+            The text of the ORDER message announcing the current batch, or None if the
+            batch is empty
+        """
+        if not self.batch:
+            return None
+
+        text = format_order(self.batch_seq, self.batch)
+        self.batch = []
+
+        return text
@@ -0,0 +1,94 @@
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+    """
+    A callback scheduled with Timers. Cancelled Timers are skipped when they are due.
+    """
+
+    __slots__ = ("callback", "cancelled")
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Timers:
+    """
+    Callbacks scheduled on a Thread which runs them between handling messages. Timers
+    must only be scheduled on that Thread, except with call_soon_threadsafe().
+    """
+
+    def __init__(self):
+        self.scheduled = []
+        self.ready = deque()
+        self._order = itertools.count()
+
+    def call_soon_threadsafe(self, callback):
+        """
+        Schedules a callback from any Thread to be run on the next run().
+        """
+        self.ready.append(callback)
+
+    def call_later(self, delay, callback):
+        """
+        Schedules a callback.
+
+        Parameters
+        ----------
+        delay:      float
+            Seconds after which the callback is due
+        callback:   function
+            Called without arguments
+
+        Returns
+        -------
+        Timer
+            The Timer, which can be cancelled
+        """
+        timer = Timer(callback)
+        heapq.heappush(self.scheduled, (time.monotonic() + delay, next(self._order), timer))
+        return timer
+
+    def run(self):
+        """
+        Runs all callbacks that are due. A callback that fails is logged, and the
+        other callbacks run nonetheless.
+
+        Returns
+        -------
+        float
+            Seconds until the next callback is due, or None if none is scheduled
+        """
+        ready = self.ready
+        while ready:
+            self._call(ready.popleft())
+
+        scheduled = self.scheduled
+        now = time.monotonic()
+
+        while scheduled and scheduled[0][0] <= now:
+            _, _, timer = heapq.heappop(scheduled)
+            if not timer.cancelled:
+                self._call(timer.callback)
+
+        if not scheduled:
+            return None
+
+        return max(0, scheduled[0][0] - time.monotonic())
+
+    @staticmethod
+    def _call(callback):
+        try:
+            callback()
+        except Exception:
+            logger.exception("Failed to run the Timer callback %r.", callback)
@@ -0,0 +1,187 @@
+import logging
+import queue
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import destinator.const.messages as messages
+from destinator.const.timeouts import POLL_TIMEOUT
+from destinator.factories.message_factory import MessageFactory
+
+logger = logging.getLogger(__name__)
+
+# Events recorded in a trace
+SEND = 0
+RECEIVE = 1
+DELIVER = 2
+EVENT_NAMES = {SEND: "send", RECEIVE: "receive", DELIVER: "deliver"}
+
+# Start of every trace file, followed by the version of the format
+MAGIC = b"DTRC"
+VERSION = 1
+
+# Event, wall clock time, ID of the recording Process, length of the message
+RECORD = struct.Struct("!BdII")
+
+TraceEvent = namedtuple("TraceEvent", ["event", "timestamp", "recorder", "envelope"])
+
+
+class TraceWriter(threading.Thread):
+    """
+    Writes a compact binary trace of the messages the Devices of the process send,
+    receive and deliver. Every record holds the event, its time, the ID of the
+    recording Process and the message in the binary wire format without its text.
+    Records are packed on the recording Thread, since the Vectors change afterwards,
+    and written to the file in batches on the Thread of the TraceWriter.
+
+    Like the MetricsExporter, a TraceWriter is shared by all Devices of the process
+    writing to the same path. Traces are decoded offline with read_trace() or with
+    python -m destinator.util.trace <path>.
+    """
+
+    _writers = {}
+    _lock = threading.Lock()
+
+    def __init__(self, path):
+        super().__init__()
+        self.daemon = True
+        self.cancelled = False
+
+        self.path = path
+        self.devices = []
+        self.records = queue.SimpleQueue()
+
+        self.file = open(path, "wb")
+        self.file.write(MAGIC + bytes([VERSION]))
+
+    @classmethod
+    def register(cls, path, device):
+        """
+        Returns
+        -------
+        TraceWriter
+            The TraceWriter writing to the given path, which is started if no other
+            Device of the process writes to it
+        """
+        with cls._lock:
+            writer = cls._writers.get(path)
+            if writer is None:
+                writer = cls._writers[path] = TraceWriter(path)
+                writer.start()
+            writer.devices.append(device)
+
+        return writer
+
+    @classmethod
+    def unregister(cls, path, device):
+        """
+        Removes a Device from the TraceWriter writing to the given path. The writer
+        writes the remaining records and closes the file once no Device is left.
+        """
+        with cls._lock:
+            writer = cls._writers.get(path)
+            if writer is None or device not in writer.devices:
+                return
+            writer.devices.remove(device)
+            if not writer.devices:
+                del cls._writers[path]
+                writer.cancelled = True
+
+    def record(self, event, recorder, vector, msg_type):
+        """
+        Records a message event.
+
+        Parameters
+        ----------
+        event:      int
+            SEND, RECEIVE or DELIVER
+        recorder:   int
+            The ID of the recording Process
+        vector:     Vector
+            The Vector of the message
+        msg_type:   str
+            The message type
+        """
+        msg = MessageFactory.pack_binary(vector, "", msg_type)
+        self.records.put(RECORD.pack(event, time.time(), recorder, len(msg)) + msg)
+
+    def run(self):
+        while not self.cancelled:
+            self.write(POLL_TIMEOUT)
+        self.write()
+        self.file.close()
+
+    def write(self, timeout=None):
+        """
+        Writes all queued records, waiting up to timeout seconds for the first one.
+        """
+        records = []
+        try:
+            if timeout is not None:
+                records.append(self.records.get(timeout=timeout))
+            while True:
+                records.append(self.records.get_nowait())
+        except queue.Empty:
+            pass
+
+        if records:
+            try:
+                self.file.write(b"".join(records))
+                self.file.flush()
+            except OSError as e:
+                logger.warning("Could not write trace to %s: %s", self.path, e)
+
+
+def message_type(text, msg_type=None):
+    """
+    Returns
+    -------
+    str
+        The type of a sent message, derived from its text like MessageFactory does if
+        not given
+    """
+    if msg_type is not None:
+        return msg_type
+    return text if text in MessageFactory.TYPES else messages.DATA
+
+
+def read_trace(path):
+    """
+    Decodes a trace written by a TraceWriter.
+
+    Returns
+    -------
+    generator
+        A TraceEvent per record, in the order they were written. The Envelopes carry
+        no text, except for the name of their type for control messages.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a trace")
+    if data[len(MAGIC)] != VERSION:
+        raise ValueError(f"Unsupported trace version {data[len(MAGIC)]}")
+
+    offset = len(MAGIC) + 1
+    # The last record may be incomplete if the process was killed while writing
+    while offset + RECORD.size <= len(data):
+        event, timestamp, recorder, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + length > len(data):
+            break
+
+        envelope = MessageFactory.unpack_binary(data[offset:offset + length])
+        offset += length
+        yield TraceEvent(event, timestamp, recorder, envelope)
+
+
+if __name__ == '__main__':
+    for trace_event in read_trace(sys.argv[1]):
+        envelope = trace_event.envelope
+        print(f"{trace_event.timestamp:.6f} {trace_event.recorder} "
+              f"{EVENT_NAMES[trace_event.event]} {envelope.type} {envelope.group_id} "
+              f"{envelope.sender} {envelope.vector.index}"
+              f"{' delta' if envelope.vector.delta else ''}")
@@ -1,9 +1,105 @@
 class Vector:
-    def __init__(self, group_id, process_id, index):
+    """
+    A vector timestamp: the number of messages of every Process in the group, by the
+    member IDs the leader assigned to the Processes. Member IDs are small and dense,
+    so the index stays compact. It is a dict rather than an array by member ID, since
+    delta and total-order Vectors only hold some of the entries, evicted Processes
+    leave gaps and Processes without a leader count under their node IDs. Bulk
+    comparisons of many Vectors use the packed index instead, see ClockMatrix.
+    """
+
+    __slots__ = ("group_id", "process_id", "index", "delta", "packed")
+
+    def __init__(self, group_id, process_id, index, delta=False, packed=None):
         self.group_id = group_id
         self.process_id = process_id
         self.index = index
 
+        # A delta Vector only holds the entries of the index that changed since the
+        # previous message of the Process. See destinator.util.delta
+        self.delta = delta
+
+        # The index as received in the binary format, the process IDs followed by the
+        # counters as big-endian 32 bit integers, if kept. See ClockMatrix
+        self.packed = packed
+
+    def increment(self):
+        """
+        Increments the counter of the own Process.
+
+        Returns
+        -------
+        int
+            The new counter
+        """
+        counter = self.index[self.process_id] + 1
+        self.index[self.process_id] = counter
+        return counter
+
+    def merge(self, other):
+        """
+        Raises every entry of the index to the entry of another Vector, if that is
+        higher. Entries of Processes missing from the index are added.
+
+        Parameters
+        ----------
+        other:  Vector
+            The Vector to merge into this one
+        """
+        index = self.index
+        for process_id, counter in other.index.items():
+            if counter > index.get(process_id, 0):
+                index[process_id] = counter
+
+    def compare(self, other):
+        """
+        Compares two Vectors by the happens-before relation. Missing entries count as
+        0.
+
+        Parameters
+        ----------
+        other:  Vector
+            The Vector to compare with
+
+        Returns
+        -------
+        int
+            -1 if this Vector happened before the other one, 1 if it happened after
+            it, 0 if both are equal and None if they are concurrent
+        """
+        index = self.index
+        other_index = other.index
+        before = after = False
+
+        for process_id in index.keys() | other_index.keys():
+            counter = index.get(process_id, 0)
+            other_counter = other_index.get(process_id, 0)
+            if counter < other_counter:
+                before = True
+            elif counter > other_counter:
+                after = True
+            if before and after:
+                return None
+
+        if before:
+            return -1
+        if after:
+            return 1
+        return 0
+
+    def to_json(self):
+        """
+        Returns
+        -------
+        dict
+            The Group ID, Process ID and index of the Vector object as JSON data
+        """
+        return {
+            "group_id": self.group_id,
+            "process_id": self.process_id,
+            "index": self.index,
+        }
+
     @staticmethod
     def from_json(data):
         """
@@ -19,9 +115,18 @@ class Vector:
         Vector
             A new Vector object with the Group ID, Process ID, and index retrieved from
             the JSON data
+
+        Raises
+        ------
+        ValueError
+            If the data lacks a field of the Vector or holds a field of another type
         """
-        group_id = data["group_id"]
-        process_id = data["process_id"]
-        index = {int(k): int(v) for k, v in data["index"].items()}
+        group_id = data.get("group_id")
+        process_id = data.get("process_id")
+        index = data.get("index")
+        if (not isinstance(group_id, str) or type(process_id) is not int
+                or not isinstance(index, dict)):
+            raise ValueError(f"Invalid Vector data: {data}")
+        index = {int(k): int(v) for k, v in index.items()}
 
         return Vector(group_id, process_id, index)
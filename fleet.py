@@ -0,0 +1,438 @@
+"""
+Runs a fleet of Devices spread over a pool of worker processes.
+
+run.py and benchmark.py host every Device in one interpreter, so the whole group
+shares one GIL and one core. Here a coordinator starts a number of worker processes,
+assigns the Devices of every Category to them and lets every worker host its share
+of the Devices. The workers talk to each other over multicast sockets like Devices on
+different hosts would; within a worker, the Devices of a Category share one socket.
+
+The coordinator starts the leaders of all Categories first, then the other Devices,
+lets every Device send messages of a given size at a given rate for a given duration
+and finally collects the statistics of every worker. The results are written to a
+JSON file like the ones of benchmark.py.
+
+Example:
+    python fleet.py --workers 4 --devices 100 --rate 2 --duration 10 --mode async
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import time
+
+import destinator.const.modes as modes
+import destinator.const.orderings as orderings
+from benchmark import BenchmarkDevice, Driver, joined
+from destinator.config import Config
+from destinator.util.metrics import Histogram
+from destinator.util.registry import GroupRegistry
+
+logger = logging.getLogger(__name__)
+
+# Commands of the coordinator to the workers
+START_LEADERS = "start_leaders"
+START_MEMBERS = "start_members"
+RUN = "run"
+STOP = "stop"
+
+# Seconds the coordinator waits for a worker to answer a command
+COMMAND_TIMEOUT = 60
+
+
+def categories(names):
+    """
+    Returns
+    -------
+    dict
+        The Categories with the given names by name. Unknown names are registered in
+        the same order in every worker, so that they get the same multicast address.
+    """
+    return {name: GroupRegistry.register(name) for name in names}
+
+
+def assign(args):
+    """
+    Spreads the Devices of every Category evenly over the workers. The leaders of the
+    Categories are placed on different workers where possible, since a leader does
+    more work than the other Devices.
+
+    Returns
+    -------
+    list
+        Per worker, the (Category name, leader) pairs of the Devices it hosts
+    """
+    assignment = [[] for _ in range(args.workers)]
+    for offset, name in enumerate(args.categories):
+        for number in range(args.devices):
+            worker = (offset + number) % args.workers
+            assignment[worker].append((name, number == 0))
+
+    return assignment
+
+
+def create_config(args):
+    """
+    Returns
+    -------
+    Config
+        A Config subclass holding the settings given on the command line. It is
+        created in every worker, since Config subclasses are not passed between
+        processes.
+    """
+
+    class FleetConfig(Config):
+        MODE = modes.ASYNC if args.mode == "async" else modes.THREADED
+        # All Devices of a Category in a worker share one socket
+        SHARED_SOCKET = True
+        RETRANSMIT_BUFFER = args.retransmit_buffer
+        ORDERING = orderings.TOTAL if args.ordering == "total" else orderings.CAUSAL
+        DISCOVERY_TIMEOUT = args.discovery_timeout
+        FAILURE_TIMEOUT = args.failure_timeout
+        BATCH_SIZE = args.batch_size
+
+    return FleetConfig
+
+
+class Worker:
+    """
+    The Devices hosted by one worker process. The coordinator controls it with
+    commands sent over a Pipe and receives its statistics in return.
+    """
+
+    def __init__(self, worker_id, assignment, args, connection):
+        self.worker_id = worker_id
+        self.args = args
+        self.connection = connection
+        self.driver = None
+
+        config = create_config(args)
+        category_by_name = categories(args.categories)
+        self.leaders = []
+        self.members = []
+        for name, leader in assignment:
+            device = BenchmarkDevice(category_by_name[name], config)
+            device.communicator.message_handler.leader = leader
+            (self.leaders if leader else self.members).append(device)
+        self.devices = self.leaders + self.members
+
+    def result(self):
+        """
+        Returns
+        -------
+        dict
+            The statistics of the worker: messages sent and delivered per Category,
+            the delivery latencies as Histogram and the CPU time of the process
+        """
+        driver = self.driver
+        cpu = time.process_time() - driver.cpu_start
+        elapsed = time.monotonic() - driver.start
+
+        latencies = Histogram()
+        sent = {}
+        delivered = {}
+        for device in self.devices:
+            name = device.category.NAME
+            sent[name] = sent.get(name, 0) + device.sent
+            delivered[name] = delivered.get(name, 0) + device.delivered
+            for latency in device.latencies:
+                latencies.observe(latency)
+
+        return {
+            "worker": self.worker_id,
+            "pid": os.getpid(),
+            "devices": len(self.devices),
+            "leaders": len(self.leaders),
+            "joined": sum(device.join_time() is not None for device in self.devices),
+            "duration": driver.duration,
+            "sent": sent,
+            "delivered": delivered,
+            "latencies": latencies,
+            "cpu_seconds": cpu,
+            "cpu_utilization": cpu / elapsed,
+            "hold_back_depth": driver.sampler.result(),
+            "counters": driver.counters(),
+        }
+
+
+def serve_threaded(worker):
+    """
+    Answers the commands of the coordinator for a worker of threaded Devices.
+    """
+    args = worker.args
+    connection = worker.connection
+
+    while True:
+        command = connection.recv()
+        if command == START_LEADERS:
+            [device.start() for device in worker.leaders]
+            connection.send(len(worker.leaders))
+
+        elif command == START_MEMBERS:
+            [device.start() for device in worker.members]
+            deadline = time.monotonic() + args.warmup
+            while not joined(worker.devices) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            connection.send(sum(device.join_time() is not None
+                                for device in worker.devices))
+
+        elif command == RUN:
+            [device.reset() for device in worker.devices]
+            worker.driver = Driver(args, worker.devices)
+            delay = worker.driver.step()
+            while delay is not None:
+                time.sleep(delay)
+                delay = worker.driver.step()
+            time.sleep(args.settle)
+            connection.send(worker.result())
+
+        elif command == STOP:
+            [device.stop() for device in worker.devices]
+            [device.join() for device in worker.devices if device.is_alive()]
+            connection.send(None)
+            return
+
+
+async def serve_async(worker):
+    """
+    Answers the commands of the coordinator for a worker of asynchronous Devices,
+    which all run on the event loop of the worker.
+    """
+    args = worker.args
+    connection = worker.connection
+    loop = asyncio.get_running_loop()
+    tasks = []
+
+    while True:
+        command = await loop.run_in_executor(None, connection.recv)
+        if command == START_LEADERS:
+            tasks += [asyncio.create_task(device.run_async())
+                      for device in worker.leaders]
+            connection.send(len(worker.leaders))
+
+        elif command == START_MEMBERS:
+            tasks += [asyncio.create_task(device.run_async())
+                      for device in worker.members]
+            deadline = time.monotonic() + args.warmup
+            while not joined(worker.devices) and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            connection.send(sum(device.join_time() is not None
+                                for device in worker.devices))
+
+        elif command == RUN:
+            [device.reset() for device in worker.devices]
+            worker.driver = Driver(args, worker.devices)
+            delay = worker.driver.step()
+            while delay is not None:
+                await asyncio.sleep(delay)
+                delay = worker.driver.step()
+            await asyncio.sleep(args.settle)
+            connection.send(worker.result())
+
+        elif command == STOP:
+            [device.stop() for device in worker.devices]
+            await asyncio.gather(*tasks, return_exceptions=True)
+            connection.send(None)
+            return
+
+
+def work(worker_id, assignment, args, connection):
+    """
+    Entry point of a worker process.
+    """
+    logging.basicConfig(level=args.log_level)
+    worker = Worker(worker_id, assignment, args, connection)
+
+    if args.mode == "async":
+        asyncio.run(serve_async(worker))
+    else:
+        serve_threaded(worker)
+
+
+class Coordinator:
+    """
+    Starts the worker processes, steps them through the phases of a run and collects
+    their statistics.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.workers = []
+
+    def start(self):
+        # Spawned workers do not inherit the Threads of the coordinator
+        context = multiprocessing.get_context("spawn")
+
+        for worker_id, assignment in enumerate(assign(self.args)):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target=work, name=f"worker-{worker_id}",
+                                      args=(worker_id, assignment, self.args,
+                                            worker_connection))
+            process.start()
+            self.workers.append((process, connection))
+
+    def command(self, command):
+        """
+        Sends a command to every worker and waits for all of them to answer.
+
+        Returns
+        -------
+        list
+            The answers of the workers
+        """
+        for _, connection in self.workers:
+            connection.send(command)
+
+        answers = []
+        for process, connection in self.workers:
+            if not connection.poll(COMMAND_TIMEOUT):
+                raise RuntimeError(f"{process.name} did not answer {command}")
+            answers.append(connection.recv())
+
+        return answers
+
+    def run(self):
+        """
+        Runs the fleet.
+
+        Returns
+        -------
+        dict
+            The statistics of every worker and of the whole fleet
+        """
+        self.start()
+        try:
+            self.command(START_LEADERS)
+            joined_devices = sum(self.command(START_MEMBERS))
+            logger.info("%d Devices joined", joined_devices)
+            workers = self.command(RUN)
+            self.command(STOP)
+        finally:
+            for process, _ in self.workers:
+                process.join(COMMAND_TIMEOUT)
+                if process.is_alive():
+                    process.terminate()
+
+        return summarize(self.args, workers)
+
+
+def summarize(args, workers):
+    """
+    Returns
+    -------
+    dict
+        The statistics of the workers with their latencies as quantiles and the
+        totals of the fleet. Every message is expected to be delivered by every other
+        Device of its Category.
+    """
+    latencies = Histogram()
+    sent = {}
+    delivered = {}
+    counters = {}
+    for worker in workers:
+        latencies.merge(worker["latencies"])
+        worker["latencies"] = latency_ms(worker["latencies"])
+        for name, count in worker["sent"].items():
+            sent[name] = sent.get(name, 0) + count
+        for name, count in worker["delivered"].items():
+            delivered[name] = delivered.get(name, 0) + count
+        for name, value in worker["counters"].items():
+            counters[name] = counters.get(name, 0) + value
+
+    expected = sum(count * (args.devices - 1) for count in sent.values())
+    duration = max(worker["duration"] for worker in workers)
+
+    return {
+        "workers": workers,
+        "total": {
+            "devices": sum(worker["devices"] for worker in workers),
+            "joined": sum(worker["joined"] for worker in workers),
+            "sent": sum(sent.values()),
+            "delivered": sum(delivered.values()),
+            "delivery_ratio": sum(delivered.values()) / expected if expected else None,
+            "sent_per_second": sum(sent.values()) / duration,
+            "delivered_per_second": sum(delivered.values()) / duration,
+            "latency_ms": latency_ms(latencies),
+            "cpu_seconds": sum(worker["cpu_seconds"] for worker in workers),
+            "counters": counters,
+        },
+    }
+
+
+def latency_ms(histogram):
+    """
+    Returns
+    -------
+    dict
+        The quantiles of the latencies in a Histogram in milliseconds, rounded up to
+        the bounds of its buckets
+    """
+    return {name: None if value is None else value * 1000
+            for name, value in (("p50", histogram.quantile(0.5)),
+                                ("p90", histogram.quantile(0.9)),
+                                ("p99", histogram.quantile(0.99)))}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="number of worker processes")
+    parser.add_argument("--devices", type=int, default=20,
+                        help="number of Devices per Category")
+    parser.add_argument("--categories", nargs="+",
+                        default=list(GroupRegistry.categories()),
+                        help="names of the Categories to start Devices for, unknown "
+                             "ones are registered")
+    parser.add_argument("--rate", type=float, default=1,
+                        help="messages per second sent by every Device")
+    parser.add_argument("--payload", type=int, default=100,
+                        help="size of a message text in bytes")
+    parser.add_argument("--duration", type=float, default=10,
+                        help="seconds to send messages for")
+    parser.add_argument("--mode", choices=["threaded", "async"], default="async")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="maximum size of a batched datagram, 0 disables batching")
+    parser.add_argument("--retransmit-buffer", type=int, default=0,
+                        help="number of own messages kept for NACKs, 0 disables NACKs")
+    parser.add_argument("--ordering", choices=["causal", "total"], default="causal",
+                        help="order in which messages are delivered")
+    parser.add_argument("--discovery-timeout", type=float, default=1,
+                        help="seconds a Device waits for the leader to answer DISCOVERY")
+    parser.add_argument("--failure-timeout", type=float, default=0,
+                        help="seconds after which silent Devices are evicted, 0 disables")
+    parser.add_argument("--settle", type=float, default=1,
+                        help="seconds to wait for outstanding deliveries")
+    parser.add_argument("--log-level", default="WARNING",
+                        help="logging level of the workers")
+    parser.add_argument("--output", default="fleet.json",
+                        help="file the results are written to as JSON")
+    args = parser.parse_args()
+    args.workers = max(1, min(args.workers, args.devices * len(args.categories)))
+    args.warmup = args.discovery_timeout + 0.5 + args.devices * 0.01
+
+    return args
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=args.log_level)
+    results = Coordinator(args).run()
+
+    report = {
+        "timestamp": time.time(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "settings": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    print(json.dumps(results["total"], indent=2))
+
+
+if __name__ == '__main__':
+    main()
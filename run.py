@@ -2,19 +2,27 @@ import random
 import time
 
 import destinator.const.groups as group
+from destinator.config import Config
 from destinator.device import Device
 from destinator.util.logger import setup_logger
 
 COUNT_DEVICES = 10
 ACTIVE_THREADS = 2
 
+
+class RunConfig(Config):
+    # All Devices run in this process, so they share one socket
+    SHARED_SOCKET = True
+
+
 if __name__ == '__main__':
-    setup_logger('output.log')
+    setup_logger('output.log', background=True)
 
-    leader = Device(group.Temperature)
+    leader = Device(group.Temperature, RunConfig)
     leader.communicator.message_handler.leader = True
 
-    devices = [leader] + [Device(group.Temperature) for _ in range(ACTIVE_THREADS)]
+    devices = [leader] + [Device(group.Temperature, RunConfig)
+                          for _ in range(ACTIVE_THREADS)]
     [device.start() for device in devices]
 
     time.sleep(6)
@@ -0,0 +1,196 @@
+import destinator.const.messages as messages
+from destinator.util.catchup import CatchUp, format_request, parse_request
+from destinator.util.envelope import Envelope
+from destinator.util.vector import Vector
+from tests.base import TestBase
+
+OWN = 1
+
+
+class CatchUpConfig:
+    CATCHUP_CHUNK = 2
+    CATCHUP_PEERS = 2
+    CATCHUP_TIMEOUT = 0.1
+    CATCHUP_RETRIES = 2
+
+
+def envelope(sender, counter, dependencies=()):
+    """
+    Returns a DATA message of a Process, which depends on the given counters of other
+    Processes by their ID.
+    """
+    index = {2: 0, 3: 0, 4: 0}
+    index.update(dependencies)
+    index[sender] = counter
+    vector = Vector("group", sender, index)
+    return Envelope(vector, messages.DATA, f"{sender}-{counter}")
+
+
+class TestCatchUp(TestBase):
+    def setUp(self):
+        self.sent = []
+        self.delivered = []
+        self.finished = 0
+        self.timers = []
+
+    def create(self, snapshot, start=None, evicted=()):
+        self.catch_up = CatchUp(OWN, snapshot, start or {}, evicted, CatchUpConfig,
+                                self.sent.append, self.delivered.append, self.finish,
+                                lambda delay, callback: self.timers.append(callback))
+        self.catch_up.start()
+        return self.catch_up
+
+    def finish(self):
+        self.finished += 1
+
+    def requests(self):
+        requests = [parse_request(text) for text in self.sent]
+        self.sent.clear()
+        return requests
+
+    def expire(self):
+        timers, self.timers = self.timers, []
+        for callback in timers:
+            callback()
+
+    def receive(self, *envelopes):
+        for received in envelopes:
+            if self.catch_up.wants(received):
+                self.catch_up.receive(received)
+
+    def texts(self):
+        return [delivered.text for delivered in self.delivered]
+
+    def test_request_format(self):
+        text = format_request(3, [(2, 1), (2, 2), (4, 7)])
+        self.assertEqual((3, [(2, 1, 2), (4, 7, 7)]), parse_request(text))
+
+    def test_nothing_to_fetch(self):
+        catch_up = self.create({OWN: 4, 2: 3}, {2: 3})
+
+        self.assertEqual({}, catch_up.target)
+        self.assertEqual(1, self.finished)
+        self.assertEqual([], self.sent)
+
+    def test_chunks_are_requested_from_peers(self):
+        catch_up = self.create({OWN: 0, 2: 3, 3: 2})
+
+        self.assertEqual([(2, [(2, 1, 1), (3, 1, 1)]), (3, [(2, 2, 2), (3, 2, 2)])],
+                         self.requests())
+
+        # A peer that answered its chunk is asked for the next one
+        self.receive(envelope(2, 1), envelope(3, 1))
+        self.assertEqual([(2, [(2, 3, 3)])], self.requests())
+
+        self.receive(envelope(3, 2, {2: 2}), envelope(2, 3), envelope(2, 2))
+        self.assertEqual(["2-1", "3-1", "2-2", "2-3", "3-2"], self.texts())
+        self.assertEqual(1, self.finished)
+        self.assertTrue(catch_up.finished)
+        self.assertEqual(0, catch_up.skipped_count)
+
+    def test_start_and_messages_outside_of_the_catch_up(self):
+        catch_up = self.create({OWN: 0, 2: 3}, {2: 1})
+
+        self.assertFalse(catch_up.wants(envelope(2, 1)))
+        self.assertFalse(catch_up.wants(envelope(2, 4)))
+        self.assertFalse(catch_up.wants(envelope(OWN, 1)))
+        self.assertTrue(catch_up.wants(envelope(2, 2)))
+
+        heartbeat = Envelope(Vector("group", 2, {2: 2}), messages.HEARTBEAT, "")
+        self.assertFalse(catch_up.wants(heartbeat))
+
+    def test_arriving_chunk_extends_the_timeout(self):
+        self.create({OWN: 0, 2: 2})
+        self.assertEqual([(2, [(2, 1, 2)])], self.requests())
+
+        self.receive(envelope(2, 1))
+        self.expire()
+        self.assertEqual([], self.requests())
+
+        self.expire()
+        self.assertEqual([(2, [(2, 2, 2)])], self.requests())
+
+    def test_timed_out_chunk_is_requested_from_next_peer(self):
+        catch_up = self.create({OWN: 0, 2: 1, 3: 0, 4: 0})
+        self.assertEqual([(2, [(2, 1, 1)])], self.requests())
+
+        self.expire()
+        self.assertEqual([(3, [(2, 1, 1)])], self.requests())
+        self.assertEqual({2: 1}, catch_up.unanswered)
+
+        self.receive(envelope(2, 1))
+        self.assertEqual(["2-1"], self.texts())
+        self.assertEqual(1, self.finished)
+
+    def test_silent_peer_is_not_asked_again(self):
+        catch_up = self.create({OWN: 0, 2: 4, 3: 0})
+        self.assertEqual([2, 3], [peer for peer, _ in self.requests()])
+
+        # Both peers stay silent, so their chunks are given up after CATCHUP_RETRIES
+        for _ in range(CatchUpConfig.CATCHUP_RETRIES):
+            self.expire()
+        self.assertEqual({2: 2, 3: 2}, catch_up.unanswered)
+        # Peer 2 is not asked again, the only peer left still is
+        self.assertEqual([3], list(catch_up.peers))
+        self.assertEqual(1, self.finished)
+        self.assertEqual(4, catch_up.skipped_count)
+
+    def test_given_up_messages_release_held_back_ones(self):
+        catch_up = self.create({OWN: 0, 2: 3})
+        self.assertEqual([(2, [(2, 1, 2)])], self.requests())
+
+        # 2-2 waits for 2-1, which the peer never sends
+        self.receive(envelope(2, 2))
+        self.expire()
+        self.assertEqual([], self.requests())
+        self.assertEqual([], self.texts())
+
+        self.expire()
+        self.assertEqual([(2, [(2, 1, 1)])], self.requests())
+        self.expire()
+
+        # 2-1 is given up after CATCHUP_RETRIES requests, and the next chunk requested
+        self.assertEqual(["2-2"], self.texts())
+        self.assertEqual([(2, [(2, 3, 3)])], self.requests())
+        self.assertEqual(0, self.finished)
+
+        self.receive(envelope(2, 3))
+        self.assertEqual(["2-2", "2-3"], self.texts())
+        self.assertEqual(1, catch_up.skipped_count)
+        self.assertEqual(3, catch_up.index[2])
+        self.assertEqual(1, self.finished)
+
+    def test_evicted_process_is_not_fetched(self):
+        catch_up = self.create({OWN: 0, 2: 1, 3: 2})
+        self.assertEqual([(2, [(2, 1, 1), (3, 1, 1)]), (3, [(3, 2, 2)])],
+                         self.requests())
+
+        # 2-1 depends on the message of 3 which is never received
+        self.receive(envelope(2, 1, {3: 2}))
+        catch_up.evict(3)
+
+        self.assertNotIn(3, catch_up.target)
+        self.assertNotIn(3, catch_up.peers)
+        self.assertEqual(["2-1"], self.texts())
+        self.assertEqual(1, self.finished)
+
+    def test_request_of_evicted_peer_moves_to_another_peer(self):
+        catch_up = self.create({OWN: 0, 2: 1, 3: 2, 4: 0})
+        self.assertEqual([(2, [(2, 1, 1), (3, 1, 1)]), (3, [(3, 2, 2)])],
+                         self.requests())
+
+        catch_up.evict(2)
+        self.assertEqual([(4, [(3, 1, 1)])], self.requests())
+
+        self.receive(envelope(3, 1), envelope(3, 2))
+        self.assertEqual(["3-1", "3-2"], self.texts())
+        self.assertEqual(1, self.finished)
+
+    def test_evicting_the_last_peer_gives_up(self):
+        catch_up = self.create({OWN: 0, 2: 3})
+        catch_up.evict(2)
+
+        self.assertEqual(1, self.finished)
+        self.assertEqual([], self.texts())
+        self.expire()
+        self.assertEqual(1, self.finished)
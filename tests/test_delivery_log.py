@@ -0,0 +1,228 @@
+import os
+import tempfile
+
+import destinator.const.groups as groups
+from destinator.util.delivery_log import (DELIVERED, EPOCH_FILE, INDEX_SUFFIX, RECORD,
+                                          SEGMENT_SUFFIX, SENT, DeliveryLog)
+from destinator.util.vector import Vector
+from tests.base import TestBase
+
+SEGMENT_SIZE = 4096
+
+
+class TestDeliveryLog(TestBase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+        self.log = self.open()
+
+    def tearDown(self):
+        self.log.close()
+        self.directory.cleanup()
+
+    def open(self, retention=0):
+        return DeliveryLog(self.path, SEGMENT_SIZE, retention=retention)
+
+    def reopen(self, retention=0):
+        self.log.close()
+        self.log = self.open(retention)
+        return self.log
+
+    def append(self, process_id, counter, kind=DELIVERED, text=None):
+        vector = Vector(groups.Temperature.MCAST_ADDR, process_id,
+                        {1: 0, 2: 0, process_id: counter})
+        self.log.append(kind, vector, text or f"{process_id}-{counter}")
+
+    def texts(self):
+        return [record.envelope.text for record in self.log.records()]
+
+    def segment_files(self, suffix=SEGMENT_SUFFIX):
+        return sorted(name for name in os.listdir(self.path) if name.endswith(suffix))
+
+    def test_get_and_records(self):
+        self.append(1, 1, SENT)
+        self.append(2, 1)
+        self.append(2, 2)
+
+        record = self.log.get(2, 1)
+        self.assertEqual(DELIVERED, record.kind)
+        self.assertEqual("2-1", record.envelope.text)
+        self.assertEqual({1: 0, 2: 1}, record.envelope.vector.index)
+        self.assertEqual(SENT, self.log.get(1, 1).kind)
+        self.assertIsNone(self.log.get(2, 3))
+        self.assertIsNone(self.log.get(3, 1))
+
+        self.assertEqual(["1-1", "2-1", "2-2"], self.texts())
+        self.assertEqual({1: 1, 2: 2}, self.log.latest())
+        self.assertEqual(3, len(self.log))
+
+    def test_latest_record_of_a_message_wins(self):
+        self.append(1, 1, text="first")
+        self.append(1, 1, text="second")
+
+        self.assertEqual("second", self.log.get(1, 1).envelope.text)
+
+    def test_reopen_continues_after_last_record(self):
+        for counter in range(1, 4):
+            self.append(1, counter)
+
+        self.reopen()
+        self.append(1, 4)
+
+        self.assertEqual(["1-1", "1-2", "1-3", "1-4"], self.texts())
+        self.assertEqual("1-2", self.log.get(1, 2).envelope.text)
+
+    def test_reopen_after_torn_record(self):
+        for counter in range(1, 4):
+            self.append(1, counter)
+        end = self.log.segments[-1].end
+        self.log.close()
+
+        # The last record was only partly written before a crash
+        with open(os.path.join(self.path, self.segment_files()[0]), "r+b") as file:
+            file.seek(end - 5)
+            file.write(bytes(5))
+
+        log = self.reopen()
+        self.assertEqual(["1-1", "1-2"], self.texts())
+        self.assertIsNone(log.get(1, 3))
+
+        self.append(1, 3, text="again")
+        self.append(1, 4)
+        self.assertEqual(["1-1", "1-2", "again", "1-4"], self.texts())
+        self.reopen()
+        self.assertEqual(["1-1", "1-2", "again", "1-4"], self.texts())
+
+    def test_crc_rejects_corrupted_record(self):
+        self.append(1, 1)
+        self.append(1, 2)
+        offset = self.log.segments[-1].find(1, 2)
+        self.append(1, 3)
+        self.log.close()
+
+        with open(os.path.join(self.path, self.segment_files()[0]), "r+b") as file:
+            file.seek(offset + RECORD.size + 20)
+            byte = file.read(1)
+            file.seek(-1, os.SEEK_CUR)
+            file.write(bytes([byte[0] ^ 0xFF]))
+
+        # Nothing after a corrupted record can be trusted
+        log = self.reopen()
+        self.assertEqual(["1-1"], self.texts())
+        self.assertIsNone(log.get(1, 2))
+        self.assertIsNone(log.get(1, 3))
+        self.assertEqual({1: 1}, log.latest())
+
+    def test_record_damaged_while_open(self):
+        for counter in range(1, 201):
+            self.append(1, counter)
+        texts = self.texts()
+        segment = self.log.segments[0]
+        offset = segment.find(1, 2)
+        self.assertGreater(len(self.log.segments), 1)
+
+        with open(os.path.join(self.path, self.segment_files()[0]), "r+b") as file:
+            file.seek(offset + RECORD.size + 20)
+            byte = file.read(1)
+            file.seek(-1, os.SEEK_CUR)
+            file.write(bytes([byte[0] ^ 0xFF]))
+
+        self.assertIsNone(self.log.get(1, 2))
+        self.assertIsNone(self.log.message(1, 2))
+        self.assertEqual("1-1", self.log.get(1, 1).envelope.text)
+        self.assertIsNotNone(self.log.message(1, 200))
+
+        # The rest of the damaged segment is skipped, the later segments are read
+        damaged = self.texts()
+        self.assertEqual("1-1", damaged[0])
+        self.assertEqual(texts[len(texts) - len(damaged) + 1:], damaged[1:])
+        self.assertEqual("1-200", damaged[-1])
+
+    def test_rotation(self):
+        for counter in range(1, 201):
+            self.append(1, counter)
+
+        self.assertGreater(len(self.log.segments), 2)
+        indexes = self.segment_files(INDEX_SUFFIX)
+        self.assertEqual(len(self.log.segments) - 1, len(indexes))
+        for segment in self.log.segments[:-1]:
+            self.assertEqual(segment.end, os.path.getsize(
+                os.path.join(self.path, f"{segment.number:08d}{SEGMENT_SUFFIX}")))
+
+        self.assertEqual([f"1-{counter}" for counter in range(1, 201)], self.texts())
+        for counter in (1, 57, 200):
+            self.assertEqual(f"1-{counter}", self.log.get(1, counter).envelope.text)
+        self.assertEqual(200, len(self.log))
+
+        self.reopen()
+        self.assertEqual(200, len(self.log))
+        self.assertEqual("1-57", self.log.get(1, 57).envelope.text)
+
+    def test_retention(self):
+        self.reopen(retention=2)
+        for counter in range(1, 201):
+            self.append(1, counter)
+
+        self.assertEqual(2, len(self.segment_files()))
+        self.assertEqual(1, len(self.segment_files(INDEX_SUFFIX)))
+        self.assertIsNone(self.log.get(1, 1))
+        self.assertEqual("1-200", self.log.get(1, 200).envelope.text)
+
+        texts = self.texts()
+        self.assertEqual("1-200", texts[-1])
+        self.assertEqual(len(texts), len(self.log))
+        first = int(texts[0].split("-")[1])
+        self.assertEqual([f"1-{counter}" for counter in range(first, 201)], texts)
+        self.assertEqual({1: 200}, self.log.latest())
+
+    def test_missing_index_is_rebuilt(self):
+        for counter in range(1, 201):
+            self.append(1, counter)
+        indexes = self.segment_files(INDEX_SUFFIX)
+        self.log.close()
+
+        # A crash while a segment was sealed leaves it without its index
+        os.remove(os.path.join(self.path, indexes[0]))
+
+        log = self.reopen()
+        self.assertEqual(indexes, self.segment_files(INDEX_SUFFIX))
+        self.assertEqual(200, len(log))
+        self.assertEqual("1-1", log.get(1, 1).envelope.text)
+        self.assertEqual({1: 200}, log.latest())
+
+    def test_index_of_active_segment_is_ignored(self):
+        for counter in range(1, 201):
+            self.append(1, counter)
+        last = self.log.segments[-1].number
+        self.log.close()
+
+        stale = os.path.join(self.path, f"{last:08d}{INDEX_SUFFIX}")
+        with open(stale, "wb"):
+            pass
+
+        log = self.reopen()
+        self.assertFalse(os.path.exists(stale))
+        self.assertEqual("1-200", log.get(1, 200).envelope.text)
+
+    def test_epoch(self):
+        self.log.start_epoch(7)
+        self.append(1, 1)
+        self.log.start_epoch(7)
+        self.assertEqual(1, len(self.log))
+
+        log = self.reopen()
+        self.assertEqual(7, log.epoch)
+        self.assertEqual(1, len(log))
+
+        # Member IDs of another leader may belong to other Processes
+        log.start_epoch(9)
+        self.assertEqual(0, len(log))
+        self.assertEqual({}, log.latest())
+        self.assertIsNone(log.get(1, 1))
+        with open(os.path.join(self.path, EPOCH_FILE)) as file:
+            self.assertEqual("9", file.read())
+
+    def test_unknown_epoch_is_dropped(self):
+        self.append(1, 1)
+        self.log.start_epoch(3)
+        self.assertEqual(0, len(self.log))
@@ -0,0 +1,93 @@
+from destinator.util.delta import DeltaDecoder, DeltaEncoder
+from destinator.util.vector import Vector
+from tests.base import TestBase
+
+
+class TestDelta(TestBase):
+    def setUp(self):
+        self.encoder = DeltaEncoder(keyframe_interval=3)
+        self.decoder = DeltaDecoder(history_size=4)
+        self.index = {1: 0, 2: 5, 3: 7}
+
+    def send(self, changes=()):
+        """
+        Returns the encoded Vector of the next message of Process 1 and its full index.
+        """
+        self.index[1] += 1
+        self.index.update(changes)
+        full = dict(self.index)
+        return self.encoder.encode(Vector("group", 1, dict(self.index))), full
+
+    def resolve(self, vector):
+        return [(dict(vector.index), item)
+                for vector, item in self.decoder.resolve(vector, vector.index[1])]
+
+    def test_keyframes(self):
+        encoded = [self.send()[0] for _ in range(7)]
+
+        self.assertEqual([False, True, True, False, True, True, False],
+                         [vector.delta for vector in encoded])
+        self.assertEqual({1: 1, 2: 5, 3: 7}, encoded[0].index)
+        self.assertEqual({1: 4, 2: 5, 3: 7}, encoded[3].index)
+
+    def test_delta_holds_changed_entries(self):
+        self.send()
+        delta, _ = self.send({3: 9})
+
+        self.assertTrue(delta.delta)
+        self.assertEqual({1: 2, 3: 9}, delta.index)
+
+    def test_keyframe_is_a_copy(self):
+        keyframe, _ = self.send()
+        self.send({2: 6})
+
+        self.assertEqual({1: 1, 2: 5, 3: 7}, keyframe.index)
+
+    def test_decode_in_order(self):
+        for _ in range(5):
+            encoded, full = self.send({2: self.index[2] + 1})
+            self.assertEqual([(full, full[1])], self.resolve(encoded))
+
+    def test_delta_waits_for_its_predecessor(self):
+        first, first_full = self.send()
+        second, second_full = self.send({2: 6})
+        third, third_full = self.send({3: 8})
+
+        self.assertEqual([], self.resolve(third))
+        self.assertEqual([], self.resolve(second))
+        self.assertEqual([(first_full, 1), (second_full, 2), (third_full, 3)],
+                         self.resolve(first))
+        self.assertEqual({}, self.decoder.pending[1])
+
+    def test_keyframe_resynchronizes_after_loss(self):
+        self.resolve(self.send()[0])
+        lost, _ = self.send({2: 6})
+        delta, _ = self.send({3: 8})
+        keyframe, keyframe_full = self.send()
+        after, after_full = self.send({2: 7})
+
+        # The delta after the lost message cannot be reconstructed
+        self.assertTrue(lost.delta)
+        self.assertEqual([], self.resolve(delta))
+
+        self.assertFalse(keyframe.delta)
+        self.assertEqual([(keyframe_full, 4)], self.resolve(keyframe))
+        self.assertEqual([(after_full, 5)], self.resolve(after))
+
+    def test_unresolvable_deltas_are_dropped(self):
+        self.resolve(self.send()[0])
+        self.send()
+        self.resolve(self.send()[0])
+        for _ in range(6):
+            self.resolve(self.send()[0])
+
+        self.assertNotIn(3, self.decoder.pending[1])
+        self.assertTrue(all(counter > self.index[1] - 4
+                            for counter in self.decoder.history[1]))
+
+    def test_forget(self):
+        self.resolve(self.send()[0])
+        self.decoder.forget(1)
+
+        self.assertNotIn(1, self.decoder.history)
+        self.assertEqual([], self.resolve(self.send()[0]))
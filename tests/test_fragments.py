@@ -0,0 +1,76 @@
+import time
+
+from destinator.factories.datagram_factory import DatagramFactory
+from destinator.util.fragments import Fragmenter, Reassembler
+from tests.base import TestBase
+
+
+def fragment(msg_id, number, count, part=b"x"):
+    return DatagramFactory.HEADER_FRAGMENT.pack(
+        DatagramFactory.MAGIC_FRAGMENT, DatagramFactory.VERSION, msg_id, number,
+        count) + part
+
+
+class TestFragments(TestBase):
+    def setUp(self):
+        self.fragmenter = Fragmenter(64)
+        self.reassembler = Reassembler(max_messages=2, timeout=60)
+
+    def test_small_message_is_not_fragmented(self):
+        self.assertEqual([b"small"], self.fragmenter.split(b"small"))
+
+    def test_reassemble_in_any_order(self):
+        msg = bytes(range(256)) * 2
+        fragments = self.fragmenter.split(msg)
+        self.assertGreater(len(fragments), 2)
+        self.assertTrue(all(len(part) <= 64 for part in fragments))
+
+        for part in reversed(fragments[1:]):
+            self.assertIsNone(self.reassembler.add(part))
+        self.assertEqual(msg, self.reassembler.add(fragments[0]))
+        self.assertEqual(0, len(self.reassembler))
+
+    def test_duplicate_fragment(self):
+        self.assertIsNone(self.reassembler.add(fragment(1, 0, 2, b"a")))
+        self.assertIsNone(self.reassembler.add(fragment(1, 0, 2, b"a")))
+        self.assertEqual(b"ab", self.reassembler.add(fragment(1, 1, 2, b"b")))
+
+    def test_single_fragment(self):
+        self.assertEqual(b"a", self.reassembler.add(fragment(1, 0, 1, b"a")))
+
+    def test_index_out_of_range(self):
+        for number, count in ((2, 2), (5, 2), (0, 0)):
+            with self.assertRaises(ValueError):
+                self.reassembler.add(fragment(1, number, count))
+        self.assertEqual(0, len(self.reassembler))
+
+    def test_count_mismatch_drops_message(self):
+        self.reassembler.add(fragment(1, 0, 3))
+        with self.assertRaises(ValueError):
+            self.reassembler.add(fragment(1, 1, 2))
+        self.assertEqual(0, len(self.reassembler))
+
+        # The message starts over with the next fragment
+        self.assertIsNone(self.reassembler.add(fragment(1, 0, 2, b"a")))
+        self.assertEqual(b"ab", self.reassembler.add(fragment(1, 1, 2, b"b")))
+
+    def test_truncated_fragment(self):
+        with self.assertRaises(ValueError):
+            self.reassembler.add(fragment(1, 0, 2)[:5])
+
+    def test_oldest_message_is_evicted(self):
+        self.reassembler.add(fragment(1, 0, 2, b"a"))
+        self.reassembler.add(fragment(2, 0, 2, b"c"))
+        self.reassembler.add(fragment(3, 0, 2, b"e"))
+
+        self.assertEqual(2, len(self.reassembler))
+        self.assertIsNone(self.reassembler.add(fragment(1, 1, 2, b"b")))
+        self.assertEqual(b"ef", self.reassembler.add(fragment(3, 1, 2, b"f")))
+
+    def test_incomplete_message_times_out(self):
+        reassembler = Reassembler(max_messages=2, timeout=0.01)
+        reassembler.add(fragment(1, 0, 2, b"a"))
+        time.sleep(0.02)
+
+        self.assertIsNone(reassembler.add(fragment(1, 1, 2, b"b")))
+        self.assertEqual(1, len(reassembler))
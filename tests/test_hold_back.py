@@ -0,0 +1,127 @@
+from destinator.util.hold_back import HoldBackQueue
+from destinator.util.vector import Vector
+from tests.base import TestBase
+
+
+def vector(process_id, index):
+    return Vector("group", process_id, index)
+
+
+class TestHoldBackQueue(TestBase):
+    def setUp(self):
+        self.index = {1: 0, 2: 0, 3: 0}
+        self.queue = HoldBackQueue(self.index)
+
+    def put(self, vector, item):
+        return [delivered for _, delivered in self.queue.put(vector, item)]
+
+    def test_next_message_is_delivered(self):
+        self.assertEqual(["a"], self.put(vector(1, {1: 1, 2: 0, 3: 0}), "a"))
+        self.assertEqual(1, self.index[1])
+        self.assertEqual(0, len(self.queue))
+
+    def test_gap_of_sender_is_held_back(self):
+        self.assertEqual([], self.put(vector(1, {1: 2, 2: 0, 3: 0}), "b"))
+        self.assertEqual(1, len(self.queue))
+
+        self.assertEqual(["a", "b"], self.put(vector(1, {1: 1, 2: 0, 3: 0}), "a"))
+        self.assertEqual(2, self.index[1])
+        self.assertEqual(0, len(self.queue))
+
+    def test_causal_dependency_is_held_back(self):
+        # The message of 2 was sent after 2 delivered the message of 1
+        self.assertEqual([], self.put(vector(2, {1: 1, 2: 1, 3: 0}), "reply"))
+        self.assertTrue(self.queue.holds(vector(2, {1: 1, 2: 1, 3: 0})))
+
+        self.assertEqual(["question", "reply"],
+                         self.put(vector(1, {1: 1, 2: 0, 3: 0}), "question"))
+        self.assertEqual({1: 1, 2: 1, 3: 0}, self.index)
+
+    def test_chain_is_delivered_in_causal_order(self):
+        messages = [(vector(1, {1: 1, 2: 0, 3: 0}), "1"),
+                    (vector(2, {1: 1, 2: 1, 3: 0}), "2"),
+                    (vector(3, {1: 1, 2: 1, 3: 1}), "3"),
+                    (vector(1, {1: 2, 2: 1, 3: 1}), "4")]
+
+        delivered = []
+        for vector_, item in reversed(messages):
+            delivered.extend(self.put(vector_, item))
+
+        self.assertEqual(["1", "2", "3", "4"], delivered)
+        self.assertEqual({1: 2, 2: 1, 3: 1}, self.index)
+
+    def test_duplicates_are_dropped(self):
+        self.put(vector(1, {1: 1, 2: 0, 3: 0}), "a")
+        self.assertEqual([], self.put(vector(1, {1: 1, 2: 0, 3: 0}), "a"))
+
+        self.put(vector(1, {1: 3, 2: 0, 3: 0}), "c")
+        self.assertEqual([], self.put(vector(1, {1: 3, 2: 0, 3: 0}), "c"))
+        self.assertEqual(1, len(self.queue))
+
+    def test_evict_drops_messages_of_process(self):
+        self.put(vector(2, {1: 0, 2: 2, 3: 0}), "from 2")
+        self.assertEqual([], self.queue.evict(2))
+
+        self.assertEqual(0, len(self.queue))
+        self.assertNotIn(2, self.index)
+        self.assertEqual([], self.put(vector(2, {1: 0, 2: 1, 3: 0}), "late"))
+
+    def test_evict_wakes_up_waiting_messages(self):
+        # Waits for a message of 2 which never arrives
+        self.put(vector(1, {1: 1, 2: 1, 3: 0}), "a")
+
+        delivered = [item for _, item in self.queue.evict(2)]
+
+        self.assertEqual(["a"], delivered)
+        self.assertEqual({1: 1, 3: 0}, self.index)
+
+    def test_advance_wakes_up_messages_of_joined_process(self):
+        self.put(vector(1, {1: 1, 2: 0, 3: 0, 4: 1}), "a")
+        self.assertEqual(1, len(self.queue))
+
+        self.index[4] = 1
+        self.assertEqual(["a"], [item for _, item in self.queue.advance(4)])
+
+    def test_shed_keeps_next_message_of_sender(self):
+        self.put(vector(1, {1: 2, 2: 0, 3: 0}), "2")
+        self.put(vector(1, {1: 5, 2: 0, 3: 0}), "5")
+        self.put(vector(2, {1: 0, 2: 1, 3: 1}), "next of 2")
+
+        self.assertEqual((1, 5), self.queue.shed())
+        self.assertEqual((1, 2), self.queue.shed())
+        self.assertIsNone(self.queue.shed())
+        self.assertEqual(1, len(self.queue))
+
+    def test_shed_oldest(self):
+        self.put(vector(1, {1: 3, 2: 0, 3: 0}), "3")
+        self.put(vector(1, {1: 5, 2: 0, 3: 0}), "5")
+
+        self.assertEqual((1, 3), self.queue.shed(oldest=True))
+
+
+class TestHoldBackQueueScan(TestBase):
+    def test_scan_delivers_in_causal_order(self):
+        # Round n of every Process depends on round n - 1 of all others
+        messages = [vector(sender, {p: n if p == sender else n - 1
+                                    for p in range(1, 4)})
+                    for n in range(1, 6) for sender in range(1, 4)]
+
+        for scan_size in (0, 2):
+            index = {1: 0, 2: 0, 3: 0}
+            queue = HoldBackQueue(index, scan_size)
+            delivered = []
+            for vector_ in reversed(messages):
+                delivered.extend(vector_ for vector_, _ in queue.put(vector_, None))
+
+            self.assertEqual(15, len(delivered))
+            self.assertEqual(0, len(queue))
+            self.assertEqual({1: 5, 2: 5, 3: 5}, index)
+
+            replayed = {1: 0, 2: 0, 3: 0}
+            for vector_ in delivered:
+                sender = vector_.process_id
+                self.assertEqual(replayed[sender] + 1, vector_.index[sender])
+                for process_id, counter in vector_.index.items():
+                    if process_id != sender:
+                        self.assertGreaterEqual(replayed[process_id], counter)
+                replayed[sender] = vector_.index[sender]
@@ -0,0 +1,47 @@
+import queue
+import socket
+
+from destinator.const.timeouts import POLL_TIMEOUT
+from destinator.factories.datagram_factory import DatagramFactory
+from destinator.util.fragments import Reassembler
+from destinator.util.listener import Listener
+from destinator.util.metrics import Metrics
+from tests.base import TestBase
+
+
+class TestListener(TestBase):
+    def setUp(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        self.queue = queue.Queue()
+        self.listener = Listener(self.queue, Reassembler(16, 1.0), Metrics())
+        self.listener.sock = self.sock
+
+    def tearDown(self):
+        self.listener.cancelled = True
+        if self.listener.is_alive():
+            self.listener.join()
+        self.sock.close()
+        self.sender.close()
+
+    def test_socket_stays_blocking(self):
+        # The Connector sends on the socket the Listener receives on, so the
+        # Listener must not put a timeout on it
+        self.listener.start()
+        self.sender.sendto(DatagramFactory.pack_batch([b"a", b"b"]),
+                           self.sock.getsockname())
+
+        batch = self.queue.get(timeout=5)
+        self.assertEqual([b"a", b"b"], list(batch))
+        self.assertIsNone(self.sock.gettimeout())
+
+    def test_cancelled_listener_stops(self):
+        self.listener.start()
+        self.listener.cancelled = True
+        self.listener.join(POLL_TIMEOUT * 4)
+
+        self.assertFalse(self.listener.is_alive())
+        self.assertIsNone(self.sock.gettimeout())
+
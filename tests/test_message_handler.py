@@ -0,0 +1,272 @@
+import asyncio
+import tempfile
+import time
+
+import destinator.const.groups as groups
+import destinator.const.messages as messages
+import destinator.const.modes as modes
+import destinator.const.orderings as orderings
+import destinator.const.overloads as overloads
+from destinator.config import Config
+from destinator.device import Device
+from destinator.handlers.total_order import TotalOrder
+from destinator.handlers.vector_timestamp import VectorTimestamp
+from destinator.util.envelope import Envelope
+from destinator.util.network import Link, SimulatedNetwork
+from destinator.util.vector import Vector
+from tests.base import TestBase
+
+
+class RecordingDevice(Device):
+    def __init__(self, category, config, name=None):
+        super().__init__(category, config, name=name)
+        self.received = []
+
+    def handle_message(self, msg):
+        self.received.append(msg.text)
+
+
+class EchoDevice(RecordingDevice):
+    """
+    Answers every message it receives that is not an answer itself.
+    """
+
+    def handle_message(self, msg):
+        super().handle_message(msg)
+        if not msg.text.startswith("echo"):
+            self.send(f"echo-{msg.text}")
+
+
+class SlowDevice(RecordingDevice):
+    """
+    Takes a while to handle a message, so that its deliver Queue fills up.
+    """
+
+    def handle_message(self, msg):
+        time.sleep(0.002)
+        super().handle_message(msg)
+
+
+class DeviceTestBase(TestBase):
+    HANDLER = VectorTimestamp
+
+    def setUp(self):
+        self.devices = []
+
+    def tearDown(self):
+        for device in self.devices:
+            device.stop()
+        for device in self.devices:
+            device.join()
+
+    def create(self, *device_classes, **settings):
+        """
+        Starts Devices of the given classes on a SimulatedNetwork, the first one as
+        the leader, and waits until all of them joined the group.
+        """
+        network = SimulatedNetwork(Link(latency=0.001), seed=3)
+        config = type("TestConfig", (Config,), dict(TRANSPORT=network,
+                                                    DISCOVERY_TIMEOUT=0.3, **settings))
+
+        self.devices = [device_class(groups.Temperature, config, name=f"d{i}")
+                        for i, device_class in enumerate(device_classes)]
+        self.devices[0].communicator.message_handler.leader = True
+        for device in self.devices:
+            device.start()
+
+        deadline = time.monotonic() + 10
+        while not all(isinstance(device.communicator.message_handler.active_handler,
+                                 self.HANDLER) for device in self.devices):
+            self.assertLess(time.monotonic(), deadline, "Devices did not join")
+            time.sleep(0.05)
+        return self.devices
+
+    def inject(self, device, sender, msg_type, text, counter=None):
+        """
+        Hands a message of another Device to the MessageHandler of a Device, on the
+        Thread of the MessageHandler. The message counts as the next message of the
+        sender if no counter is given.
+        """
+        message_handler = device.communicator.message_handler
+        sender_id = sender.communicator.message_handler.vector.process_id
+        index = dict(message_handler.vector.index)
+        if counter is None:
+            counter = index[sender_id] + 1
+        index[sender_id] = counter
+
+        envelope = Envelope(Vector(groups.Temperature.MCAST_ADDR, sender_id, index),
+                            msg_type, text)
+        message_handler.call_soon(lambda: message_handler.receive(envelope))
+
+    def counters(self, device):
+        return device.stats(groups.Temperature)["counters"]
+
+    def wait_for(self, device, count):
+        deadline = time.monotonic() + 10
+        while len(device.received) < count:
+            self.assertLess(time.monotonic(), deadline, "Messages were not delivered")
+            time.sleep(0.05)
+
+    def wait_for_undecodable(self, device, count):
+        deadline = time.monotonic() + 10
+        while self.counters(device)["messages_undecodable"] < count:
+            self.assertLess(time.monotonic(), deadline, "Messages were not dropped")
+            time.sleep(0.05)
+
+
+class TestBoundedDelivery(DeviceTestBase):
+    MESSAGES = 50
+
+    def create(self, *device_classes):
+        return super().create(*device_classes, DELIVER_QUEUE_SIZE=1, SEND_QUEUE_SIZE=1,
+                              OVERLOAD=overloads.BLOCK)
+
+    def dropped(self, device):
+        counters = self.counters(device)
+        return counters["queue_deliver_dropped"] + counters["queue_send_dropped"]
+
+    def test_device_sends_while_handling_a_message(self):
+        sender, echo = self.create(EchoDevice, EchoDevice)
+        for n in range(self.MESSAGES):
+            sender.send(str(n))
+
+        # The Device Thread of echo sends while its MessageHandler waits for room in
+        # the full deliver Queue
+        self.wait_for(sender, self.MESSAGES)
+        self.assertEqual([str(n) for n in range(self.MESSAGES)], echo.received)
+        self.assertEqual([f"echo-{n}" for n in range(self.MESSAGES)], sender.received)
+        self.assertEqual(0, self.dropped(echo))
+
+    def test_slow_device_holds_up_the_message_handler(self):
+        sender, slow = self.create(Device, SlowDevice)
+        for n in range(self.MESSAGES):
+            sender.send(str(n))
+
+        # Nothing is dropped, the MessageHandler waits for the Device instead
+        self.wait_for(slow, self.MESSAGES)
+        self.assertEqual([str(n) for n in range(self.MESSAGES)], slow.received)
+        self.assertEqual(0, self.dropped(sender))
+        self.assertEqual(0, self.dropped(slow))
+
+
+class TestMalformedControlText(DeviceTestBase):
+    def test_malformed_control_messages_are_dropped(self):
+        leader, member = self.create(RecordingDevice, RecordingDevice,
+                                     RETRANSMIT_BUFFER=16)
+        self.inject(member, leader, messages.NACK, "garbage", counter=0)
+        self.inject(member, leader, messages.NACK, "1:2-", counter=0)
+        self.inject(member, leader, messages.CATCHUP, "x 1:1-2", counter=0)
+        self.inject(member, leader, messages.EVICT, "one two")
+        self.wait_for_undecodable(member, 4)
+
+        # The MessageHandler keeps handling messages, and the dropped EVICT message
+        # does not count as a message of the leader
+        leader.send("after")
+        self.wait_for(member, 1)
+        self.assertEqual(["after"], member.received)
+
+
+class TestMalformedOrder(DeviceTestBase):
+    HANDLER = TotalOrder
+
+    def test_malformed_order_is_dropped(self):
+        leader, member = self.create(RecordingDevice, RecordingDevice,
+                                     ORDERING=orderings.TOTAL)
+        handler = member.communicator.message_handler.active_handler
+        received = dict(handler.received)
+
+        for text in ("", "x 1:1-1", "0 1:1", "0 :-", "0 1:1-1000000000"):
+            self.inject(member, leader, messages.ORDER, text)
+        self.wait_for_undecodable(member, 5)
+        self.assertEqual(received, handler.received)
+        self.assertEqual({}, handler.orders)
+
+        leader.send("after")
+        member.send("reply")
+        self.wait_for(member, 1)
+        self.wait_for(leader, 1)
+        self.assertEqual(["after"], member.received)
+        self.assertEqual(["reply"], leader.received)
+
+
+class TestReplay(DeviceTestBase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+
+    def wait_for_counter(self, device, name, count):
+        deadline = time.monotonic() + 10
+        while self.counters(device)[name] < count:
+            self.assertLess(time.monotonic(), deadline, f"{name} stayed below {count}")
+            time.sleep(0.05)
+
+    def test_catch_up_request_is_cut_to_the_log(self):
+        leader, member = self.create(RecordingDevice, RecordingDevice,
+                                     LOG_PATH=self.path, CATCHUP_CHUNK=4)
+        for n in range(3):
+            leader.send(str(n))
+        self.wait_for(member, 3)
+
+        leader_id = leader.communicator.message_handler.vector.process_id
+        self.inject(leader, member, messages.CATCHUP,
+                    f"{leader_id} {leader_id}:0-1000000000", counter=0)
+        self.wait_for_counter(leader, "messages_replayed", 3)
+
+        # At most CATCHUP_CHUNK messages are sent per request
+        self.inject(leader, member, messages.CATCHUP,
+                    f"{leader_id} {leader_id}:1-2 {leader_id}:1-3", counter=0)
+        self.wait_for_counter(leader, "messages_replayed", 7)
+
+        self.inject(leader, member, messages.CATCHUP, f"{leader_id} x", counter=0)
+        self.wait_for_undecodable(leader, 1)
+        self.assertEqual(7, self.counters(leader)["messages_replayed"])
+
+
+def fail(envelope):
+    raise RuntimeError(f"Failed to handle {envelope.text}")
+
+
+class TestFailingHandler(DeviceTestBase):
+    def test_message_handler_survives_a_failing_handler(self):
+        leader, member = self.create(RecordingDevice, RecordingDevice)
+        member.communicator.message_handler.active_handler.handlers[
+            messages.HEARTBEAT] = fail
+
+        with self.assertLogs("destinator.message_handler", "ERROR"):
+            leader.communicator.message_handler.send(messages.HEARTBEAT,
+                                                     increment=False)
+            leader.send("after")
+            self.wait_for(member, 1)
+        self.assertEqual(["after"], member.received)
+
+    def test_async_message_handler_survives_a_failing_handler(self):
+        network = SimulatedNetwork(Link(latency=0.001), seed=3)
+        config = type("TestConfig", (Config,), dict(TRANSPORT=network,
+                                                    DISCOVERY_TIMEOUT=0.3,
+                                                    MODE=modes.ASYNC))
+
+        async def run():
+            leader, member = [Device(groups.Temperature, config, name=f"d{i}")
+                              for i in range(2)]
+            leader.communicator.message_handler.leader = True
+            for device in (leader, member):
+                await device.start_async()
+
+            try:
+                handler = member.communicator.message_handler
+                while not isinstance(handler.active_handler, VectorTimestamp):
+                    await asyncio.sleep(0.05)
+                handler.active_handler.handlers[messages.HEARTBEAT] = fail
+
+                leader.communicator.message_handler.send(messages.HEARTBEAT,
+                                                         increment=False)
+                await leader.send_async("after")
+                return (await member.receive()).text
+            finally:
+                leader.stop()
+                member.stop()
+
+        with self.assertLogs("destinator.aio.message_handler", "ERROR"):
+            self.assertEqual("after", asyncio.run(asyncio.wait_for(run(), 10)))
@@ -0,0 +1,69 @@
+from destinator.util.nack import RetransmitBuffer, format_ranges, parse_ranges
+from tests.base import TestBase
+
+
+def expand(ranges):
+    return {(process_id, counter) for process_id, first, last in ranges
+            for counter in range(first, last + 1)}
+
+
+class TestNackRanges(TestBase):
+    def test_consecutive_counters_form_a_range(self):
+        self.assertEqual("1:3-5", format_ranges([(1, 3), (1, 4), (1, 5)]))
+
+    def test_single_counter(self):
+        self.assertEqual("2:7-7", format_ranges([(2, 7)]))
+
+    def test_unordered_keys_of_several_processes(self):
+        text = format_ranges([(2, 1), (1, 9), (1, 7), (2, 2), (1, 8), (1, 11)])
+        self.assertEqual("1:7-9 1:11-11 2:1-2", text)
+
+    def test_empty(self):
+        self.assertEqual("", format_ranges([]))
+        self.assertEqual([], parse_ranges(""))
+
+    def test_parse(self):
+        self.assertEqual([(1, 7, 9), (3, 2, 2)], parse_ranges("1:7-9 3:2-2"))
+
+    def test_round_trip(self):
+        keys = {(1, 1), (1, 2), (1, 3), (1, 10), (4, 5), (4, 6), (1 << 31, 1),
+                (7, 65536), (7, 65537)}
+
+        ranges = parse_ranges(format_ranges(keys))
+
+        self.assertEqual(keys, expand(ranges))
+        self.assertEqual(5, len(ranges))
+
+    def test_round_trip_of_parsed_text(self):
+        text = "1:1-3 1:10-10 4:5-6"
+        self.assertEqual(text, format_ranges(expand(parse_ranges(text))))
+
+    def test_malformed(self):
+        for text in ("garbage", "1", "1:2", "1:2-", "a:1-2", "1:1-2 x"):
+            with self.assertRaises(ValueError):
+                parse_ranges(text)
+
+
+class TestRetransmitBuffer(TestBase):
+    def setUp(self):
+        self.buffer = RetransmitBuffer(count=3, size=1024, holdoff=60)
+        for counter in range(1, 6):
+            self.buffer.add(counter, str(counter).encode())
+
+    def test_oldest_messages_are_dropped(self):
+        self.assertEqual(3, len(self.buffer))
+        self.assertEqual([b"3", b"4", b"5"], self.buffer.retransmit(1, 5))
+
+    def test_range_is_cut_to_the_stored_messages(self):
+        self.assertEqual([b"4", b"5"], self.buffer.retransmit(4, 10 ** 12))
+        self.assertEqual([b"3"], self.buffer.retransmit(-10 ** 12, 3))
+        self.assertEqual([], self.buffer.retransmit(6, 10 ** 12))
+        self.assertEqual([], self.buffer.retransmit(4, 3))
+
+    def test_holdoff(self):
+        self.assertEqual([b"4"], self.buffer.retransmit(4, 4))
+        self.assertEqual([b"5"], self.buffer.retransmit(4, 5))
+
+    def test_empty(self):
+        self.buffer.clear()
+        self.assertEqual([], self.buffer.retransmit(1, 10 ** 12))
@@ -0,0 +1,165 @@
+import time
+
+import destinator.const.groups as groups
+import destinator.const.orderings as orderings
+from destinator.config import Config
+from destinator.device import Device
+from destinator.handlers.total_order import TotalOrder
+from destinator.util.network import Link, SimulatedNetwork
+from destinator.util.sequencer import Sequencer, format_order, parse_order
+from tests.base import TestBase
+
+
+class TestOrderFormat(TestBase):
+    def test_runs_of_a_process_form_ranges(self):
+        keys = [(1, 1), (1, 2), (2, 1), (1, 3), (1, 4), (2, 2)]
+        self.assertEqual("7 1:1-2 2:1-1 1:3-4 2:2-2", format_order(7, keys))
+
+    def test_round_trip_keeps_the_order(self):
+        keys = [(3, 5), (1, 1), (1, 2), (3, 6), (1 << 31, 1), (1, 3)]
+        self.assertEqual((12, keys), parse_order(format_order(12, keys)))
+
+    def test_empty_order(self):
+        self.assertEqual((0, []), parse_order(format_order(0, [])))
+
+    def test_malformed_order(self):
+        for text in ("", "x", "0 1:1", "0 a:1-2", "0 1:1-b", "0 1:2-1"):
+            with self.assertRaises(ValueError):
+                parse_order(text)
+
+    def test_order_larger_than_a_batch(self):
+        self.assertEqual((0, [(1, 1), (1, 2), (2, 1)]), parse_order("0 1:1-2 2:1-1", 3))
+        for text in ("0 1:1-4", "0 1:1-2 2:1-2", "0 1:1-1000000000"):
+            with self.assertRaises(ValueError):
+                parse_order(text, 3)
+
+
+class TestSequencer(TestBase):
+    def setUp(self):
+        self.index = {1: 0, 2: 0, 3: 4}
+        self.sequencer = Sequencer(3, self.index)
+
+    def receive(self, keys):
+        """
+        Sequences the received messages like the leader: a message is assigned a
+        sequence number once all earlier messages of its Process are sequenced, and
+        a batch is announced as soon as it is full.
+
+        Returns
+        -------
+        list
+            The texts of the ORDER messages
+        """
+        received = set()
+        orders = []
+        for key in keys:
+            received.add(key)
+            process_id, counter = key
+            while ((process_id, counter) in received
+                   and self.sequencer.expects(process_id, counter)):
+                self.sequencer.assign((process_id, counter))
+                received.discard((process_id, counter))
+                counter += 1
+                if len(self.sequencer) >= self.sequencer.batch_size:
+                    orders.append(self.sequencer.flush())
+
+        return orders
+
+    def test_lost_message_holds_back_later_messages_of_its_process(self):
+        self.assertTrue(self.sequencer.expects(1, 1))
+        self.assertFalse(self.sequencer.expects(1, 2))
+        self.assertTrue(self.sequencer.expects(3, 5))
+        self.assertFalse(self.sequencer.expects(3, 4))
+
+    def test_unknown_process_is_accepted(self):
+        self.assertTrue(self.sequencer.expects(9, 17))
+        self.sequencer.assign((9, 17))
+        self.assertTrue(self.sequencer.expects(9, 18))
+
+    def test_loss_across_batch_boundaries(self):
+        # (1, 2) is lost and retransmitted after (1, 3) and (1, 4) arrived
+        arrivals = [(1, 1), (2, 1), (1, 3), (3, 5), (1, 4), (2, 2), (2, 3), (1, 2),
+                    (3, 6)]
+        orders = self.receive(arrivals)
+
+        self.assertEqual(["0 1:1-1 2:1-1 3:5-5", "3 2:2-3 1:2-2",
+                          "6 1:3-4 3:6-6"], orders)
+        self.assertIsNone(self.sequencer.flush())
+
+        sequence = []
+        for text in orders:
+            first_seq, keys = parse_order(text)
+            self.assertEqual(len(sequence), first_seq)
+            sequence.extend(keys)
+
+        for process_id in (1, 2, 3):
+            counters = [counter for sender, counter in sequence if sender == process_id]
+            self.assertEqual(sorted(counters), counters)
+        self.assertEqual(9, len(sequence))
+        self.assertEqual(9, self.sequencer.next_seq)
+
+
+class OrderedDevice(Device):
+    def __init__(self, category, config, name=None):
+        super().__init__(category, config, name=name)
+        self.received = []
+
+    def handle_message(self, msg):
+        self.received.append(msg.text)
+
+
+class TestTotalOrder(TestBase):
+    DEVICES = 4
+    MESSAGES = 60
+
+    def setUp(self):
+        network = SimulatedNetwork(Link(latency=0.001, jitter=0.002), seed=11)
+        self.network = network
+
+        class TotalConfig(Config):
+            TRANSPORT = network
+            ORDERING = orderings.TOTAL
+            ORDER_BATCH = 4
+            RETRANSMIT_BUFFER = 256
+            DISCOVERY_TIMEOUT = 0.3
+
+        self.devices = [OrderedDevice(groups.Temperature, TotalConfig, name=f"d{i}")
+                        for i in range(self.DEVICES)]
+        self.devices[0].communicator.message_handler.leader = True
+        for device in self.devices:
+            device.start()
+
+        deadline = time.monotonic() + 10
+        while not all(isinstance(device.communicator.message_handler.active_handler,
+                                 TotalOrder) for device in self.devices):
+            self.assertLess(time.monotonic(), deadline, "Devices did not join")
+            time.sleep(0.05)
+
+    def tearDown(self):
+        for device in self.devices:
+            device.stop()
+        for device in self.devices:
+            device.join()
+
+    def test_every_device_delivers_the_same_order(self):
+        self.network.link.loss = 0.1
+        for n in range(self.MESSAGES):
+            for i, device in enumerate(self.devices):
+                device.send(f"{i}-{n}")
+            time.sleep(0.002)
+
+        # A Device does not deliver its own messages
+        expected = (self.DEVICES - 1) * self.MESSAGES
+        deadline = time.monotonic() + 20
+        while any(len(device.received) < expected for device in self.devices):
+            self.assertLess(time.monotonic(), deadline, "Messages were not delivered")
+            time.sleep(0.05)
+
+        self.assertGreater(self.network.stats()["lost"], 0)
+        for a, device in enumerate(self.devices):
+            self.assertEqual(expected, len(device.received))
+            for b, other in enumerate(self.devices[a + 1:], a + 1):
+                excluded = (f"{a}-", f"{b}-")
+                self.assertEqual(
+                    [text for text in device.received if not text.startswith(excluded)],
+                    [text for text in other.received if not text.startswith(excluded)])
@@ -0,0 +1,53 @@
+from destinator.util.vector import Vector
+from tests.base import TestBase
+
+
+def vector(index, process_id=1):
+    return Vector("group", process_id, dict(index))
+
+
+class TestVector(TestBase):
+    def test_increment(self):
+        own = vector({1: 4, 2: 7})
+        self.assertEqual(5, own.increment())
+        self.assertEqual({1: 5, 2: 7}, own.index)
+
+    def test_merge_takes_the_higher_entries(self):
+        own = vector({1: 4, 2: 7, 3: 1})
+        own.merge(vector({1: 2, 2: 9, 4: 3}, process_id=2))
+
+        self.assertEqual({1: 4, 2: 9, 3: 1, 4: 3}, own.index)
+        self.assertEqual(1, own.process_id)
+
+    def test_merge_ignores_lower_missing_entries(self):
+        own = vector({1: 4})
+        own.merge(vector({2: 0}))
+        self.assertEqual({1: 4}, own.index)
+
+    def test_compare(self):
+        cases = [
+            ({1: 1, 2: 2}, {1: 1, 2: 2}, 0),
+            ({1: 1, 2: 2}, {1: 1, 2: 3}, -1),
+            ({1: 2, 2: 2}, {1: 1, 2: 2}, 1),
+            ({1: 2, 2: 1}, {1: 1, 2: 2}, None),
+            # Missing entries count as 0
+            ({1: 1}, {1: 1, 2: 0}, 0),
+            ({1: 1}, {1: 1, 2: 1}, -1),
+            ({1: 1, 3: 1}, {1: 1, 2: 1}, None),
+        ]
+        for index, other, expected in cases:
+            self.assertEqual(expected, vector(index).compare(vector(other)))
+            reverse = None if expected is None else -expected
+            self.assertEqual(reverse, vector(other).compare(vector(index)))
+
+    def test_json_round_trip(self):
+        own = Vector("group", 3, {1: 4, 3: 9})
+        copy = Vector.from_json(own.to_json())
+        self.assertEqual(("group", 3, {1: 4, 3: 9}),
+                         (copy.group_id, copy.process_id, copy.index))
+
+    def test_invalid_json(self):
+        for data in ({}, {"group_id": "group", "process_id": "1", "index": {}},
+                     {"group_id": "group", "process_id": 1, "index": []}):
+            with self.assertRaises(ValueError):
+                Vector.from_json(data)